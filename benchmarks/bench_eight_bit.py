@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare default (base64 bodies, str messages) and 'eight_bit' (8bit bodies, bytes messages) sending
+of a mostly Cyrillic message over a fake SMTP server on loopback interface advertising 8BITMIME.
+Bytes written to the socket and CPU time of the sending thread are measured for rendering and sending.
+
+Usage: python benchmarks/bench_eight_bit.py [messages]
+"""
+import os
+import smtplib
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import oc_mailer.Mailer
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+_TEMPLATE = "<table>\n%s</table>" % "".join(
+        "<tr><td>%d</td><td>${text}</td><td>Уведомление о публикации релиза</td></tr>\n" % _i for _i in range(100))
+_TEXT = "Релиз опубликован"
+
+
+def measure(address, messages, **kwargs):
+    """
+    Send messages
+
+    :param tuple address: SMTP server host and port
+    :param int messages: number of messages to send
+    :param kwargs: Mailer arguments
+    :return tuple: bytes written to the socket and CPU seconds of the sending thread per message
+    """
+    _smtp = smtplib.SMTP(*address)
+    _smtp.ehlo_or_helo_if_needed()
+    _written = [0]
+    _send = _smtp.send
+
+    def _counting_send(data):
+        _written[0] += len(data)
+        return _send(data)
+
+    _smtp.send = _counting_send
+    _mailer = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", template_type="html", template=_TEMPLATE,
+            **kwargs)
+    _started = time.thread_time()
+
+    for _i in range(messages):
+        _mailer.send_email("to-%d@example.com" % _i, "Уведомление о релизе", text=_TEXT)
+
+    _elapsed = time.thread_time() - _started
+    _smtp.quit()
+    return _written[0] / messages, _elapsed / messages
+
+
+def main(args):
+    _messages = int(args[0]) if args else 1000
+    print("%-20s %12s %12s %10s %10s" % ("mode", "bytes/msg", "CPU us/msg", "bytes", "CPU"))
+
+    with FakeSMTPServer(keep_messages=False) as _server:
+        _base_bytes, _base_cpu = None, None
+
+        for _name, _kwargs in [
+                ("default", {}),
+                ("eight_bit", {"eight_bit": True}),
+                ("fast_render", {"fast_render": True}),
+                ("eight_bit+fast", {"eight_bit": True, "fast_render": True})]:
+            _bytes, _cpu = measure(_server.address, _messages, **_kwargs)
+
+            if _base_bytes is None:
+                _base_bytes, _base_cpu = _bytes, _cpu
+
+            print("%-20s %12.0f %12.1f %9.0f%% %9.0f%%" % (_name, _bytes, _cpu * 1e6,
+                    (_bytes / _base_bytes - 1) * 100, (_cpu / _base_cpu - 1) * 100))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
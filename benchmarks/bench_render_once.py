@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Compare 'split' sending with and without 'render_once' for growing number of recipients.
+Messages are rendered for HTML profile with signature image and passed to SMTP client doing nothing.
+
+Usage: python benchmarks/bench_render_once.py [recipients ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import oc_mailer.Mailer
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "oc_mailer", "tests", "resources", "config.json")
+
+
+class NullSMTP(object):
+    def sendmail(self, from_addr, to_addrs, msg):
+        return dict()
+
+
+def measure(recipients, render_once):
+    _mailer = oc_mailer.Mailer.Mailer(NullSMTP(), "from@html.example.com", config_path=_CONFIG_PATH,
+            render_once=render_once)
+    _to_addresses = ["to-%d@example.com" % _i for _i in range(recipients)]
+    _started = time.perf_counter()
+    _mailer.send_email(_to_addresses, "Release notification", split=True, text="Release is published")
+    return time.perf_counter() - _started
+
+
+def main(args):
+    _counts = [int(_a) for _a in args] or [1, 10, 100, 1000, 2000]
+    print("%10s %14s %14s %8s" % ("recipients", "default, s", "render_once, s", "speedup"))
+
+    for _count in _counts:
+        _default = measure(_count, False)
+        _render_once = measure(_count, True)
+        print("%10d %14.4f %14.4f %7.1fx" % (_count, _default, _render_once, _default / _render_once))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Measure rendering of personalized messages by 'send_many' in the calling thread and in pools of processes.
+Messages are sent to an in-memory transport which drops them, so only rendering is measured.
+
+Usage: python benchmarks/bench_render_processes.py [messages]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import oc_mailer.Mailer
+from oc_mailer.Transports import MemoryTransport
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "oc_mailer", "tests", "resources", "config.json")
+_TEMPLATE = "<table>\n%s</table>" % "".join(
+        "<tr><td>%d</td><td>${name}</td><td>${text}</td></tr>\n" % _i for _i in range(100))
+
+
+def measure(messages, render_processes):
+    """
+    Render and drop messages
+
+    :param int messages: number of messages
+    :param int render_processes: number of rendering processes, 0 to render in the calling thread
+    :return float: messages per second
+    """
+    _mailer = oc_mailer.Mailer.Mailer(MemoryTransport(keep=False), "from@html.example.com",
+            config_path=_CONFIG_PATH, template_type="html", template=_TEMPLATE)
+    _messages = (("to-%d@example.com" % _i, "Release notification", {"name": "User %d" % _i, "text": "released"})
+            for _i in range(messages))
+    _started = time.perf_counter()
+
+    for _result in _mailer.send_many(_messages, render_processes=render_processes):
+        if not _result.ok:
+            raise _result.error
+
+    return messages / (time.perf_counter() - _started)
+
+
+def main(args):
+    _messages = int(args[0]) if args else 20000
+    _cpus = os.cpu_count() or 1
+    print("%-12s %12s %10s" % ("processes", "msgs/s", "speedup"))
+    _base = measure(_messages, 0)
+    print("%-12s %12.0f %9.2fx" % ("in-thread", _base, 1))
+
+    for _processes in sorted(set([1, 2, 4, _cpus])):
+        if _processes <= _cpus:
+            _rate = measure(_messages, _processes)
+            print("%-12d %12.0f %9.2fx" % (_processes, _rate, _rate / _base))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of sending over a fake SMTP server on loopback interface.
+
+Scenarios are combinations of profile (plain text, html with signature image from 'oc_mailer/tests/resources'),
+split or joined sending, number of recipients and template size. Each scenario runs in a separate process
+for its peak RSS to be measured, the SMTP server runs in the parent process.
+Messages are sent by 'Mailer.send_email' itself, rendering and sending of each message are timed separately
+by an observer of the Mailer (see oc_mailer.Metrics), so regressions of any part of the sending path show up.
+
+Results are printed as a table and written as JSON with '--output'. With '--compare' messages per second
+of each scenario are compared with previous results and the exit status is 1 if any of them dropped
+by more than '--tolerance'.
+
+Usage: python benchmarks/bench_suite.py [--recipients 1 10 100 1000 10000] [--messages 200] [--output results.json]
+    [--compare baseline.json] [--tolerance 0.2]
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import smtplib
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import oc_mailer.Mailer
+from oc_mailer.Metrics import MailerObserver
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "oc_mailer", "tests", "resources", "config.json")
+_PROFILES = {"plain": "from@plain.example.com", "html": "from@html.example.com"}
+_LARGE_TEMPLATE = "<table>\n%s</table>" % "".join(
+        "<tr><td>%d</td><td>${text}</td><td>%s</td></tr>\n" % (_i, "x" * 40) for _i in range(1000))
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile
+
+    :param list values: sorted values
+    :param float fraction: percentile between 0 and 1
+    :return float: value
+    """
+    if not values:
+        return None
+
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+class PhaseTimer(MailerObserver):
+    """
+    Observer recording rendering and sending time of each message
+    """
+
+    def __init__(self):
+        self.render_times = list()
+        self.send_times = list()
+        self.bytes = 0
+        self.__substitute = 0.0
+
+    def on_phase(self, phase, seconds):
+        if phase == 'substitute':
+            # the template is substituted once for all messages of a call, it is added to the first one
+            self.__substitute += seconds
+        elif phase == 'serialize':
+            self.render_times.append(self.__substitute + seconds)
+            self.__substitute = 0.0
+        elif phase == 'send':
+            self.send_times.append(seconds)
+
+    def on_message(self, recipients, size):
+        self.bytes += size
+
+
+def run_scenario(address, profile, split, recipients, template, messages):
+    """
+    Send messages of a scenario
+
+    :param tuple address: SMTP server host and port
+    :param str profile: 'plain' or 'html'
+    :param bool split: send separate message to each recipient
+    :param int recipients: number of recipients of each 'send_email' call
+    :param str template: 'small' for template of configuration, 'large' for about 70 KB template
+    :param int messages: minimal number of messages to send, 'send_email' is repeated until it is reached
+    :return dict: metrics
+    """
+    _smtp = smtplib.SMTP(*address)
+    # session setup is not a part of sending
+    _smtp.ehlo_or_helo_if_needed()
+    _timer = PhaseTimer()
+    _mailer = oc_mailer.Mailer.Mailer(_smtp, _PROFILES[profile], config_path=_CONFIG_PATH,
+            template=_LARGE_TEMPLATE if template == "large" else None, observer=_timer)
+    _to_addresses = ["to-%d@example.com" % _i for _i in range(recipients)]
+    _started = time.perf_counter()
+
+    while len(_timer.send_times) < messages:
+        for _result in _mailer.send_email(_to_addresses, "Release notification", split=split,
+                text="Release is published"):
+            if not _result.ok:
+                raise RuntimeError("message is not sent: %r" % _result)
+
+    _elapsed = time.perf_counter() - _started
+    _smtp.quit()
+    _render_times = sorted(_timer.render_times)
+    _send_times = sorted(_timer.send_times)
+    _max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+            "messages": len(_send_times),
+            "bytes": _timer.bytes,
+            "seconds": _elapsed,
+            "messages_per_second": len(_send_times) / _elapsed,
+            "render_p50_ms": percentile(_render_times, 0.5) * 1000,
+            "render_p99_ms": percentile(_render_times, 0.99) * 1000,
+            "send_p50_ms": percentile(_send_times, 0.5) * 1000,
+            "send_p99_ms": percentile(_send_times, 0.99) * 1000,
+            # kilobytes on Linux, bytes on macOS
+            "peak_rss_mb": _max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)}
+
+
+def scenario_name(profile, split, recipients, template):
+    return "%s-%s-%d-%s" % (profile, "split" if split else "joined", recipients, template)
+
+
+def main(args):
+    _parser = argparse.ArgumentParser(description="oc_mailer benchmark suite")
+    _parser.add_argument("--recipients", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    _parser.add_argument("--messages", type=int, default=200, help="minimal number of messages per scenario")
+    _parser.add_argument("--profiles", nargs="+", default=sorted(_PROFILES.keys()), choices=sorted(_PROFILES.keys()))
+    _parser.add_argument("--templates", nargs="+", default=["small", "large"], choices=["small", "large"])
+    _parser.add_argument("--output", help="path to write JSON results to")
+    _parser.add_argument("--compare", help="path to JSON results to compare with")
+    _parser.add_argument("--tolerance", type=float, default=0.2,
+            help="allowed relative drop of messages per second when comparing")
+    _parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    _args = _parser.parse_args(args)
+
+    if _args.scenario:
+        # child process running a single scenario
+        print(json.dumps(run_scenario(**json.loads(_args.scenario))))
+        return 0
+
+    _results = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scenarios": dict()}
+
+    print("%-28s %9s %10s %10s %10s %10s %10s %8s" % ("scenario", "messages", "msgs/s", "render p50",
+            "render p99", "send p50", "send p99", "RSS, MB"))
+
+    with FakeSMTPServer(keep_messages=False) as _server:
+        for _profile, _split, _recipients, _template in itertools.product(
+                _args.profiles, [False, True], _args.recipients, _args.templates):
+            _scenario = {"address": list(_server.address), "profile": _profile, "split": _split,
+                    "recipients": _recipients, "template": _template, "messages": _args.messages}
+            _output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                    "--scenario", json.dumps(_scenario)])
+            _metrics = json.loads(_output.decode("utf-8"))
+            _name = scenario_name(_profile, _split, _recipients, _template)
+            _results["scenarios"][_name] = _metrics
+            print("%-28s %9d %10.1f %10.3f %10.3f %10.3f %10.3f %8.1f" % (_name, _metrics["messages"],
+                    _metrics["messages_per_second"], _metrics["render_p50_ms"], _metrics["render_p99_ms"],
+                    _metrics["send_p50_ms"], _metrics["send_p99_ms"], _metrics["peak_rss_mb"]))
+
+    if _args.output:
+        with open(_args.output, mode="wt") as _f:
+            json.dump(_results, _f, indent=2, sort_keys=True)
+
+    if not _args.compare:
+        return 0
+
+    with open(_args.compare, mode="rt") as _f:
+        _baseline = json.load(_f)["scenarios"]
+
+    _regressions = 0
+
+    for _name, _metrics in sorted(_results["scenarios"].items()):
+        if _name not in _baseline:
+            continue
+
+        _ratio = _metrics["messages_per_second"] / _baseline[_name]["messages_per_second"]
+
+        if _ratio < 1 - _args.tolerance:
+            _regressions += 1
+            print("REGRESSION %s: %.1f msgs/s, was %.1f (%.0f%%)" % (_name, _metrics["messages_per_second"],
+                    _baseline[_name]["messages_per_second"], (_ratio - 1) * 100))
+
+    return 1 if _regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Compare substitution of string.Template and CompiledTemplate for a small and a 200 KB HTML template,
+and rendering of MIME body part by MIMEText and by CompiledTemplate.render_part.
+
+Usage: python benchmarks/bench_template.py [iterations]
+"""
+import os
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email.mime.text import MIMEText
+from oc_mailer.CompiledTemplate import CompiledTemplate
+
+_SMALL = "<p>The message text is: ${text}</p>"
+_ROW = "<tr><td>${name}</td><td>Price: 10$$</td><td>${text}</td><td>%s</td></tr>\n"
+_LARGE = "<table>\n%s</table>" % "".join(_ROW % ("x" * 40) for _i in range(200 * 1024 // len(_ROW % ("x" * 40))))
+
+
+def measure(name, template, iterations):
+    _mapping = {"text": "Release is published", "name": "Release"}
+    _template = string.Template(template)
+    _compiled = CompiledTemplate(template)
+    assert _template.substitute(_mapping) == _compiled.substitute(_mapping)
+
+    _cases = [
+            ("substitute", lambda: _template.substitute(_mapping), lambda: _compiled.substitute(_mapping)),
+            ("MIME part", lambda: MIMEText(_template.substitute(_mapping), "html", "utf-8"),
+                    lambda: _compiled.render_part("html", _mapping))]
+
+    for _case, _default, _fast in _cases:
+        _default_time = timeit.timeit(_default, number=iterations) / iterations
+        _fast_time = timeit.timeit(_fast, number=iterations) / iterations
+        print("%-8s %9d %-10s %14.2f %14.2f %7.1fx" % (name, len(template), _case, _default_time * 1e6,
+                _fast_time * 1e6, _default_time / _fast_time))
+
+
+def main(args):
+    _iterations = int(args[0]) if args else 1000
+    print("%-8s %9s %-10s %14s %14s %8s" % ("template", "size", "case", "default, us", "compiled, us", "speedup"))
+    measure("small", _SMALL, _iterations * 10)
+    measure("large", _LARGE, _iterations)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
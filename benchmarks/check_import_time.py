@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Guard cold-start time: import oc_mailer.Mailer in fresh interpreters with 'python -X importtime'
+and fail if the best cumulative import time exceeds the budget or slow modules, which must be imported
+on first use only, are imported. Exits with status 1 on failure, so it may be used in CI; it is also run
+by oc_mailer/tests/test_startup.py.
+
+Usage: python benchmarks/check_import_time.py [--budget-ms 90] [--runs 5] [--module oc_mailer.Mailer]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules imported on first use only
+FORBIDDEN = [
+        "pkg_resources",
+        "asyncio",
+        "multiprocessing",
+        "email.mime.base",
+        "email.mime.image",
+        "email.mime.multipart",
+        "email.mime.text",
+        "mailbox"]
+
+
+def measure(module):
+    """
+    Import module in a fresh interpreter
+
+    :param str module: module to import
+    :return tuple: cumulative import time of the module in microseconds, dictionary of cumulative import time
+        of each imported module
+    """
+    _output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module],
+            cwd=_ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    _modules = dict()
+
+    for _line in _output.splitlines():
+        if not _line.startswith("import time:") or "|" not in _line or "cumulative" in _line:
+            continue
+
+        _self, _cumulative, _name = _line[len("import time:"):].split("|")
+        _modules[_name.strip()] = int(_cumulative)
+
+    return _modules[module], _modules
+
+
+def main(args):
+    _parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    _parser.add_argument("--budget-ms", type=float, default=90.0, help="maximal cumulative import time")
+    _parser.add_argument("--runs", type=int, default=5, help="number of imports, the best one is compared")
+    _parser.add_argument("--module", default="oc_mailer.Mailer", help="module to import")
+    _args = _parser.parse_args(args)
+
+    _results = [measure(_args.module) for _i in range(_args.runs)]
+    _best, _modules = min(_results, key=lambda _r: _r[0])
+    _slowest = sorted(((_t, _n) for _n, _t in _modules.items() if "." not in _n or _n.startswith("oc_mailer")),
+            reverse=True)[:10]
+    _forbidden = [_n for _n in FORBIDDEN if _n in _modules]
+
+    print("%s: %.1f ms (budget %.1f ms), best of %d" % (_args.module, _best / 1000.0, _args.budget_ms, _args.runs))
+
+    for _time, _name in _slowest:
+        print("  %-40s %8.1f ms" % (_name, _time / 1000.0))
+
+    if _forbidden:
+        print("modules which must be imported on first use: %s" % ", ".join(_forbidden))
+
+    return 1 if _forbidden or _best / 1000.0 > _args.budget_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,256 @@
+# coding=utf-8
+from concurrent.futures import ThreadPoolExecutor
+from .Attachments import StreamedMessage
+from .EightBit import EightBitSMTP, to_seven_bit
+from .Mailer import Mailer, MailerError, MailerArgumentError, SendResult
+from .MailerPool import SMTPPool
+import asyncio
+import functools
+import inspect
+import smtplib
+import time
+
+
+class ExecutorSMTP(object):
+    """
+    Asynchronous adapter for blocking SMTP clients.
+    Messages are sent by a thread pool over a pool of SMTP connections, one thread per connection,
+    so the event loop is never blocked by SMTP round-trips.
+    """
+
+    def __init__(self, smtp_factory, connections=4, **kwargs):
+        """
+        Initialize.
+
+        :param callable smtp_factory: function without arguments returning connected (and logged in if necessary)
+            SMTP client
+        :param int connections: maximal number of SMTP connections used at once
+        :param kwargs: other SMTPPool arguments: keepalive_interval, idle_timeout
+        """
+        self.__pool = SMTPPool(smtp_factory, size=connections, **kwargs)
+        # it streams attachments and sends 8bit messages as is where possible
+        self.__sender = EightBitSMTP(self.__pool)
+        self.__executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix="oc-mailer-smtp")
+
+    @property
+    def pool(self):
+        return self.__pool
+
+    async def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message, see smtplib.SMTP.sendmail
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.__executor,
+                functools.partial(self.__sender.sendmail, from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+    def close(self):
+        """
+        Wait for messages being sent and close all SMTP connections
+        """
+        self.__executor.shutdown(wait=True)
+        self.__pool.close()
+
+
+class AsyncMailer(object):
+    """
+    Asyncio version of Mailer. Configuration, templates and rendering are the same as for Mailer,
+    messages are sent by an asynchronous SMTP client: either ExecutorSMTP or any client with
+    'sendmail' coroutine (e.g. aiosmtplib.SMTP) returning refused recipients or a tuple of them
+    and the server response.
+    """
+
+    def __init__(self, smtp_client, from_address, **kwargs):
+        """
+        Initialize.
+
+        :param smtp_client: asynchronous SMTP client with 'sendmail' coroutine
+        :param str from_address: Single 'from' email address
+        :param kwargs: other Mailer arguments: template_type, template, signature_image, config_path, retry, etc.
+        """
+        if smtp_client and not inspect.iscoroutinefunction(getattr(smtp_client, "sendmail", None)):
+            raise MailerArgumentError('smtp_client.sendmail must be a coroutine function')
+
+        self.__smtp = smtp_client
+        self.__observer = kwargs.get("observer")
+        self.__retry = kwargs.get("retry")
+        self.__mailer = Mailer(smtp_client, from_address, **kwargs)
+
+    @classmethod
+    def from_factory(cls, smtp_factory, from_address, connections=4, **kwargs):
+        """
+        Create mailer sending through ExecutorSMTP
+
+        :param callable smtp_factory: function without arguments returning connected blocking SMTP client
+        :param str from_address: Single 'from' email address
+        :param int connections: maximal number of SMTP connections used at once
+        :param kwargs: other Mailer arguments
+        :return AsyncMailer: mailer
+        """
+        return cls(ExecutorSMTP(smtp_factory, connections=connections), from_address, **kwargs)
+
+    @property
+    def mailer(self):
+        return self.__mailer
+
+    async def send_email(self, to_addresses, subject, split=False, **kwargs):
+        """
+        Send email, see Mailer.send_email. Separate emails of 'split' sending are sent concurrently.
+
+        :return list: SendResult for each message sent
+        """
+        if not self.__smtp:
+            raise MailerError('Cannot send email. Mailer is already closed.')
+
+        __emails = list(self.__mailer.render_email(to_addresses, subject, split=split, **kwargs))
+        return list(await asyncio.gather(*[self.__deliver(_to, _email) for _to, _email in __emails]))
+
+    async def __deliver(self, to_addresses, email):
+        """
+        Send rendered email reporting to the observer if any
+
+        :param to_addresses: recipients as passed to 'sendmail'
+        :param str email: rendered message text
+        :return SendResult: result
+        """
+        if not isinstance(self.__smtp, ExecutorSMTP):
+            # 8BITMIME and streaming of attachments are supported with blocking SMTP clients only
+            email = to_seven_bit(email)
+
+            if isinstance(email, StreamedMessage):
+                email = email.as_string()
+
+        if self.__observer is None:
+            return await self.__sendmail(to_addresses, email)
+
+        __started = time.perf_counter()
+
+        try:
+            __result = await self.__sendmail(to_addresses, email)
+        except Exception as _e:
+            self.__observer.on_phase('send', time.perf_counter() - __started)
+            self.__observer.on_error(_e, to_addresses)
+            raise
+
+        self.__observer.on_phase('send', time.perf_counter() - __started)
+        self.__observer.on_result(__result)
+        return __result
+
+    async def __sendmail(self, to_addresses, email):
+        __sender = _AsyncSender(self.__smtp, self.__mailer.rate_limiter)
+
+        if self.__retry:
+            # the event loop keeps running between attempts, each of them waits for the limiter too
+            return await self.__retry.deliver_async(__sender, self.__mailer.from_address, to_addresses, email)
+
+        return SendResult(to_addresses, refused=await __sender.sendmail(self.__mailer.from_address, to_addresses,
+                email))
+
+    async def close(self):
+        """
+        Close SMTP client if it supports closing
+        """
+        __smtp = self.__smtp
+        self.__smtp = None
+        __close = getattr(__smtp, "close", None)
+
+        if __close is None:
+            return
+
+        if inspect.iscoroutinefunction(__close):
+            await __close()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, __close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class _AsyncSender(object):
+    """
+    Adapter of asynchronous SMTP client waiting for RateLimiter if any and returning refused recipients
+    the way smtplib does
+    """
+
+    def __init__(self, smtp_client, rate_limiter=None):
+        """
+        Initialize.
+
+        :param smtp_client: asynchronous SMTP client with 'sendmail' coroutine
+        :param RateLimiter rate_limiter: limiter, None if sending is not limited
+        """
+        self.__smtp = smtp_client
+        self.__rate_limiter = rate_limiter
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        """
+        Send message, errors of the client are raised as smtplib ones, see '_get_error'
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        if self.__rate_limiter is not None:
+            # the event loop keeps running while waiting for the limiter
+            await self.__rate_limiter.acquire_async(to_addrs)
+
+        try:
+            __refused = _get_refused(await self.__smtp.sendmail(from_addr, to_addrs, msg))
+        except Exception as _e:
+            __error = _get_error(_e)
+
+            if self.__rate_limiter is not None:
+                self.__rate_limiter.report(to_addrs, error=__error)
+
+            if __error is _e:
+                raise
+
+            raise __error from _e
+
+        if self.__rate_limiter is not None:
+            self.__rate_limiter.report(to_addrs, refused=__refused)
+
+        return __refused
+
+
+def _get_refused(result):
+    """
+    Get refused recipients from result of 'sendmail' of asynchronous SMTP client
+
+    :param result: refused recipients, or tuple of them and the server response as returned by aiosmtplib
+    :return dict: address to (code, response) mapping
+    """
+    if isinstance(result, tuple):
+        result = result[0]
+
+    return dict(result or dict())
+
+
+def _get_error(error):
+    """
+    Get smtplib exception for error of asynchronous SMTP client, so it is retried and reported the same way.
+    Exceptions of aiosmtplib are recognized by their attributes: 'recipients' list of refused recipients
+    with 'recipient', 'code' and 'message', 'code' and 'message' of a reply, lost connection.
+
+    :param Exception error: error raised by 'sendmail'
+    :return Exception: smtplib exception, the error itself if it is not recognized
+    """
+    if isinstance(error, smtplib.SMTPException):
+        return error
+
+    __recipients = getattr(error, "recipients", None)
+
+    if isinstance(__recipients, list):
+        return smtplib.SMTPRecipientsRefused({_r.recipient: (_r.code, _r.message) for _r in __recipients})
+
+    __code = getattr(error, "code", None)
+
+    if isinstance(__code, int):
+        return smtplib.SMTPResponseException(__code, getattr(error, "message", str(error)))
+
+    if isinstance(error, ConnectionError):
+        return smtplib.SMTPServerDisconnected(str(error))
+
+    return error
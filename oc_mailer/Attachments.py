@@ -0,0 +1,375 @@
+# coding=utf-8
+import base64
+import mimetypes
+import os
+import re
+import smtplib
+import uuid
+
+# base64 lines are 76 characters long, each one encodes 57 bytes
+_LINE_BYTES = 57
+_CHUNK_BYTES = _LINE_BYTES * 1024
+_CRLF = b"\r\n"
+
+
+class Attachment(object):
+    """
+    File attached to email. Its content is read in chunks and encoded while the message is sent,
+    the file is read again for every message it is attached to and never kept in memory.
+    """
+
+    def __init__(self, source, filename=None, content_type=None):
+        """
+        Initialize.
+
+        :param source: path to a file or binary file object; file object must be seekable
+            to be attached to more than one message or sent again
+        :param str filename: file name shown to recipients, base name of the path or 'name' of the file object
+            is used if omitted
+        :param str content_type: MIME type, guessed by the file name if omitted
+        """
+        if not isinstance(source, (str, bytes, os.PathLike)) and not hasattr(source, 'read'):
+            raise TypeError('attachment must be a path or a binary file object')
+
+        self.source = source
+        self.filename = filename or os.path.basename(str(
+                source if not hasattr(source, 'read') else getattr(source, 'name', '') or 'attachment'))
+        self.content_type = content_type or mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+        self.marker = 'oc-mailer-attachment-%s' % uuid.uuid4().hex
+        self.__position = None
+        self.__consumed = False
+
+        if hasattr(source, 'read') and getattr(source, 'seekable', lambda: False)():
+            self.__position = source.tell()
+
+    def create_part(self):
+        """
+        Create MIME part with headers of the attachment and the marker instead of the content
+
+        :return MIMEBase: part
+        """
+        # imported here since email.mime is imported on first rendering, see Mailer._mime
+        from email.mime.base import MIMEBase
+        __part = MIMEBase(*self.content_type.split('/', 1))
+        __part.add_header('Content-Disposition', 'attachment', filename=self.filename)
+        __part['Content-Transfer-Encoding'] = 'base64'
+        __part.set_payload(self.marker)
+        return __part
+
+    def size(self):
+        """
+        Get size of the file content
+
+        :return int: size in bytes, None if unknown
+        """
+        if not hasattr(self.source, 'read'):
+            return os.path.getsize(self.source)
+
+        if self.__position is None:
+            return None
+
+        if not _has_fileno(self.source):
+            return None
+
+        return os.fstat(self.source.fileno()).st_size - self.__position
+
+    def encoded_size(self):
+        """
+        Get size of the base64-encoded content with CRLF line breaks
+
+        :return int: size in bytes, 0 if unknown
+        """
+        __size = self.size()
+
+        if not __size:
+            return 0
+
+        __encoded = 4 * ((__size + 2) // 3)
+        return __encoded + 2 * ((__encoded + 75) // 76 - 1)
+
+    def encoded_chunks(self):
+        """
+        Read and encode the content
+
+        :return generator: chunks of base64 lines separated by CRLF, without line break at the end
+        """
+        __first = True
+
+        for __chunk in self.__read_chunks():
+            __encoded = base64.encodebytes(__chunk).rstrip(b"\n").replace(b"\n", _CRLF)
+            yield __encoded if __first else _CRLF + __encoded
+            __first = False
+
+    def __read_chunks(self):
+        if not hasattr(self.source, 'read'):
+            with open(self.source, mode='rb') as _f:
+                yield from _read_exactly(_f)
+
+            return
+
+        if self.__position is not None:
+            self.source.seek(self.__position)
+        elif self.__consumed:
+            raise ValueError('file object of attachment %s is not seekable and is already sent' % self.filename)
+
+        self.__consumed = True
+        yield from _read_exactly(self.source)
+
+
+class StreamedMessage(object):
+    """
+    Rendered message with attachments streamed while sending.
+    It consists of rendered text with a marker in place of the content of each attachment.
+    """
+
+    def __init__(self, text, attachments):
+        """
+        Initialize.
+
+        :param text: rendered message with markers of attachments, str or bytes with CRLF line breaks
+        :param list attachments: Attachment objects in order of their markers
+        """
+        if isinstance(text, str):
+            text = smtplib._fix_eols(text).encode('ascii')
+
+        self.__text = text
+        self.__texts = list()
+        self.__attachments = list(attachments)
+
+        for __attachment in self.__attachments:
+            __text, __found, text = text.partition(__attachment.marker.encode('ascii'))
+
+            if not __found:
+                raise ValueError('attachment %s is not found in the message' % __attachment.filename)
+
+            self.__texts.append(__text)
+
+        self.__texts.append(text)
+        # lines starting with a period are doubled in DATA, rendered text may have them
+        self.__quoted = [re.sub(br'(?m)^\.', b'..', _t) for _t in self.__texts]
+
+    def __len__(self):
+        return sum(len(_t) for _t in self.__texts) + sum(_a.encoded_size() for _a in self.__attachments)
+
+    @property
+    def text(self):
+        """
+        Message with markers of attachments
+
+        :return bytes: message text with CRLF line breaks
+        """
+        return self.__text
+
+    @property
+    def attachments(self):
+        return list(self.__attachments)
+
+    def chunks(self, quoted=False):
+        """
+        Get message content with CRLF line breaks, attachments are read while iterating
+
+        :param bool quoted: double periods at beginning of lines as it is needed for DATA command
+        :return generator: bytes chunks
+        """
+        __texts = self.__quoted if quoted else self.__texts
+
+        for __index, __attachment in enumerate(self.__attachments):
+            yield __texts[__index]
+            # base64 lines never start with a period
+            yield from __attachment.encoded_chunks()
+
+        yield __texts[-1]
+
+    def as_string(self):
+        """
+        Get the whole message, it is kept in memory
+
+        :return str: message text with CRLF line breaks
+        """
+        return b"".join(self.chunks()).decode('ascii')
+
+
+class StreamingSMTP(object):
+    """
+    Adapter of SMTP client or SMTPPool streaming StreamedMessage into DATA command.
+    Other messages are sent as usual. Clients other than smtplib.SMTP get the whole message as a string.
+    """
+
+    def __init__(self, smtp_client):
+        """
+        Initialize.
+
+        :param smtp_client: SMTP client or SMTPPool
+        """
+        self.__smtp = smtp_client
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message, see smtplib.SMTP.sendmail
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        return execute(self.__smtp,
+                lambda _smtp: stream_sendmail(_smtp, from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+
+def execute(smtp_client, action):
+    """
+    Run an action with SMTP client, with one of pooled connections if it is SMTPPool
+
+    :param smtp_client: SMTP client or SMTPPool
+    :param callable action: function receiving SMTP client
+    :return: the action result
+    """
+    # SMTPPool is recognized by its method, since MailerPool depends on Mailer which depends on this module
+    __execute = getattr(smtp_client, 'execute', None)
+    return action(smtp_client) if __execute is None else __execute(action)
+
+
+def stream_sendmail(smtp, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+    """
+    Send message streaming it into DATA command if it is StreamedMessage.
+    Behaves exactly as smtplib.SMTP.sendmail, which is used for other messages.
+
+    :param smtp: SMTP client
+    :return dict: refused recipients as returned by smtplib
+    """
+    if not isinstance(msg, StreamedMessage):
+        return _sendmail(smtp, from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+    if not isinstance(smtp, smtplib.SMTP):
+        # other clients (Outbox, Spool, etc.) keep the whole message anyway
+        return _sendmail(smtp, from_addr, to_addrs, msg.as_string(), mail_options, rcpt_options)
+
+    smtp.ehlo_or_helo_if_needed()
+    __mail_options = list()
+
+    if smtp.does_esmtp:
+        if smtp.has_extn('size'):
+            __mail_options.append("size=%d" % len(msg))
+
+        __mail_options.extend(mail_options)
+
+    __code, __response = smtp.mail(from_addr, __mail_options)
+
+    if __code != 250:
+        close_or_reset(smtp, __code)
+        raise smtplib.SMTPSenderRefused(__code, __response, from_addr)
+
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    __refused = dict()
+
+    for __address in to_addrs:
+        __code, __response = smtp.rcpt(__address, rcpt_options)
+
+        if __code not in (250, 251):
+            __refused[__address] = (__code, __response)
+
+        if __code == 421:
+            smtp.close()
+            raise smtplib.SMTPRecipientsRefused(__refused)
+
+    if len(__refused) == len(to_addrs):
+        # the server refused all our recipients
+        close_or_reset(smtp, 0)
+        raise smtplib.SMTPRecipientsRefused(__refused)
+
+    __code, __response = send_data(smtp, msg)
+
+    if __code != 250:
+        close_or_reset(smtp, __code)
+        raise smtplib.SMTPDataError(__code, __response)
+
+    return __refused
+
+
+def send_data(smtp, msg):
+    """
+    Send DATA command streaming the message
+
+    :param smtplib.SMTP smtp: SMTP client
+    :param StreamedMessage msg: message
+    :return tuple: code and response of the server
+    """
+    smtp.putcmd("data")
+    __code, __response = smtp.getreply()
+
+    if __code != 354:
+        raise smtplib.SMTPDataError(__code, __response)
+
+    __last = b""
+
+    try:
+        for __chunk in msg.chunks(quoted=True):
+            if __chunk:
+                smtp.send(__chunk)
+                __last = (__last + __chunk)[-2:]
+    except smtplib.SMTPServerDisconnected:
+        raise
+    except BaseException:
+        # the message cannot be aborted in the middle of DATA
+        smtp.close()
+        raise
+
+    smtp.send((b"" if __last == _CRLF else _CRLF) + b"." + _CRLF)
+    return smtp.getreply()
+
+
+def close_or_reset(smtp, code):
+    """
+    Prepare SMTP session for the next message after a failure
+
+    :param smtplib.SMTP smtp: SMTP client
+    :param int code: reply code of the failed command, the connection is closed for 421
+    """
+    if code == 421:
+        smtp.close()
+        return
+
+    try:
+        smtp.rset()
+    except smtplib.SMTPServerDisconnected:
+        pass
+
+
+def _sendmail(smtp, from_addr, to_addrs, msg, mail_options, rcpt_options):
+    if mail_options or rcpt_options:
+        return smtp.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+    # options are not passed if there are none, so any object with 'sendmail' may be used
+    return smtp.sendmail(from_addr, to_addrs, msg)
+
+
+def _has_fileno(source):
+    try:
+        source.fileno()
+        return True
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def _read_exactly(source):
+    """
+    Read file in chunks of the whole number of base64 lines
+
+    :param source: binary file object
+    :return generator: bytes chunks, only the last one may be shorter
+    """
+    while True:
+        __chunk = source.read(_CHUNK_BYTES)
+
+        if not __chunk:
+            return
+
+        # streams may return less than asked
+        while len(__chunk) < _CHUNK_BYTES:
+            __more = source.read(_CHUNK_BYTES - len(__chunk))
+
+            if not __more:
+                break
+
+            __chunk += __more
+
+        yield __chunk
@@ -0,0 +1,160 @@
+# coding=utf-8
+from collections import ChainMap
+from string import Template
+from .EightBit import UTF8_8BIT, UTF8_QP, fits_eight_bit
+import base64
+import copy
+import threading
+
+
+class CompiledTemplate(Template):
+    """
+    string.Template compiled once into a fixed sequence of literal chunks and placeholder slots.
+    Substitution joins the chunks with values of the slots without scanning the template again.
+    Placeholders, '$$' escapes and errors (KeyError for a missing key, ValueError for an invalid placeholder)
+    are the same as of string.Template.
+    """
+
+    def __init__(self, template):
+        """
+        Initialize.
+
+        :param str template: template string
+        """
+        super().__init__(template)
+        self.__segments, self.__slots = self.__compile(template)
+        self.__parts = dict()
+        self.__lock = threading.Lock()
+
+    @property
+    def slots(self):
+        """
+        Names of placeholders in order of their appearance
+        """
+        return [_name for _index, _name in self.__slots or list()]
+
+    def substitute(self, *args, **kwargs):
+        """
+        Substitute placeholders, see string.Template.substitute
+
+        :param args: optional dictionary with values of placeholders
+        :param kwargs: values of placeholders, they take precedence over the dictionary
+        :return str: rendered text
+        """
+        if self.__segments is None:
+            # let string.Template raise the error for the invalid placeholder at the right place
+            return super().substitute(*args, **kwargs)
+
+        if len(args) > 1:
+            raise TypeError('Too many positional arguments')
+
+        mapping = kwargs
+
+        if args:
+            mapping = ChainMap(kwargs, args[0]) if kwargs else args[0]
+
+        __segments = list(self.__segments)
+
+        for __index, __name in self.__slots:
+            __segments[__index] = str(mapping[__name])
+
+        return ''.join(__segments)
+
+    def render_part(self, subtype, *args, **kwargs):
+        """
+        Render template straight into MIME part, the same as MIMEText(text, subtype, 'utf-8').
+        Headers of the part are created once per subtype, the body is only base64-encoded.
+
+        :param str subtype: MIME subtype of text, e.g. "plain" or "html"
+        :param args: optional dictionary with values of placeholders
+        :param kwargs: values of placeholders, they take precedence over the dictionary
+        :return MIMEText: MIME part
+        """
+        __part = self.__copy_part(subtype, 'utf-8')
+        __part.set_payload(base64.encodebytes(self.substitute(*args, **kwargs).encode('utf-8')).decode('ascii'))
+        return __part
+
+    def render_8bit_part(self, subtype, *args, **kwargs):
+        """
+        Render template straight into MIME part with 8bit body, the same as MIMEText(text, subtype, UTF8_8BIT),
+        see oc_mailer.EightBit. Text with lines too long for 8bit body is encoded as quoted-printable.
+
+        :param str subtype: MIME subtype of text, e.g. "plain" or "html"
+        :param args: optional dictionary with values of placeholders
+        :param kwargs: values of placeholders, they take precedence over the dictionary
+        :return MIMEText: MIME part
+        """
+        __text = self.substitute(*args, **kwargs)
+        __data = __text.encode('utf-8')
+
+        if not fits_eight_bit(__data):
+            __part = self.__copy_part(subtype, UTF8_QP)
+            __part.set_payload(UTF8_QP.body_encode(__text))
+            return __part
+
+        __part = self.__copy_part(subtype, UTF8_8BIT)
+        __part.set_payload(__data.decode('ascii', 'surrogateescape'))
+
+        if len(__data) != len(__text):
+            # the prototype is rendered from ASCII text
+            __part.replace_header('Content-Transfer-Encoding', '8bit')
+
+        return __part
+
+    def __copy_part(self, subtype, charset):
+        """
+        Copy prototype part without payload
+
+        :param str subtype: MIME subtype of text
+        :param charset: charset of text, 'utf-8', UTF8_8BIT or UTF8_QP
+        :return MIMEText: MIME part
+        """
+        __key = (subtype, charset if isinstance(charset, str) else id(charset))
+
+        with self.__lock:
+            __part = self.__parts.get(__key)
+
+            if __part is None:
+                # imported here since email.mime is imported on first rendering, see Mailer._mime
+                from email.mime.text import MIMEText
+                __part = self.__parts[__key] = MIMEText('', subtype, charset)
+
+        __part = copy.copy(__part)
+        # headers are not shared with the prototype part, as it would be modified by adding headers otherwise
+        __part._headers = list(__part._headers)
+        return __part
+
+    def __compile(self, template):
+        """
+        Split template into segments
+
+        :param str template: template string
+        :return tuple: list of literal chunks with None in place of slots and list of slot indexes and names,
+            None and None if template has invalid placeholders
+        """
+        __segments = list()
+        __slots = list()
+        __literal = list()
+        __position = 0
+
+        for __match in self.pattern.finditer(template):
+            if __match.group('invalid') is not None:
+                return None, None
+
+            __literal.append(template[__position:__match.start()])
+            __position = __match.end()
+            __name = __match.group('named') or __match.group('braced')
+
+            if __name is None:
+                # escaped delimiter
+                __literal.append(self.delimiter)
+                continue
+
+            __segments.append(''.join(__literal))
+            __literal = list()
+            __slots.append((len(__segments), __name))
+            __segments.append(None)
+
+        __literal.append(template[__position:])
+        __segments.append(''.join(__literal))
+        return __segments, __slots
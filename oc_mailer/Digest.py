@@ -0,0 +1,239 @@
+# coding=utf-8
+from collections import OrderedDict
+from .Mailer import MailerError, MailerArgumentError
+import itertools
+import logging
+import threading
+import time
+
+
+class DigestMailer(object):
+    """
+    Coalescing layer over Mailer: notifications are buffered per recipient and subject key and sent
+    by a background thread as a single message when the window of the first buffered one closes
+    or 'max_items' of them are buffered. A single notification is sent as usual, more of them are sent
+    as a digest, see Mailer.send_digest. Recipients with the same buffered notifications get one message.
+    Notifications which are not sent yet are lost if the process exits.
+    """
+
+    def __init__(self, mailer, window=60.0, max_items=50, subject_key=None, on_error=None):
+        """
+        Initialize.
+
+        :param Mailer mailer: mailer to send messages with, it is used by the background thread only
+        :param float window: maximal number of seconds a notification is buffered for
+        :param int max_items: number of notifications sending the buffer at once
+        :param callable subject_key: function receiving subject and returning key of notifications
+            to coalesce, notifications with the same subject are coalesced if omitted
+        :param callable on_error: function receiving exception and (to_addresses, subject, items) tuple
+            of a message failed; errors are logged if omitted
+        """
+        if not mailer:
+            raise MailerArgumentError('mailer must not be empty')
+
+        if window <= 0 or max_items < 1:
+            raise MailerArgumentError('window and max_items must be positive')
+
+        self.__mailer = mailer
+        self.__window = window
+        self.__max_items = max_items
+        self.__subject_key = subject_key
+        self.__on_error = on_error
+        self.__condition = threading.Condition()
+        # (recipient, subject key) to [deadline, subject, list of (id, split, mapping)]
+        self.__buffers = OrderedDict()
+        # tuples of recipient, subject and items to send at once
+        self.__due = list()
+        self.__ids = itertools.count()
+        self.__sending = 0
+        self.__notifications = 0
+        self.__sent = 0
+        self.__failed = 0
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__work, name="oc-mailer-digest", daemon=True)
+        self.__thread.start()
+
+    def send_email(self, to_addresses, subject, split=False, **kwargs):
+        """
+        Buffer notification for each of recipients, see Mailer.send_email
+
+        :param list to_addresses: List of str 'To' email addresses or single 'To' email address
+        :param str subject: Plain text which is used as email subject
+        :param bool split: Recipients of the notification must not see each other
+        :param kwargs: Dictionary with mapping for substitution in email message text template
+        """
+        if not all([to_addresses, subject]):
+            raise MailerArgumentError('to_addresses and subject must not be empty')
+        if not isinstance(to_addresses, list):
+            to_addresses = [to_addresses]
+
+        __key = self.__subject_key(subject) if self.__subject_key else subject
+        __now = time.monotonic()
+
+        with self.__condition:
+            if self.__closed:
+                raise MailerError('Cannot send email. DigestMailer is already closed.')
+
+            # recipients of one call share the item, so they may get one message
+            __item = (next(self.__ids), split, kwargs)
+
+            for __address in to_addresses:
+                __buffer = self.__buffers.get((__address, __key))
+
+                if __buffer is None:
+                    __buffer = self.__buffers[(__address, __key)] = [__now + self.__window, subject, list()]
+
+                __buffer[2].append(__item)
+
+                if len(__buffer[2]) >= self.__max_items:
+                    # the next notification starts a new buffer
+                    del self.__buffers[(__address, __key)]
+                    self.__due.append((__address, __buffer[1], __buffer[2]))
+
+            self.__notifications += 1
+            self.__condition.notify_all()
+
+    @property
+    def pending(self):
+        """
+        Number of buffered notifications, counted for each recipient
+        """
+        with self.__condition:
+            return sum(len(_b[2]) for _b in self.__buffers.values()) + sum(len(_d[2]) for _d in self.__due)
+
+    def stats(self):
+        """
+        Get counters
+
+        :return dict: 'pending' - buffered notifications for each recipient, 'notifications' - total
+            'send_email' calls, 'sent' - messages sent, 'failed' - notifications or digests not sent
+        """
+        __pending = self.pending
+
+        with self.__condition:
+            return {
+                    "pending": __pending,
+                    "notifications": self.__notifications,
+                    "sent": self.__sent,
+                    "failed": self.__failed}
+
+    def flush(self, timeout=None):
+        """
+        Send all buffered notifications now and wait until they are sent
+
+        :param float timeout: seconds to wait, None to wait forever
+        :return bool: False if timeout expired
+        """
+        with self.__condition:
+            for __buffer in self.__buffers.values():
+                __buffer[0] = 0
+
+            self.__condition.notify_all()
+            return self.__condition.wait_for(lambda: not self.__buffers and not self.__due and not self.__sending,
+                    timeout=timeout)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting notifications, send those already buffered and stop the background thread
+
+        :param float timeout: seconds to wait for buffered notifications, None to wait forever
+        :return bool: False if some notifications were not sent before timeout
+        """
+        with self.__condition:
+            self.__closed = True
+
+        if not self.flush(timeout):
+            # the thread keeps sending in background
+            return False
+
+        self.__thread.join()
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                __due = self.__take_due()
+
+                while not __due:
+                    if self.__closed and not self.__buffers and not self.__due:
+                        return
+
+                    __timeout = max(0, min(_b[0] for _b in self.__buffers.values()) - time.monotonic()) \
+                            if self.__buffers else None
+                    self.__condition.wait(timeout=__timeout)
+                    __due = self.__take_due()
+
+                self.__sending = len(__due)
+
+            for __recipients, __subject, __items in self.__group(__due):
+                self.__send(__recipients, __subject, __items)
+
+            with self.__condition:
+                self.__sending = 0
+                self.__condition.notify_all()
+
+    def __take_due(self):
+        """
+        Remove full buffers and those which windows are closed, must be called with the condition held
+
+        :return list: tuples of recipient, subject and items
+        """
+        __now = time.monotonic()
+        __due, self.__due = self.__due, list()
+
+        for __key in [_k for _k, _b in self.__buffers.items() if _b[0] <= __now]:
+            __deadline, __subject, __items = self.__buffers.pop(__key)
+            __due.append((__key[0], __subject, __items))
+
+        return __due
+
+    def __group(self, due):
+        """
+        Group recipients with the same notifications
+
+        :param list due: tuples of recipient, subject and items
+        :return list: tuples of recipients, subject and items
+        """
+        __groups = OrderedDict()
+
+        for __recipient, __subject, __items in due:
+            __key = (__subject, tuple(_i[0] for _i in __items))
+            __groups.setdefault(__key, (list(), __subject, __items))[0].append(__recipient)
+
+        return list(__groups.values())
+
+    def __send(self, recipients, subject, items):
+        __split = any(_i[1] for _i in items)
+        __mappings = [_i[2] for _i in items]
+
+        try:
+            if len(__mappings) == 1:
+                __results = self.__mailer.send_email(recipients, subject, split=__split, **__mappings[0])
+            else:
+                __results = self.__mailer.send_digest(recipients, subject, __mappings, split=__split)
+        except Exception as _e:
+            self.__report(_e, (recipients, subject, __mappings))
+
+            with self.__condition:
+                self.__failed += 1
+
+            return
+
+        with self.__condition:
+            self.__sent += len(__results)
+
+    def __report(self, error, digest):
+        if self.__on_error:
+            try:
+                self.__on_error(error, digest)
+                return
+            except Exception as _e:
+                error = _e
+
+        logging.getLogger(__name__).error("Digest '%s' to %s is not sent: %s", digest[1], digest[0], error)
@@ -0,0 +1,136 @@
+# coding=utf-8
+from email import encoders
+from email.charset import Charset, QP
+import email
+import email.policy
+import re
+import smtplib
+
+from .Attachments import StreamedMessage, execute, stream_sendmail
+from .Pipelining import pipelined_sendmail
+
+# UTF-8 text written as is, 'Content-Transfer-Encoding: 8bit' (or '7bit' for ASCII text)
+UTF8_8BIT = Charset('utf-8')
+UTF8_8BIT.body_encoding = None
+
+# UTF-8 text with lines too long to be sent as is, see fits_eight_bit
+UTF8_QP = Charset('utf-8')
+UTF8_QP.body_encoding = QP
+
+# maximal length of a line in octets without CRLF, see RFC 5321 and RFC 6152
+MAX_LINE_LENGTH = 998
+
+# messages are built with compat32 classes, serialized as bytes with SMTP line breaks
+SMTP_POLICY = email.policy.compat32.clone(linesep='\r\n')
+
+_NON_ASCII = re.compile(b'[\x80-\xff]')
+_LONG_LINE = re.compile(b'[^\r\n]{%d}' % (MAX_LINE_LENGTH + 1))
+
+
+class EightBitSMTP(object):
+    """
+    Adapter of SMTP client or SMTPPool sending messages with 8bit bodies as they are with 'BODY=8BITMIME'
+    if server supports ESMTP 8BITMIME, see RFC 6152, or converting their 8bit parts to base64 otherwise.
+    Envelope addresses which are not ASCII are sent with 'SMTPUTF8' if server supports it, see RFC 6531.
+    Clients other than smtplib.SMTP get converted messages.
+    """
+
+    def __init__(self, smtp_client, pipelining=False):
+        """
+        Initialize.
+
+        :param smtp_client: SMTP client or SMTPPool
+        :param bool pipelining: pipeline MAIL and RCPT commands, see oc_mailer.Pipelining
+        """
+        self.__smtp = smtp_client
+        self.__send = pipelined_sendmail if pipelining else stream_sendmail
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message, see smtplib.SMTP.sendmail
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        return execute(self.__smtp,
+                lambda _smtp: self.__sendmail(_smtp, from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+    def __sendmail(self, smtp, from_addr, to_addrs, msg, mail_options, rcpt_options):
+        if not isinstance(smtp, smtplib.SMTP):
+            return self.__send(smtp, from_addr, to_addrs, to_seven_bit(msg), mail_options, rcpt_options)
+
+        smtp.ehlo_or_helo_if_needed()
+        __mail_options = list(mail_options)
+
+        if is_eight_bit(msg):
+            if smtp.has_extn('8bitmime'):
+                __mail_options.append('BODY=8BITMIME')
+            else:
+                msg = to_seven_bit(msg)
+
+        __addresses = [from_addr] + ([to_addrs] if isinstance(to_addrs, str) else list(to_addrs))
+
+        if smtp.has_extn('smtputf8') and not all(_is_ascii(_a) for _a in __addresses):
+            __mail_options.append('SMTPUTF8')
+
+        return self.__send(smtp, from_addr, to_addrs, msg, __mail_options, rcpt_options)
+
+
+def is_eight_bit(msg):
+    """
+    Check if message has bytes which are not ASCII
+
+    :param msg: rendered message: str, bytes or StreamedMessage
+    :return bool: True if 8BITMIME is needed to send the message as is
+    """
+    if isinstance(msg, StreamedMessage):
+        # attachments are base64-encoded
+        msg = msg.text
+
+    return isinstance(msg, bytes) and _NON_ASCII.search(msg) is not None
+
+
+def fits_eight_bit(data):
+    """
+    Check if text may be sent as 8bit body: none of its lines is longer than MAX_LINE_LENGTH octets.
+    Other text is encoded as quoted-printable (UTF8_QP) instead.
+
+    :param bytes data: encoded text
+    :return bool: True if lines are short enough
+    """
+    return len(data) <= MAX_LINE_LENGTH or _LONG_LINE.search(data) is None
+
+
+def to_seven_bit(msg):
+    """
+    Convert 8bit parts of message to base64
+
+    :param msg: rendered message: str, bytes or StreamedMessage
+    :return: message of the same type, the message itself if there is nothing to convert
+    """
+    if not is_eight_bit(msg):
+        return msg
+
+    if isinstance(msg, StreamedMessage):
+        # parts of attachments are kept with their markers
+        return StreamedMessage(to_seven_bit(msg.text), msg.attachments)
+
+    __message = email.message_from_bytes(msg)
+
+    for __part in __message.walk():
+        if __part.is_multipart() or __part.get('Content-Transfer-Encoding', '').lower() != '8bit':
+            continue
+
+        __payload = __part.get_payload(decode=True)
+        del __part['Content-Transfer-Encoding']
+        __part.set_payload(__payload)
+        encoders.encode_base64(__part)
+
+    return __message.as_bytes(policy=SMTP_POLICY)
+
+
+def _is_ascii(address):
+    try:
+        address.encode('ascii')
+        return True
+    except UnicodeEncodeError:
+        return False
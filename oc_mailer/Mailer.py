@@ -1,12 +1,667 @@
 # coding=utf-8
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from email.header import Header
-from email.mime.image import MIMEImage
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from string import Template
+from email.message import Message
+from .Attachments import Attachment, StreamedMessage, StreamingSMTP
+from .CompiledTemplate import CompiledTemplate
+from .EightBit import EightBitSMTP, SMTP_POLICY, UTF8_8BIT, UTF8_QP, fits_eight_bit
+from .Pipelining import PipeliningSMTP
+from .RateLimit import RateLimiter, RateLimitedSMTP
+import hashlib
+import importlib
+import io
 import json
-import pkg_resources
+import logging
 import os
+import smtplib
+import sys
+import threading
+import time
+import uuid
+import weakref
+
+# the same as resources/config.json, used without reading it if configuration is not given
+DEFAULT_CONFIG = {
+    "": {
+        "template_type": "plain",
+        "template": "${text}"
+    }
+}
+
+# classes of email.mime imported on first rendering, see _mime
+_MIME_CLASSES = {
+    "MIMEImage": "email.mime.image",
+    "MIMEMultipart": "email.mime.multipart",
+    "MIMEText": "email.mime.text"}
+
+_packaged_config_path = None
+
+
+class PrerenderedPart(Message):
+    """
+    MIME part serialized once and written as is into every message it is attached to.
+    The generator asks a message for writing its headers itself if it is able to, so the whole rendered part
+    is written from there while there is no payload left to serialize.
+    """
+
+    def __init__(self, part):
+        """
+        Initialize.
+
+        :param Message part: MIME part to render, it must not be modified afterwards
+        """
+        super().__init__()
+        self.part = part
+        self.__rendered = dict()
+
+    def render(self, generator):
+        """
+        Get serialized part, it is rendered once for each generator type and line separator
+
+        :param Generator generator: generator the part is serialized with
+        :return str: serialized part
+        """
+        __key = (type(generator), generator._NL)
+        __rendered = self.__rendered.get(__key)
+
+        if __rendered is None:
+            __buffer = generator._new_buffer()
+            generator.clone(__buffer).flatten(self.part, unixfrom=False, linesep=generator._NL)
+            __rendered = __buffer.getvalue()
+
+            if isinstance(__rendered, bytes):
+                # BytesGenerator writes text the same way
+                __rendered = __rendered.decode('ascii', 'surrogateescape')
+
+            self.__rendered[__key] = __rendered
+
+        return __rendered
+
+    def _write_headers(self, generator):
+        generator.write(self.render(generator))
+
+
+class SignatureImageRegistry(object):
+    """
+    Process-wide registry of encoded signature image parts deduplicated by content hash.
+    A part is kept while any Mailer or profile refers to it.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__parts = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.__parts)
+
+    def get(self, signature_image):
+        """
+        Get encoded and pre-rendered signature image part
+
+        :param bytes signature_image: raw signature image data
+        :return PrerenderedPart: signature image part
+        """
+        __digest = hashlib.sha256(signature_image).digest()
+
+        with self.__lock:
+            __part = self.__parts.get(__digest)
+
+            if __part is None:
+                __part = _mime("MIMEImage")(signature_image)
+                __part.add_header('Content-ID', '<signature_image>')
+
+                if isinstance(__part, Message):
+                    __part = PrerenderedPart(__part)
+
+                self.__parts[__digest] = __part
+
+            return __part
+
+    def clear(self):
+        """
+        Forget all registered parts, those already in use are not affected
+        """
+        with self.__lock:
+            self.__parts.clear()
+
+
+class DomainProfile(object):
+    """
+    Compiled mailing profile of a single mail domain section of the configuration.
+    Profiles are shared between Mailer instances and must be treated as read-only.
+    """
+
+    def __init__(self, template_type=None, template_string=None, signature_image_data=None, resource_paths=(),
+            digest_template_string=None, rate_limit=None):
+        """
+        Initialize.
+
+        :param str template_type: type of template from configuration ("plain", "html") or None
+        :param str template_string: template string from configuration or template file, None if not given
+        :param bytes signature_image_data: raw signature image data, None if not given
+        :param tuple resource_paths: absolute paths of template and signature files referenced from configuration
+        :param str digest_template_string: digest template string from configuration or digest template file,
+            None if not given
+        :param dict rate_limit: 'rate_limit' section of configuration, see oc_mailer.RateLimit.RateLimiter
+        """
+        self.template_type = template_type
+        self.template_string = template_string
+        self.signature_image_data = signature_image_data
+        self.digest_template_string = digest_template_string
+        self.rate_limit = rate_limit
+        self.resource_paths = tuple(resource_paths)
+        self.__lock = threading.Lock()
+        self.__signature_image = None
+        self.__templates = dict()
+        self.__rate_limiter = None
+
+    def __getstate__(self):
+        # compiled templates, parts and locks are created again by the receiving process, see RenderPool
+        return dict(
+                template_type=self.template_type,
+                template_string=self.template_string,
+                signature_image_data=self.signature_image_data,
+                resource_paths=self.resource_paths,
+                digest_template_string=self.digest_template_string,
+                rate_limit=self.rate_limit)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get_signature_image(self):
+        """
+        Get encoded signature image part, it is created once on the first call
+
+        :return PrerenderedPart: signature image part, None if profile has no signature image
+        """
+        if not self.signature_image_data:
+            return None
+
+        with self.__lock:
+            if self.__signature_image is None:
+                self.__signature_image = signature_images.get(self.signature_image_data)
+
+            return self.__signature_image
+
+    def get_template(self, signed=False):
+        """
+        Get compiled template of the profile
+
+        :param bool signed: append signature image reference to the template
+        :return CompiledTemplate: compiled template
+        """
+        with self.__lock:
+            __template = self.__templates.get(signed)
+
+            if __template is None:
+                __template = self.__templates[signed] = CompiledTemplate(
+                        _compose_template(self.template_string or "${text}", signed))
+
+            return __template
+
+    def get_digest_template(self, signed=False):
+        """
+        Get compiled digest template of the profile, see Mailer.send_digest
+
+        :param bool signed: append signature image reference to the template
+        :return CompiledTemplate: compiled template
+        """
+        with self.__lock:
+            __template = self.__templates.get(('digest', signed))
+
+            if __template is None:
+                __template = self.__templates[('digest', signed)] = CompiledTemplate(
+                        _compose_template(self.digest_template_string or "${items}", signed))
+
+            return __template
+
+    def get_rate_limiter(self):
+        """
+        Get rate limiter of the profile, it is created once on the first call and shared by all Mailers of the profile
+
+        :return RateLimiter: limiter, None if profile has no rate limit
+        """
+        if not self.rate_limit:
+            return None
+
+        with self.__lock:
+            if self.__rate_limiter is None:
+                self.__rate_limiter = RateLimiter.from_config(self.rate_limit)
+
+            return self.__rate_limiter
+
+
+class ProfileCache(object):
+    """
+    Process-wide cache of compiled domain profiles shared across Mailer instances.
+    Entries are keyed by absolute configuration path together with its modification time and size,
+    so a modified configuration is parsed again while unchanged one is never re-read.
+    Resources referenced from configuration (template and signature files) are read once on parsing,
+    use 'invalidate' to pick up their changes.
+    """
+
+    def __init__(self, max_size=16):
+        """
+        Initialize.
+
+        :param int max_size: maximal number of configurations kept, least recently used are evicted
+        """
+        if max_size < 1:
+            raise MailerArgumentError('max_size must be positive')
+
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.__configs = OrderedDict()
+        self.__default_profiles = None
+
+    def __len__(self):
+        return len(self.__configs)
+
+    def get_profile(self, config_path, mail_domain):
+        """
+        Get compiled profile for a mail domain, configuration is parsed if not cached yet or modified
+
+        :param str config_path: path to a configuration
+        :param str mail_domain: mail domain of a sender, default profile is returned if not configured
+        :return DomainProfile: compiled profile
+        """
+        return select_profile(self.get_profiles(config_path), mail_domain)
+
+    def get_profiles(self, config_path):
+        """
+        Get compiled profiles for all mail domains of a configuration
+
+        :param str config_path: path to a configuration
+        :return dict: mail domain to DomainProfile mapping, must not be modified
+        """
+        config_path = os.path.abspath(config_path)
+        __stat = os.stat(config_path)
+        __key = (config_path, __stat.st_mtime_ns, __stat.st_size)
+
+        with self.__lock:
+            __profiles = self.__configs.get(__key)
+
+            if __profiles is not None:
+                self.__configs.move_to_end(__key)
+                return __profiles
+
+        __profiles = self.__load(config_path)
+
+        with self.__lock:
+            for __stale_key in [_k for _k in self.__configs.keys() if _k[0] == config_path]:
+                del(self.__configs[__stale_key])
+
+            self.__configs[__key] = __profiles
+
+            while len(self.__configs) > self.__max_size:
+                self.__configs.popitem(last=False)
+
+        return __profiles
+
+    def get_default_profiles(self):
+        """
+        Get compiled profiles of the configuration embedded into this package, no file is read
+
+        :return dict: mail domain to DomainProfile mapping of DEFAULT_CONFIG, must not be modified
+        """
+        with self.__lock:
+            if self.__default_profiles is None:
+                self.__default_profiles = self.__compile(None, DEFAULT_CONFIG)
+
+            return self.__default_profiles
+
+    def invalidate(self, config_path=None):
+        """
+        Drop cached profiles
+
+        :param str config_path: path to a configuration to drop, all configurations are dropped if omitted
+        """
+        with self.__lock:
+            if config_path is None:
+                self.__configs.clear()
+                self.__default_profiles = None
+                return
+
+            config_path = os.path.abspath(config_path)
+
+            for __key in [_k for _k in self.__configs.keys() if _k[0] == config_path]:
+                del(self.__configs[__key])
+
+    def __load(self, config_path):
+        """
+        Read the configuration and compile profiles for all mail domains
+
+        :param str config_path: absolute path to a configuration
+        :return dict: mail domain to DomainProfile mapping
+        """
+        with open(config_path, mode='rt') as _f:
+            __config = json.load(_f)
+
+        return self.__compile(config_path, __config)
+
+    def __compile(self, config_path, config):
+        """
+        Compile profiles for all mail domains
+
+        :param str config_path: absolute path to the configuration, resources are relative to it; None if embedded
+        :param dict config: parsed configuration
+        :return dict: mail domain to DomainProfile mapping
+        """
+        __profiles = dict()
+
+        for __mail_domain, __section in config.items():
+            __section = __section or dict()
+            __template_path = None if __section.get("template") else \
+                    self.__resolve(config_path, __section.get("template_file"))
+            __signature_path = self.__resolve(config_path, __section.get("signature_image"))
+            __digest_template_path = None if __section.get("digest_template") else \
+                    self.__resolve(config_path, __section.get("digest_template_file"))
+            __profiles[__mail_domain] = DomainProfile(
+                    template_type=__section.get("template_type"),
+                    template_string=__section.get("template") or self.__read_from_resource(__template_path),
+                    signature_image_data=self.__read_from_resource(__signature_path, mode='rb'),
+                    resource_paths=[_p for _p in [__template_path, __signature_path, __digest_template_path] if _p],
+                    digest_template_string=__section.get("digest_template") or \
+                            self.__read_from_resource(__digest_template_path),
+                    rate_limit=__section.get("rate_limit"))
+
+        return __profiles
+
+    def __resolve(self, config_path, file_path):
+        """
+        Get absolute path of a resource
+        :param str config_path: path to a configuration
+        :param str file_path: path to a file, absolute or relative to 'config_path'
+        :return str: absolute path, None if not given
+        """
+        if not file_path:
+            return None
+
+        if not os.path.isabs(file_path):
+            file_path = os.path.join(os.path.dirname(config_path), file_path)
+
+        return os.path.abspath(file_path)
+
+    def __read_from_resource(self, file_path, mode='rt'):
+        """
+        Read binary or test resource
+        :param str file_path: absolute path to a file
+        :param str mode: resouce open mode, text or binary
+        """
+        if not file_path:
+            return None
+
+        if not os.path.exists(file_path):
+            return None
+
+        __result = None
+
+        with open(file_path, mode=mode) as _fl_in:
+            __result = _fl_in.read()
+
+        return __result
+
+
+class ProfileWatcher(object):
+    """
+    Watcher of configurations and resources they reference (template and signature files) for changes.
+    Files are checked by a background thread with throttled stat calls. Changed configuration is parsed
+    and compiled again in the background and subscribers receive the new profiles, so sending never waits
+    for a reload.
+    """
+
+    def __init__(self, cache, interval=1.0):
+        """
+        Initialize.
+
+        :param ProfileCache cache: cache of profiles to reload
+        :param float interval: seconds between checks of files
+        """
+        self.interval = interval
+        self.__cache = cache
+        self.__lock = threading.Lock()
+        self.__check_lock = threading.Lock()
+        self.__watched = dict()
+        self.__thread = None
+
+    def subscribe(self, config_path, callback):
+        """
+        Watch configuration, the background thread is started on the first call
+
+        :param str config_path: path to a configuration
+        :param callable callback: function or bound method receiving mail domain to DomainProfile mapping
+            on every change, it is referenced weakly
+        """
+        config_path = os.path.abspath(config_path)
+        __callback = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else weakref.ref(callback)
+
+        with self.__lock:
+            __watched = self.__watched.get(config_path)
+
+            if __watched is None:
+                __watched = self.__watched[config_path] = [
+                        self.__snapshot(config_path, self.__cache.get_profiles(config_path)), list()]
+
+            __watched[1].append(__callback)
+
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__watch, name="oc-mailer-reload", daemon=True)
+                self.__thread.start()
+
+    def check(self):
+        """
+        Check watched files once and reload changed configurations
+
+        :return int: number of reloaded configurations
+        """
+        # subscribers get changes in order
+        with self.__check_lock:
+            return self.__check()
+
+    def __check(self):
+        with self.__lock:
+            for __config_path, (__snapshot, __callbacks) in list(self.__watched.items()):
+                __callbacks[:] = [_c for _c in __callbacks if _c() is not None]
+
+                if not __callbacks:
+                    del(self.__watched[__config_path])
+
+            __watched = list(self.__watched.items())
+
+        __reloaded = 0
+
+        for __config_path, (__snapshot, __callbacks) in __watched:
+            __profiles = self.__reload(__config_path, __snapshot)
+
+            if __profiles is None:
+                continue
+
+            __reloaded += 1
+
+            with self.__lock:
+                __alive = [_c() for _c in __callbacks]
+
+            for __callback in __alive:
+                if __callback is None:
+                    continue
+
+                try:
+                    __callback(__profiles)
+                except Exception as _e:
+                    logging.getLogger(__name__).exception("Profile reload of '%s' failed: %s", __config_path, _e)
+
+        return __reloaded
+
+    def __reload(self, config_path, snapshot):
+        """
+        Reload configuration if it or its resources are changed
+
+        :param str config_path: absolute path to a configuration
+        :param tuple snapshot: state of files when they were loaded
+        :return dict: new profiles, None if nothing is changed
+        """
+        __paths = [_s[0] for _s in snapshot]
+        __snapshot = self.__stat(__paths)
+
+        if __snapshot == snapshot:
+            return None
+
+        self.__cache.invalidate(config_path)
+
+        try:
+            __profiles = self.__cache.get_profiles(config_path)
+        except Exception as _e:
+            # keep using the old profiles until the next change
+            logging.getLogger(__name__).error("Configuration '%s' is not reloaded: %s", config_path, _e)
+            self.__update(config_path, __snapshot)
+            return None
+
+        __new_snapshot = self.__snapshot(config_path, __profiles)
+
+        if [_s[0] for _s in __new_snapshot] == __paths:
+            # compare with the state before loading not to miss a change made while loading
+            __new_snapshot = __snapshot
+
+        self.__update(config_path, __new_snapshot)
+        return __profiles
+
+    def __update(self, config_path, snapshot):
+        with self.__lock:
+            if config_path in self.__watched:
+                self.__watched[config_path][0] = snapshot
+
+    def __snapshot(self, config_path, profiles):
+        __paths = [config_path]
+
+        for __profile in profiles.values():
+            __paths.extend(_p for _p in __profile.resource_paths if _p not in __paths)
+
+        return self.__stat(__paths)
+
+    def __stat(self, paths):
+        __snapshot = list()
+
+        for __path in paths:
+            try:
+                __stat = os.stat(__path)
+                __snapshot.append((__path, __stat.st_mtime_ns, __stat.st_size))
+            except OSError:
+                __snapshot.append((__path, None, None))
+
+        return tuple(__snapshot)
+
+    def __watch(self):
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.check()
+            except Exception as _e:
+                logging.getLogger(__name__).exception("Profile reload failed: %s", _e)
+
+            with self.__lock:
+                if not self.__watched:
+                    self.__thread = None
+                    return
+
+
+def default_config_path(config_path=None):
+    """
+    Get absolute path to configuration
+
+    :param str config_path: path to configuration, the one comes with this package is used if omitted
+    :return str: absolute path
+    """
+    global _packaged_config_path
+
+    if config_path:
+        return os.path.abspath(config_path)
+
+    if _packaged_config_path is None:
+        try:
+            # imported here since the packaged configuration is rarely read, see DEFAULT_CONFIG
+            from importlib.resources import files
+            _packaged_config_path = os.path.abspath(str(files(__package__) / "resources" / "config.json"))
+        except ImportError:
+            # Python before 3.9
+            _packaged_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources",
+                    "config.json")
+
+    return _packaged_config_path
+
+
+def select_profile(profiles, mail_domain):
+    """
+    Select profile of a mail domain
+
+    :param dict profiles: mail domain to DomainProfile mapping
+    :param str mail_domain: mail domain of a sender, default profile is returned if not configured
+    :return DomainProfile: compiled profile
+    """
+    if mail_domain not in profiles:
+        # use defaults
+        mail_domain = ""
+
+    return profiles.get(mail_domain) or DomainProfile()
+
+
+def _mime(name):
+    """
+    Get class of email.mime, its module is imported on first rendering, so importing this module stays fast.
+    The attribute of this module is used if set (e.g. patched).
+
+    :param str name: name of the class, see _MIME_CLASSES
+    :return type: class
+    """
+    __class = globals().get(name)
+
+    if __class is None:
+        __class = getattr(importlib.import_module(_MIME_CLASSES[name]), name)
+
+    return __class
+
+
+def __getattr__(name):
+    # classes of email.mime are available as attributes of this module too
+    if name in _MIME_CLASSES:
+        return _mime(name)
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def get_mail_domain(address):
+    """
+    Get mail domain of an email address
+
+    :param str address: email address
+    :return str: mail domain, empty if address has no domain
+    """
+    if '@' in address:
+        return address.split('@', 1).pop()
+
+    return ''
+
+
+def _compose_template(template_string, signed):
+    """
+    Append signature image reference to a template string if necessary
+
+    :param str template_string: template string
+    :param bool signed: is signature image attached
+    :return str: final template string
+    """
+    if signed:
+        # signature is referenced by its Content-ID
+        template_string += '<img src="cid:signature_image">'
+
+    return template_string
+
+
+# shared by all Mailer instances of the process
+profile_cache = ProfileCache()
+signature_images = SignatureImageRegistry()
+profile_watcher = ProfileWatcher(profile_cache)
 
 
 class Mailer(object):
@@ -21,147 +676,762 @@ class Mailer(object):
             template_type=None, 
             template=None, 
             signature_image=None, 
-            config_path=None):
+            config_path=None,
+            render_once=False,
+            retry=None,
+            max_recipients=None,
+            group_by_domain=False,
+            fast_render=False,
+            profile=None,
+            hot_reload=False,
+            observer=None,
+            eight_bit=False,
+            rate_limiter=None):
         """
         Initialize.
 
-        :param SMTPClient smtp_client: SMTP client for mailing
+        :param SMTPClient smtp_client: SMTP client for mailing or another transport, see oc_mailer.Transports
         :param str from_address: Single 'from' email address
         :param str template_type: Type of email message text
         :param str template: Template string of email message text
         :param str signature_image: Raw signature image data. It may be applicable only if 'type' equals to 'html'
+        :param str config_path: Path to JSON configuration, the one comes with this package is used if omitted
+        :param bool render_once: Serialize message once for 'split' sending, only 'To' header is rendered
+            for each recipient
+        :param RetryPolicy retry: Retry recipients refused temporarily, see oc_mailer.Retry
+        :param int max_recipients: Maximal number of recipients of a single SMTP transaction if not 'split',
+            the message is sent in chunks of recipients pipelining SMTP commands where the server supports it
+        :param bool group_by_domain: Put recipients of the same domain into the same chunks
+        :param bool fast_render: Render template straight into MIME part which headers are created once
+        :param DomainProfile profile: Compiled profile to use instead of looking it up in configuration,
+            see oc_mailer.MailerFactory
+        :param bool hot_reload: Watch configuration and resources it references and use their changes,
+            see 'profile_watcher'
+        :param MailerObserver observer: Receiver of phase timings, message sizes and sending outcomes,
+            see oc_mailer.Metrics
+        :param bool eight_bit: Render text 8bit and messages as bytes, they are sent as is if the server supports
+            8BITMIME and converted to base64 otherwise, see oc_mailer.EightBit
+        :param RateLimiter rate_limiter: Limiter waited for before each SMTP transaction, the one of the profile
+            ('rate_limit' in configuration) is used if omitted, see oc_mailer.RateLimit
         """
         if not all([smtp_client, from_address]):
             raise MailerArgumentError('smtp_client, from_address - must not be empty')
 
+        if max_recipients is not None and max_recipients < 1:
+            raise MailerArgumentError('max_recipients must be positive')
+
         if signature_image and not template_type == 'html':
             raise MailerArgumentError('signature_image applicable only if type equals to html')
 
         self.__smtp = smtp_client
         self.__from_address = from_address
-        self.__config_path = os.path.abspath(config_path or 
-                pkg_resources.resource_filename("oc_mailer", os.path.join("resources", "config.json")))
-        self.__fix_arguments(template_type, template, signature_image)
+        self.__render_once = render_once
+        self.__retry = retry
+        self.__max_recipients = max_recipients
+        self.__group_by_domain = group_by_domain
+        self.__fast_render = fast_render
+        self.__observer = observer
+        self.__eight_bit = eight_bit
+        self.__own_rate_limiter = rate_limiter
+        self.__sender = PipeliningSMTP(smtp_client) if max_recipients else smtp_client
+        self.__streaming_sender = self.__sender if max_recipients else StreamingSMTP(smtp_client)
+
+        if eight_bit:
+            # it streams attachments too
+            self.__sender = self.__streaming_sender = EightBitSMTP(smtp_client, pipelining=bool(max_recipients))
+
+        # not imported here since it is slow to import: a Transport may be given only if its module is imported
+        __transports = sys.modules.get(__name__.rsplit('.', 1)[0] + '.Transports')
+
+        if __transports is not None and isinstance(smtp_client, __transports.Transport):
+            # transports take rendered messages as they are
+            self.__sender = self.__streaming_sender = smtp_client
+
+        self.__arguments = (template_type, template, signature_image)
+        self.__fix_arguments(template_type, template, signature_image, config_path, profile)
 
-    def __fix_arguments(self, template_type, template, signature_image):
+        if hot_reload:
+            profile_watcher.subscribe(default_config_path(config_path), self.__reload)
+
+    def __reload(self, profiles):
+        """
+        Use reloaded profiles, called by 'profile_watcher'
+
+        :param dict profiles: mail domain to DomainProfile mapping
+        """
+        self.__fix_arguments(*self.__arguments, config_path=None,
+                profile=select_profile(profiles, get_mail_domain(self.__from_address)))
+
+    def __fix_arguments(self, template_type, template, signature_image, config_path, profile):
         """
         Check and fix initalization arguments
 
         :param str template_type: type of template ("plain", "html")
         :param str template: template for messages
         :param bytes signature_image: signature image
+        :param str config_path: path to configuration
+        :param DomainProfile profile: compiled profile, configuration is not read if given
         """
-        __config = self.__read_config()
-        self.__template_type = template_type or __config.get("template_type") or "plain"
+        __profile = profile
 
-        __template_string = template or \
-                __config.get("template") or \
-                self.__read_from_resource(self.__config_path, __config.get("template_file")) or \
-                "${text}"
+        if __profile is None:
+            # no file is read without configuration
+            __profiles = profile_cache.get_profiles(config_path) if config_path else \
+                    profile_cache.get_default_profiles()
+            __profile = select_profile(__profiles, get_mail_domain(self.__from_address))
 
+        __template_type = template_type or __profile.template_type or "plain"
         __signature_image = None
-        self.__signature_image = None
 
-        if self.__template_type == 'html':
-            __signature_image = signature_image or \
-                    self.__read_from_resource(self.__config_path, __config.get("signature_image"), mode='rb')
+        if __template_type == 'html':
+            # we have checked in constructor that template_type is 'html' if signature_image is given
+            if signature_image:
+                __signature_image = signature_images.get(signature_image)
+            else:
+                __signature_image = __profile.get_signature_image()
 
-        if __signature_image:
-            # we have checked above that template_type is 'html' for this case
-            __template_string += '<img src="cid:signature_image">'
-            self.__signature_image = MIMEImage(__signature_image)
-            self.__signature_image.add_header('Content-ID', '<signature_image>')
+        if template:
+            __template = CompiledTemplate(_compose_template(template, __signature_image is not None))
+            # notifications of a digest are rendered without signature
+            __item_template = CompiledTemplate(template) if __signature_image is not None else __template
+        else:
+            __template = __profile.get_template(signed=__signature_image is not None)
+            __item_template = __profile.get_template()
 
-        self.__template = Template(__template_string)
+        __digest_template = __profile.get_digest_template(signed=__signature_image is not None)
+        # replaced at once, so a message never mixes template and signature of different profiles
+        self.__compiled = (__template_type, __template, __signature_image, __item_template, __digest_template)
+        self.__rate_limiter = self.__own_rate_limiter or __profile.get_rate_limiter()
+        self.__profile = __profile
 
+    @property
+    def from_address(self):
+        return self.__from_address
 
-    def __read_config(self):
+    @property
+    def rate_limiter(self):
         """
-        Read the configuration and find one suitable for mail domain of sender
+        RateLimiter in use, None if sending is not limited
         """
+        return self.__rate_limiter
 
-        with open(self.__config_path, mode='rt') as _f:
-            __config = json.load(_f)
+    def send_email(self, to_addresses, subject, split=False, attachments=None, **kwargs):
+        """
+        Send email.
 
-        __mail_domain = ''
+        :param list to_addresses: List of str 'To' email addresses or single 'To' email address
+        :param str subject: Plain text which is used as email subject
+        :param str split: Defines necessity of sending separate email to each of multiple recipients
+        :param list attachments: Paths to files, binary file objects or Attachment objects to attach;
+            files are read in chunks while sending each message and never kept in memory
+        :param kwargs: Dictionary with mapping for substitution in email message text template          
+        :return list: SendResult for each message sent
+        """
+        if not self.__smtp:
+            raise MailerError('Cannot send email. Mailer is already closed.')
 
-        if '@' in self.__from_address:
-            __mail_domain = self.__from_address.split('@', 1).pop()
+        return self.__send_emails(self.render_email(to_addresses, subject, split=split, attachments=attachments,
+                **kwargs), split)
 
-        if __mail_domain not in list(__config.keys()):
-            # use defaults
-            __mail_domain = ""
+    def send_digest(self, to_addresses, subject, items, split=False):
+        """
+        Send single email combining many notifications.
+        Each notification is substituted into the template without signature, results are joined by line breaks
+        and substituted into the digest template of the profile as '${items}', their number as '${count}'.
 
-        return __config.get(__mail_domain)
+        :param list to_addresses: List of str 'To' email addresses or single 'To' email address
+        :param str subject: Plain text which is used as email subject
+        :param list items: Dictionaries with mapping for substitution in email message text template,
+            one for each notification
+        :param str split: Defines necessity of sending separate email to each of multiple recipients
+        :return list: SendResult for each message sent
+        """
+        if not self.__smtp:
+            raise MailerError('Cannot send email. Mailer is already closed.')
 
-    def __read_from_resource(self, config_path, file_path, mode='rt'):
+        return self.__send_emails(self.render_digest(to_addresses, subject, items, split=split), split)
+
+    def __send_emails(self, emails, split):
         """
-        Read binary or test resource
-        :param str config_path: path to a configuration
-        :param str file_path: path to a file, absolute or relative to 'config_path'
-        :param str mode: resouce open mode, text or binary
+        Send rendered emails
+
+        :param generator emails: tuples of recipients and rendered message text
+        :param bool split: emails are rendered for each of recipients separately
+        :return list: SendResult for each message sent
         """
-        if not file_path:
-            return None
+        if not split and self.__max_recipients:
+            emails = list(emails)
+            __pool_size = self.__pool_size()
 
-        if not os.path.isabs(file_path):
-            file_path = os.path.join(os.path.dirname(config_path), file_path)
+            if len(emails) > 1 and __pool_size > 1:
+                # chunks go over parallel connections of the pool
+                with ThreadPoolExecutor(max_workers=min(__pool_size, len(emails))) as _executor:
+                    return list(_executor.map(lambda _email: self.__deliver(*_email), emails))
 
-        if not os.path.exists(file_path):
-            return None
+        return [self.__deliver(to, email) for to, email in emails]
 
-        __result = None
+    def __pool_size(self):
+        """
+        Get number of connections of SMTP client
 
-        with open(file_path, mode=mode) as _fl_in:
-            __result = _fl_in.read()
+        :return int: size of SMTPPool, 1 for other clients
+        """
+        # imported here since MailerPool depends on this module
+        from .MailerPool import SMTPPool
+        return self.__smtp.size if isinstance(self.__smtp, SMTPPool) else 1
+
+    def __deliver(self, to_addresses, email):
+        """
+        Send rendered email, retrying if configured
 
+        :param to_addresses: recipients as passed to 'sendmail'
+        :param str email: rendered message text
+        :return SendResult: result
+        """
+        __observer = self.__observer
+
+        if __observer is None:
+            return self.__sendmail(to_addresses, email)
+
+        __started = time.perf_counter()
+
+        try:
+            __result = self.__sendmail(to_addresses, email)
+        except Exception as _e:
+            __observer.on_phase('send', time.perf_counter() - __started)
+            __observer.on_error(_e, to_addresses)
+            raise
+
+        __observer.on_phase('send', time.perf_counter() - __started)
+        __observer.on_result(__result)
         return __result
 
+    def __sendmail(self, to_addresses, email):
+        __sender = self.__streaming_sender if isinstance(email, StreamedMessage) else self.__sender
+        __rate_limiter = self.__rate_limiter
+
+        if __rate_limiter is not None:
+            # each attempt of retry waits for the limiter too
+            __sender = RateLimitedSMTP(__sender, __rate_limiter)
+
+        if self.__retry:
+            return self.__retry.deliver(__sender, self.__from_address, to_addresses, email)
+
+        return SendResult(to_addresses, refused=__sender.sendmail(self.__from_address, to_addresses, email))
 
-    def send_email(self, to_addresses, subject, split=False, **kwargs):
+    def render_email(self, to_addresses, subject, split=False, attachments=None, **kwargs):
         """
-        Send email.
+        Render emails without sending them.
+        Arguments are checked and template is substituted immediately, messages are rendered while iterating.
 
         :param list to_addresses: List of str 'To' email addresses or single 'To' email address
         :param str subject: Plain text which is used as email subject
-        :param str split: Defines necessity of sending separate email to each of multiple recipients
-        :param kwargs: Dictionary with mapping for substitution in email message text template          
-        :return: None
+        :param str split: Defines necessity of rendering separate email for each of multiple recipients
+        :param list attachments: Paths to files, binary file objects or Attachment objects to attach,
+            messages with attachments are rendered as oc_mailer.Attachments.StreamedMessage
+        :param kwargs: Dictionary with mapping for substitution in email message text template
+        :return generator: tuples of recipients and rendered message text to be passed to 'sendmail'
+        """
+        return self.__render(to_addresses, subject, split, self.__check_attachments(attachments), self.__create_body,
+                kwargs)
+
+    def render_digest(self, to_addresses, subject, items, split=False):
+        """
+        Render single email combining many notifications without sending it, see 'send_digest'
+
+        :param list to_addresses: List of str 'To' email addresses or single 'To' email address
+        :param str subject: Plain text which is used as email subject
+        :param list items: Dictionaries with mapping for substitution in email message text template
+        :param str split: Defines necessity of rendering separate email for each of multiple recipients
+        :return generator: tuples of recipients and rendered message text to be passed to 'sendmail'
+        """
+        if not items:
+            raise MailerArgumentError('items must not be empty')
+
+        return self.__render(to_addresses, subject, split, list(), self.__create_digest_body, list(items))
+
+    def __render(self, to_addresses, subject, split, attachments, create_body, argument):
+        """
+        Check arguments, create email body and render emails
+
+        :param list to_addresses: List of str 'To' email addresses or single 'To' email address
+        :param str subject: Plain text which is used as email subject
+        :param bool split: Render separate email for each of recipients
+        :param list attachments: Attachment objects
+        :param callable create_body: function creating MIME parts of email body
+        :param argument: argument of 'create_body'
+        :return generator: tuples of recipients and rendered message text
         """
-        if not self.__smtp:
-            raise MailerError('Cannot send email. Mailer is already closed.')
         if not all([to_addresses, subject]):
             raise MailerArgumentError('to_addresses and subject must not be empty')
         if not isinstance(to_addresses, list):
             to_addresses = [to_addresses]
 
         email_subject = Header(subject, 'utf-8')
-        email_body = MIMEText(self.__template.substitute(**kwargs), self.__template_type, 'utf-8')
-        if split:
+
+        if self.__observer is None:
+            email_body = create_body(argument)
+            return self.__render_emails(to_addresses, email_subject, email_body, split, attachments)
+
+        email_body = self.__observe('substitute', to_addresses, create_body, argument)
+        return self.__observe_emails(to_addresses,
+                self.__render_emails(to_addresses, email_subject, email_body, split, attachments))
+
+    def __check_attachments(self, attachments):
+        """
+        Check attachments
+
+        :param list attachments: paths to files, binary file objects or Attachment objects
+        :return list: Attachment objects
+        """
+        __attachments = list()
+
+        for __attachment in attachments or list():
+            if isinstance(__attachment, Attachment):
+                __attachments.append(__attachment)
+            elif isinstance(__attachment, (str, os.PathLike)):
+                if not os.path.isfile(__attachment):
+                    raise MailerArgumentError('attachment %s is not a file' % __attachment)
+
+                __attachments.append(Attachment(__attachment))
+            elif hasattr(__attachment, 'read') and not isinstance(__attachment, io.TextIOBase):
+                __attachments.append(Attachment(__attachment))
+            else:
+                raise MailerArgumentError('attachments must be paths, binary file objects or Attachment objects')
+
+        return __attachments
+
+    def __observe(self, phase, to_addresses, function, *args):
+        """
+        Call function reporting its duration and error to the observer
+
+        :param str phase: name of the phase
+        :param to_addresses: recipients to report an error for
+        :param callable function: function to call
+        :return: result of the function
+        """
+        __started = time.perf_counter()
+
+        try:
+            return function(*args)
+        except Exception as _e:
+            self.__observer.on_error(_e, to_addresses)
+            raise
+        finally:
+            self.__observer.on_phase(phase, time.perf_counter() - __started)
+
+    def __observe_emails(self, to_addresses, emails):
+        """
+        Report serialization of each rendered message to the observer
+
+        :param list to_addresses: List of str 'To' email addresses
+        :param generator emails: tuples of recipients and rendered message text
+        :return generator: the same tuples
+        """
+        while True:
+            __started = time.perf_counter()
+
+            try:
+                to, email = next(emails)
+            except StopIteration:
+                return
+            except Exception as _e:
+                self.__observer.on_phase('serialize', time.perf_counter() - __started)
+                self.__observer.on_error(_e, to_addresses)
+                raise
+
+            self.__observer.on_phase('serialize', time.perf_counter() - __started)
+            self.__observer.on_message(len(to) if isinstance(to, list) else 1, len(email))
+            yield to, email
+
+    def __create_body(self, mapping):
+        """
+        Substitute template and create MIME parts of email body
+
+        :param dict mapping: mapping for substitution in email message text template
+        :return list: MIME parts of email body, the text and the signature image if any
+        """
+        __template_type, __template, __signature_image, __item_template, __digest_template = self.__compiled
+        return self.__create_parts(__template_type, __template, __signature_image, mapping)
+
+    def __create_digest_body(self, items):
+        """
+        Substitute notifications into the template and the digest template and create MIME parts of email body
+
+        :param list items: mappings for substitution in email message text template
+        :return list: MIME parts of email body, the text and the signature image if any
+        """
+        __template_type, __template, __signature_image, __item_template, __digest_template = self.__compiled
+        __mapping = {
+                "items": "\n".join(__item_template.substitute(_i) for _i in items),
+                "count": len(items)}
+        return self.__create_parts(__template_type, __digest_template, __signature_image, __mapping)
+
+    def __create_parts(self, template_type, template, signature_image, mapping):
+        """
+        Substitute template and create MIME parts
+
+        :param str template_type: type of template ("plain", "html")
+        :param CompiledTemplate template: template
+        :param signature_image: signature image part, None if not signed
+        :param dict mapping: mapping for substitution in template
+        :return list: MIME parts of email body, the text and the signature image if any
+        """
+        if self.__eight_bit and self.__fast_render:
+            __text = template.render_8bit_part(template_type, mapping)
+        elif self.__eight_bit:
+            __text = template.substitute(**mapping)
+            # lines too long for 8bit body are encoded as quoted-printable
+            __text = _mime("MIMEText")(__text, template_type,
+                    UTF8_8BIT if fits_eight_bit(__text.encode('utf-8')) else UTF8_QP)
+        elif self.__fast_render:
+            __text = template.render_part(template_type, mapping)
+        else:
+            __text = _mime("MIMEText")(template.substitute(**mapping), template_type, 'utf-8')
+
+        return [__text] if signature_image is None else [__text, signature_image]
+
+    def __render_emails(self, to_addresses, subject, body, split, attachments=()):
+        """
+        Render emails.
+
+        :param list to_addresses: List of str 'To' email addresses
+        :param str subject: Email subject
+        :param list body: MIME parts of email body
+        :param bool split: Render separate email for each of recipients
+        :param list attachments: Attachment objects
+        :return generator: tuples of recipients and rendered message text
+        """
+        if split and self.__render_once:
+            yield from self.__create_split_emails([(_a, _a) for _a in to_addresses], subject, body, attachments)
+        elif split:
             for to_address in to_addresses:
-                email = self.__create_email(to_address, email_subject, email_body)
-                self.__smtp.sendmail(self.__from_address, to_address, email)
+                yield to_address, self.__create_email(to_address, subject, body, attachments)
+        else:
+            __chunks = self.__chunk_recipients(to_addresses)
+
+            if len(__chunks) > 1:
+                yield from self.__create_split_emails([(_c, ','.join(_c)) for _c in __chunks], subject, body,
+                        attachments)
+            else:
+                yield to_addresses, self.__create_email(','.join(to_addresses), subject, body, attachments)
+
+    def __chunk_recipients(self, to_addresses):
+        """
+        Split recipients into chunks of 'max_recipients'
+
+        :param list to_addresses: List of str 'To' email addresses
+        :return list: lists of addresses, domains are ordered by their first appearance if grouped
+        """
+        if not self.__max_recipients:
+            return [to_addresses]
+
+        __groups = [to_addresses]
+
+        if self.__group_by_domain:
+            __domains = OrderedDict()
+
+            for __address in to_addresses:
+                __domains.setdefault(__address.rsplit('@', 1).pop().strip(' >').lower(), list()).append(__address)
+
+            __groups = list(__domains.values())
+
+        return [_g[_i:_i + self.__max_recipients] for _g in __groups for _i in range(0, len(_g), self.__max_recipients)]
+
+    def send_many(self, messages, render_workers=0, send_workers=0, window=None, render_processes=0,
+            batch_size=32):
+        """
+        Send many personalized emails streaming them through rendering and sending.
+        Messages are taken from the iterable lazily, at most 'window' of them are in progress at once.
+        Errors of a single message do not stop sending, they are reported in its result.
+
+        :param iterable messages: tuples of 'to_addresses', 'subject' and dictionary with mapping for substitution
+            in email message text template, see 'send_email'
+        :param int render_workers: number of threads rendering messages, 0 to render in the calling thread;
+            up to 'window' messages are rendered ahead of sending
+        :param int send_workers: number of threads sending messages, 0 to send in the calling thread;
+            SMTP client must be thread-safe (e.g. SMTPPool) if more than one
+        :param int window: maximal number of messages taken from the iterable and not yielded yet,
+            64 or two batches for each rendering process if omitted
+        :param int render_processes: number of processes rendering messages instead of threads, see RenderPool;
+            messages and mappings must be picklable
+        :param int batch_size: number of messages rendered by a process at once
+        :return generator: SendResult for each message sent in order of the iterable, a message
+            with recipients split into chunks of 'max_recipients' has a result for each chunk
+        """
+        if not self.__smtp:
+            raise MailerError('Cannot send email. Mailer is already closed.')
+
+        if window is None:
+            window = 2 * render_processes * batch_size if render_processes else 64
+
+        if window < 1 or batch_size < 1:
+            raise MailerArgumentError('window and batch_size must be positive')
+
+        return self.__send_many(messages, render_workers, send_workers, window, render_processes, batch_size)
+
+    def __render_arguments(self):
+        """
+        Get arguments of Mailer rendering the same messages in another process
+
+        :return dict: picklable arguments of Mailer, without SMTP client
+        """
+        __template_type, __template, __signature_image = self.__arguments
+        return dict(
+                from_address=self.__from_address,
+                template_type=__template_type,
+                template=__template,
+                signature_image=__signature_image,
+                profile=self.__profile,
+                fast_render=self.__fast_render,
+                eight_bit=self.__eight_bit,
+                max_recipients=self.__max_recipients,
+                group_by_domain=self.__group_by_domain)
+
+    def __send_many(self, messages, render_workers, send_workers, window, render_processes, batch_size):
+        """
+        Send many emails, see 'send_many'
+        """
+        __render_executor = ThreadPoolExecutor(max_workers=render_workers) \
+                if render_workers and not render_processes else None
+        __render_pool = None
+
+        if render_processes:
+            # imported here since multiprocessing is slow to import and rarely needed
+            from .RenderPool import RenderPool
+            __render_pool = RenderPool(self.__render_arguments(), render_processes, batch_size,
+                    observed=self.__observer is not None)
+
+        __send_executor = ThreadPoolExecutor(max_workers=send_workers) if send_workers else None
+        __subjects = dict()
+        __in_progress = deque()
+
+        def __render(to_addresses, subject, kwargs):
+            if not all([to_addresses, subject]):
+                raise MailerArgumentError('to_addresses and subject must not be empty')
+            if not isinstance(to_addresses, list):
+                to_addresses = [to_addresses]
+
+            # the same subject is usually shared by the whole batch
+            email_subject = __subjects.get(subject)
+
+            if email_subject is None:
+                __subjects.clear()
+                email_subject = __subjects[subject] = Header(subject, 'utf-8')
+
+            if self.__observer is None:
+                email_body = self.__create_body(kwargs or dict())
+                return list(self.__render_emails(to_addresses, email_subject, email_body, False))
+
+            email_body = self.__observe('substitute', to_addresses, self.__create_body, kwargs or dict())
+            return list(self.__observe_emails(to_addresses,
+                    self.__render_emails(to_addresses, email_subject, email_body, False)))
+
+        def __send(to_addresses, rendered):
+            try:
+                __emails = rendered.result()
+            except Exception as _e:
+                return [SendResult(to_addresses, error=_e)]
+
+            # more than one if recipients are split into chunks of 'max_recipients'
+            return [__send_email(_to, _email) for _to, _email in __emails]
+
+        def __send_email(to_addresses, email):
+            try:
+                return self.__deliver(to_addresses, email)
+            except smtplib.SMTPRecipientsRefused as _e:
+                return SendResult(to_addresses, refused=_e.recipients, error=_e)
+            except Exception as _e:
+                return SendResult(to_addresses, error=_e)
+
+        def __submit(executor, function, *args):
+            if executor:
+                return executor.submit(function, *args)
+
+            __future = Future()
+
+            try:
+                __future.set_result(function(*args))
+            except Exception as _e:
+                __future.set_exception(_e)
+
+            return __future
+
+        if __render_pool:
+            __rendered_messages = __render_pool.render(messages, window, self.__observer)
         else:
-            email = self.__create_email(','.join(to_addresses), email_subject, email_body)
-            self.__smtp.sendmail(self.__from_address, to_addresses, email)
+            __rendered_messages = ((_to, __submit(__render_executor, __render, _to, _subject, _kwargs))
+                    for _to, _subject, _kwargs in messages)
+
+        # without sending threads messages rendered by threads are sent once taken from the window,
+        # so rendering runs ahead of sending
+        __render_ahead = __render_executor is not None and __send_executor is None
 
-    def __create_email(self, to, subject, body):
+        def __sent(to_addresses, future):
+            return __send(to_addresses, future) if __render_ahead else future.result()
+
+        try:
+            for to_addresses, __rendered in __rendered_messages:
+                if not __render_ahead:
+                    __rendered = __submit(__send_executor, __send, to_addresses, __rendered)
+
+                __in_progress.append((to_addresses, __rendered))
+
+                while len(__in_progress) >= window or (__in_progress and __in_progress[0][1].done()):
+                    yield from __sent(*__in_progress.popleft())
+
+            while __in_progress:
+                yield from __sent(*__in_progress.popleft())
+        finally:
+            # the generator may be closed before all messages are sent
+            for _to, __future in __in_progress:
+                __future.cancel()
+
+            __rendered_messages.close()
+
+            for __executor in [__render_executor, __send_executor]:
+                if __executor:
+                    __executor.shutdown(wait=True)
+
+            if __render_pool:
+                __render_pool.close()
+
+    def __create_email(self, to, subject, body, attachments=()):
         """
         Create email.
 
         :param str to: One or more email addresses separated by comma
         :param str subject: Email subject
-        :param str body: Email body
-        :return str: rendered message text
+        :param list body: MIME parts of email body
+        :param list attachments: Attachment objects
+        :return str: rendered message text, StreamedMessage if there are attachments
         """
-        message = MIMEMultipart('related')
+        return self.__finish(self.__serialize(self.__create_message(to, subject, body, attachments)), attachments)
+
+    def __serialize(self, message):
+        """
+        Serialize message
+
+        :param Message message: message
+        :return str: rendered message text, bytes with CRLF line breaks if 'eight_bit'
+        """
+        if self.__eight_bit:
+            return message.as_bytes(policy=SMTP_POLICY)
+
+        return message.as_string()
+
+    def __finish(self, text, attachments):
+        """
+        Make message to send of rendered text
+
+        :param text: rendered message text with markers of attachments
+        :param list attachments: Attachment objects
+        :return str: rendered message text, StreamedMessage if there are attachments
+        """
+        if not attachments:
+            return text
+
+        return StreamedMessage(text, attachments)
+
+    def __create_message(self, to, subject, body, attachments=()):
+        """
+        Create email message object.
+
+        :param str to: One or more email addresses separated by comma
+        :param str subject: Email subject
+        :param list body: MIME parts of email body
+        :param list attachments: Attachment objects, their content is rendered as markers
+        :return MIMEMultipart: message
+        """
+        message = _mime("MIMEMultipart")('related')
+
+        for part in body:
+            message.attach(part)
+
+        if attachments:
+            __related = message
+            message = _mime("MIMEMultipart")('mixed')
+            message.attach(__related)
+
+            for __attachment in attachments:
+                message.attach(__attachment.create_part())
+
         message['From'] = self.__from_address
         message['To'] = to
         message['Subject'] = subject
-        message.attach(body)
-        if self.__signature_image:
-            message.attach(self.__signature_image)
-        return message.as_string()
+        return message
+
+    def __create_split_emails(self, recipients, subject, body, attachments=()):
+        """
+        Create separate emails for each of recipients serializing the shared message only once.
+        Messages differ by 'To' header only, so it is folded the same way 'as_string' does
+        and put in place of a placeholder in the rendered text. All messages share one MIME boundary.
+
+        :param list recipients: tuples of recipients passed to 'sendmail' and value of 'To' header
+        :param str subject: Email subject
+        :param list body: MIME parts of email body
+        :param list attachments: Attachment objects
+        :return generator: tuples of recipients and rendered message text
+        """
+        __placeholder = 'oc-mailer-to-%s' % uuid.uuid4().hex
+        __message = self.__create_message(__placeholder, subject, body, attachments)
+
+        # 'as_string' does not wrap headers, 'as_bytes' does
+        __policy = SMTP_POLICY if self.__eight_bit else __message.policy.clone(max_line_length=0)
+        __fold = __policy.fold_binary if self.__eight_bit else __policy.fold
+        __head, __found, __tail = self.__serialize(__message).partition(__fold('To', __placeholder))
+
+        for to, to_header in recipients:
+            if not __found or '\r' in to_header or '\n' in to_header:
+                # let the generator deal with such headers as usual
+                yield to, self.__create_email(to_header, subject, body, attachments)
+                continue
+
+            yield to, self.__finish(__head + __fold('To', to_header) + __tail, attachments)
+
+class SendResult(object):
+    """
+    Outcome of sending a single message
+    """
+
+    def __init__(self, to_addresses, refused=None, error=None, attempts=1):
+        """
+        Initialize.
+
+        :param list to_addresses: recipients of the message
+        :param dict refused: refused recipients as returned by smtplib: address to (code, response) mapping
+        :param Exception error: error if the message was not sent
+        :param int attempts: number of sending attempts made
+        """
+        if not isinstance(to_addresses, list):
+            to_addresses = [to_addresses]
+
+        self.to_addresses = to_addresses
+        self.refused = dict(refused or dict())
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def accepted(self):
+        """
+        Recipients the message was accepted for
+        """
+        if self.error is not None:
+            return list()
+
+        return [_a for _a in self.to_addresses if _a not in self.refused]
+
+    @property
+    def ok(self):
+        """
+        Was the message accepted for all recipients
+        """
+        return self.error is None and not self.refused
+
+    def __repr__(self):
+        return "SendResult(to_addresses=%r, refused=%r, error=%r, attempts=%r)" % (
+                self.to_addresses, self.refused, self.error, self.attempts)
+
 
 class MailerError(Exception):
     pass
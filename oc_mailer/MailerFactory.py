@@ -0,0 +1,85 @@
+# coding=utf-8
+from .Mailer import Mailer, MailerArgumentError, default_config_path, get_mail_domain, select_profile
+from .Mailer import profile_cache, profile_watcher
+
+
+class MailerFactory(object):
+    """
+    Factory of Mailers for many sender domains of one configuration.
+    The configuration is parsed once and profiles of all its mail domains are compiled (template type,
+    template and signature image) on creation. Mailers it creates share these profiles and the SMTP client,
+    they do not read any file. With 'hot_reload' Mailers created later get reloaded profiles too.
+    """
+
+    def __init__(self, config_path, smtp_client, **kwargs):
+        """
+        Initialize.
+
+        :param str config_path: Path to JSON configuration, the one comes with this package is used if omitted
+        :param smtp_client: SMTP client shared by all Mailers, e.g. SMTPPool
+        :param kwargs: other Mailer arguments shared by all Mailers: render_once, retry, max_recipients, etc.
+        """
+        if not smtp_client:
+            raise MailerArgumentError('smtp_client must not be empty')
+
+        if any(_k in kwargs for _k in ['template_type', 'template', 'signature_image', 'profile']):
+            raise MailerArgumentError('template_type, template, signature_image, profile are taken from configuration')
+
+        self.__config_path = default_config_path(config_path)
+        self.__smtp = smtp_client
+        self.__kwargs = kwargs
+        self.__profiles = self.__compile(profile_cache.get_profiles(self.__config_path))
+
+        if kwargs.get('hot_reload'):
+            profile_watcher.subscribe(self.__config_path, self.__reload)
+
+    @property
+    def config_path(self):
+        return self.__config_path
+
+    @property
+    def domains(self):
+        """
+        Configured mail domains, empty string stands for the default profile
+        """
+        return list(self.__profiles.keys())
+
+    def get_mailer(self, from_address):
+        """
+        Create Mailer for a sender
+
+        :param str from_address: Single 'from' email address
+        :return Mailer: mailer using profile of the sender mail domain
+        """
+        return Mailer(self.__smtp, from_address, config_path=self.__config_path,
+                profile=select_profile(self.__profiles, get_mail_domain(from_address or '')), **self.__kwargs)
+
+    def send_email(self, from_address, to_addresses, subject, split=False, **kwargs):
+        """
+        Send email from a sender, see Mailer.send_email
+
+        :param str from_address: Single 'from' email address
+        :return list: SendResult for each message sent
+        """
+        return self.get_mailer(from_address).send_email(to_addresses, subject, split=split, **kwargs)
+
+    def __reload(self, profiles):
+        """
+        Use reloaded profiles for new Mailers, called by 'profile_watcher'
+
+        :param dict profiles: mail domain to DomainProfile mapping
+        """
+        self.__profiles = self.__compile(profiles)
+
+    def __compile(self, profiles):
+        """
+        Compile everything Mailers may ask for
+
+        :param dict profiles: mail domain to DomainProfile mapping
+        :return dict: the same profiles
+        """
+        for __profile in profiles.values():
+            __signature_image = __profile.get_signature_image() if __profile.template_type == 'html' else None
+            __profile.get_template(signed=__signature_image is not None)
+
+        return profiles
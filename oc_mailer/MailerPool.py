@@ -0,0 +1,293 @@
+# coding=utf-8
+from .Mailer import Mailer, MailerError, MailerArgumentError
+import smtplib
+import threading
+import time
+
+
+class SMTPPool(object):
+    """
+    Thread-safe bounded pool of SMTP connections.
+    Connections are created by a factory on demand, checked before reuse by NOOP command if idle for a while,
+    re-created if server disconnects and closed if idle for too long.
+    It provides 'sendmail' so it may be given to Mailer instead of a single SMTP client.
+    """
+
+    def __init__(self, smtp_factory, size=4, keepalive_interval=30, idle_timeout=300, checkout_timeout=None):
+        """
+        Initialize.
+
+        :param callable smtp_factory: function without arguments returning connected (and logged in if necessary)
+            SMTP client
+        :param int size: maximal number of connections
+        :param float keepalive_interval: seconds of idleness after which a connection is checked by NOOP,
+            idle connections are also kept alive in background with this interval; None to disable
+        :param float idle_timeout: seconds of idleness after which a connection is closed; None to keep forever
+        :param float checkout_timeout: seconds to wait for a free connection; None to wait forever
+        """
+        if not smtp_factory:
+            raise MailerArgumentError('smtp_factory must not be empty')
+
+        if size < 1:
+            raise MailerArgumentError('size must be positive')
+
+        self.__factory = smtp_factory
+        self.__size = size
+        self.__keepalive_interval = keepalive_interval
+        self.__idle_timeout = idle_timeout
+        self.__checkout_timeout = checkout_timeout
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(size)
+        # idle connections with time of the last use, the most recently used are at the end
+        self.__idle = list()
+        self.__closed = threading.Event()
+        self.__maintainer = None
+
+        if keepalive_interval:
+            self.__maintainer = threading.Thread(target=self.__maintain_forever, name="oc-mailer-smtp-pool",
+                    daemon=True)
+            self.__maintainer.start()
+
+    @property
+    def size(self):
+        return self.__size
+
+    @property
+    def idle(self):
+        """
+        Number of opened connections waiting in the pool
+        """
+        with self.__lock:
+            return len(self.__idle)
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message using one of pooled connections, message is sent again with a new connection
+        if server has closed the connection
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        return self.execute(lambda _smtp: _smtp.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+    def execute(self, action):
+        """
+        Run an action with a pooled connection, the action is run again with a new connection
+        if server has closed the connection
+
+        :param callable action: function receiving SMTP client
+        :return: the action result
+        """
+        __smtp = self.checkout()
+
+        try:
+            try:
+                __result = action(__smtp)
+            except smtplib.SMTPServerDisconnected:
+                self.__discard(__smtp)
+                __smtp = None
+                __smtp = self.__factory()
+                __result = action(__smtp)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            if __smtp is not None:
+                # server has replied, so the connection is still usable
+                self.checkin(__smtp)
+            else:
+                # reconnecting failed, e.g. with SMTPConnectError or SMTPAuthenticationError
+                self.__slots.release()
+
+            raise
+        except BaseException:
+            if __smtp is not None:
+                self.__discard(__smtp)
+
+            self.__slots.release()
+            raise
+
+        self.checkin(__smtp)
+        return __result
+
+    def checkout(self):
+        """
+        Take a connection from the pool, a new one is created if there are no idle connections.
+        Must be returned with 'checkin'.
+
+        :return: SMTP client
+        """
+        if self.__closed.is_set():
+            raise MailerError('Cannot send email. Pool is already closed.')
+
+        if not self.__slots.acquire(timeout=self.__checkout_timeout):
+            raise MailerError('No free SMTP connection within %s seconds' % self.__checkout_timeout)
+
+        try:
+            while True:
+                with self.__lock:
+                    if not self.__idle:
+                        break
+
+                    __smtp, __last_used = self.__idle.pop()
+
+                if self.__expired(__last_used, self.__idle_timeout):
+                    self.__discard(__smtp)
+                    continue
+
+                if self.__expired(__last_used, self.__keepalive_interval) and not self.__noop(__smtp):
+                    continue
+
+                return __smtp
+
+            return self.__factory()
+        except BaseException:
+            self.__slots.release()
+            raise
+
+    def checkin(self, smtp):
+        """
+        Return a connection taken by 'checkout' to the pool
+
+        :param smtp: SMTP client
+        """
+        try:
+            if self.__closed.is_set():
+                self.__discard(smtp)
+                return
+
+            with self.__lock:
+                self.__idle.append((smtp, time.monotonic()))
+        finally:
+            self.__slots.release()
+
+    def maintain(self):
+        """
+        Close connections idle for too long and send NOOP to the rest idle for keepalive interval
+        """
+        __due = list()
+
+        with self.__lock:
+            __idle = list()
+
+            for __smtp, __last_used in self.__idle:
+                # connections being checked take slots, so checkout does not create more than 'size' of them
+                if (self.__expired(__last_used, self.__idle_timeout)
+                        or self.__expired(__last_used, self.__keepalive_interval)) \
+                        and self.__slots.acquire(blocking=False):
+                    __due.append((__smtp, __last_used))
+                else:
+                    __idle.append((__smtp, __last_used))
+
+            self.__idle = __idle
+
+        for __smtp, __last_used in __due:
+            try:
+                if self.__expired(__last_used, self.__idle_timeout):
+                    self.__discard(__smtp)
+                elif self.__noop(__smtp):
+                    if self.__closed.is_set():
+                        self.__discard(__smtp)
+                    else:
+                        with self.__lock:
+                            # just used, so it goes to the end
+                            self.__idle.append((__smtp, time.monotonic()))
+            finally:
+                self.__slots.release()
+
+    def close(self):
+        """
+        Close all idle connections, connections in use are closed when returned
+        """
+        self.__closed.set()
+
+        with self.__lock:
+            __idle = self.__idle
+            self.__idle = list()
+
+        for __smtp, __last_used in __idle:
+            self.__discard(__smtp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __maintain_forever(self):
+        while not self.__closed.wait(self.__keepalive_interval):
+            self.maintain()
+
+    def __expired(self, last_used, interval):
+        return interval is not None and time.monotonic() - last_used >= interval
+
+    def __noop(self, smtp):
+        """
+        Check connection is alive, it is closed if not
+
+        :return bool: is connection alive
+        """
+        try:
+            if smtp.noop()[0] == 250:
+                return True
+        except (smtplib.SMTPException, OSError):
+            pass
+
+        self.__discard(smtp)
+        return False
+
+    def __discard(self, smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                smtp.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+
+class MailerPool(object):
+    """
+    Mailer sending through a pool of SMTP connections, it may be used by many threads at once.
+    Unlike Mailer it owns its SMTP connections and closes them.
+    """
+
+    def __init__(self, smtp_factory, from_address, pool_size=4, keepalive_interval=30, idle_timeout=300,
+            checkout_timeout=None, **kwargs):
+        """
+        Initialize.
+
+        :param callable smtp_factory: function without arguments returning connected (and logged in if necessary)
+            SMTP client
+        :param str from_address: Single 'from' email address
+        :param int pool_size: maximal number of SMTP connections
+        :param float keepalive_interval: see SMTPPool
+        :param float idle_timeout: see SMTPPool
+        :param float checkout_timeout: see SMTPPool
+        :param kwargs: other Mailer arguments: template_type, template, signature_image, config_path, etc.
+        """
+        self.__pool = SMTPPool(smtp_factory, size=pool_size, keepalive_interval=keepalive_interval,
+                idle_timeout=idle_timeout, checkout_timeout=checkout_timeout)
+        self.__mailer = Mailer(self.__pool, from_address, **kwargs)
+
+    @property
+    def pool(self):
+        return self.__pool
+
+    @property
+    def mailer(self):
+        return self.__mailer
+
+    def send_email(self, to_addresses, subject, split=False, **kwargs):
+        """
+        Send email, see Mailer.send_email
+        """
+        return self.__mailer.send_email(to_addresses, subject, split=split, **kwargs)
+
+    def close(self):
+        """
+        Close all SMTP connections
+        """
+        self.__pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
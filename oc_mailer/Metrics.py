@@ -0,0 +1,221 @@
+# coding=utf-8
+from bisect import bisect_left
+import threading
+
+
+class MailerObserver(object):
+    """
+    Observer of Mailer receiving timings and outcomes of mailing, see 'observer' argument of Mailer.
+    All methods do nothing, subclasses override those they need. Methods are called from threads sending
+    messages, so they must be thread-safe and fast.
+
+    Phases are:
+    - 'substitute' - substitution of template and creation of the body part, once per 'send_email' call
+    - 'serialize' - MIME serialization of a message, once per message
+    - 'send' - 'sendmail' call including retries, once per message
+    """
+
+    def on_phase(self, phase, seconds):
+        """
+        Phase of mailing is completed, successfully or not
+
+        :param str phase: name of the phase
+        :param float seconds: duration
+        """
+        pass
+
+    def on_message(self, recipients, size):
+        """
+        Message is rendered
+
+        :param int recipients: number of recipients
+        :param int size: length of the rendered message
+        """
+        pass
+
+    def on_result(self, result):
+        """
+        Message is sent
+
+        :param SendResult result: result of sending, refused recipients included
+        """
+        pass
+
+    def on_error(self, error, recipients):
+        """
+        Message is not rendered or not sent
+
+        :param Exception error: error raised
+        :param recipients: recipient address or list of them
+        """
+        pass
+
+
+class Histogram(object):
+    """
+    Cumulative histogram with fixed bucket upper bounds, not thread-safe
+    """
+
+    def __init__(self, buckets):
+        """
+        Initialize.
+
+        :param list buckets: sorted upper bounds of buckets, the infinite one is implied
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Get cumulative counts
+
+        :return list: tuples of upper bound (float('inf') for the last one) and number of values not greater
+        """
+        __result = list()
+        __total = 0
+
+        for __bound, __count in zip(self.buckets + [float('inf')], self.counts):
+            __total += __count
+            __result.append((__bound, __total))
+
+        return __result
+
+
+class MetricsCollector(MailerObserver):
+    """
+    In-memory collector of counters and histograms of mailing, exported in Prometheus text format.
+    It may be shared by many Mailers.
+    """
+
+    SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+    def __init__(self, seconds_buckets=SECONDS_BUCKETS, size_buckets=SIZE_BUCKETS):
+        """
+        Initialize.
+
+        :param list seconds_buckets: upper bounds of phase duration buckets
+        :param list size_buckets: upper bounds of message size buckets
+        """
+        self.__seconds_buckets = sorted(seconds_buckets)
+        self.__lock = threading.Lock()
+        self.__phases = dict()
+        self.__sizes = Histogram(sorted(size_buckets))
+        self.__counters = {"messages": 0, "recipients": 0, "sent": 0, "accepted": 0, "refused": 0}
+        self.__errors = dict()
+
+    def on_phase(self, phase, seconds):
+        with self.__lock:
+            __histogram = self.__phases.get(phase)
+
+            if __histogram is None:
+                __histogram = self.__phases[phase] = Histogram(self.__seconds_buckets)
+
+            __histogram.observe(seconds)
+
+    def on_message(self, recipients, size):
+        with self.__lock:
+            self.__counters["messages"] += 1
+            self.__counters["recipients"] += recipients
+            self.__sizes.observe(size)
+
+    def on_result(self, result):
+        with self.__lock:
+            self.__counters["sent"] += 1
+            self.__counters["accepted"] += len(result.accepted)
+            self.__counters["refused"] += len(result.refused)
+
+    def on_error(self, error, recipients):
+        __type = type(error).__name__
+
+        with self.__lock:
+            self.__errors[__type] = self.__errors.get(__type, 0) + 1
+
+    def snapshot(self):
+        """
+        Get collected values
+
+        :return dict: counters ('messages', 'recipients', 'sent', 'accepted', 'refused'), 'errors' by type name,
+            'phases' with count and sum of durations by phase name, 'bytes' - total size of rendered messages
+        """
+        with self.__lock:
+            __snapshot = dict(self.__counters)
+            __snapshot["errors"] = dict(self.__errors)
+            __snapshot["phases"] = {_p: {"count": _h.count, "sum": _h.sum} for _p, _h in self.__phases.items()}
+            __snapshot["bytes"] = self.__sizes.sum
+            return __snapshot
+
+    def reset(self):
+        """
+        Forget collected values
+        """
+        with self.__lock:
+            self.__phases.clear()
+            self.__sizes = Histogram(self.__sizes.buckets)
+            self.__counters = dict.fromkeys(self.__counters.keys(), 0)
+            self.__errors.clear()
+
+    def to_prometheus(self, prefix="oc_mailer"):
+        """
+        Export collected values in Prometheus text exposition format
+
+        :param str prefix: prefix of metric names
+        :return str: metrics text
+        """
+        __lines = list()
+
+        with self.__lock:
+            __lines.append("# HELP %s_phase_seconds Duration of mailing phases." % prefix)
+            __lines.append("# TYPE %s_phase_seconds histogram" % prefix)
+
+            for __phase, __histogram in sorted(self.__phases.items()):
+                __lines.extend(self.__histogram_lines(
+                    "%s_phase_seconds" % prefix, 'phase="%s",' % _escape(__phase), __histogram))
+
+            __lines.append("# HELP %s_message_bytes Size of rendered messages." % prefix)
+            __lines.append("# TYPE %s_message_bytes histogram" % prefix)
+            __lines.extend(self.__histogram_lines("%s_message_bytes" % prefix, "", self.__sizes))
+
+            for __name, __help in [
+                    ("messages", "Messages rendered."),
+                    ("recipients", "Recipients of rendered messages."),
+                    ("sent", "Messages sent."),
+                    ("accepted", "Recipients accepted by server."),
+                    ("refused", "Recipients refused by server.")]:
+                __lines.append("# HELP %s_%s_total %s" % (prefix, __name, __help))
+                __lines.append("# TYPE %s_%s_total counter" % (prefix, __name))
+                __lines.append("%s_%s_total %d" % (prefix, __name, self.__counters[__name]))
+
+            __lines.append("# HELP %s_errors_total Messages not rendered or not sent by error type." % prefix)
+            __lines.append("# TYPE %s_errors_total counter" % prefix)
+
+            for __type, __count in sorted(self.__errors.items()):
+                __lines.append('%s_errors_total{type="%s"} %d' % (prefix, _escape(__type), __count))
+
+        return "\n".join(__lines) + "\n"
+
+    def __histogram_lines(self, name, labels, histogram):
+        for __bound, __count in histogram.cumulative():
+            yield '%s_bucket{%sle="%s"} %d' % (name, labels, _format_bound(__bound), __count)
+
+        __labels = "{%s}" % labels.rstrip(",") if labels else ""
+        yield "%s_sum%s %s" % (name, __labels, repr(float(histogram.sum)))
+        yield "%s_count%s %d" % (name, __labels, histogram.count)
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return "+Inf"
+
+    return repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,212 @@
+# coding=utf-8
+from collections import deque
+from .Mailer import MailerError, MailerArgumentError
+import logging
+import queue
+import threading
+import time
+
+
+class Outbox(object):
+    """
+    Non-blocking outbox: messages are put to a bounded in-memory queue and sent by background threads.
+    It provides 'sendmail' so it may be given to Mailer instead of SMTP client, then 'send_email' returns
+    as soon as the message is rendered and queued.
+    Messages which are not sent yet are lost if the process exits.
+    """
+
+    def __init__(self, smtp_client, workers=1, maxsize=1000, on_full='block', put_timeout=None, on_error=None,
+            rate_window=10):
+        """
+        Initialize.
+
+        :param smtp_client: SMTP client to send messages with, must be thread-safe (e.g. SMTPPool)
+            if more than one worker
+        :param int workers: number of sending threads
+        :param int maxsize: maximal number of queued messages
+        :param str on_full: 'block' to wait for a free place in the queue, 'drop' to discard the message
+        :param float put_timeout: seconds to wait for a free place if 'on_full' is 'block', None to wait forever
+        :param callable on_error: function receiving exception and (from_addr, to_addrs, msg) tuple
+            of a message failed or dropped; errors are logged if omitted
+        :param float rate_window: seconds the drain rate is averaged over
+        """
+        if not smtp_client:
+            raise MailerArgumentError('smtp_client must not be empty')
+
+        if workers < 1 or maxsize < 1:
+            raise MailerArgumentError('workers and maxsize must be positive')
+
+        if on_full not in ['block', 'drop']:
+            raise MailerArgumentError('on_full must be one of: block, drop')
+
+        self.__smtp = smtp_client
+        self.__on_full = on_full
+        self.__put_timeout = put_timeout
+        self.__on_error = on_error
+        self.__rate_window = rate_window
+        self.__queue = queue.Queue(maxsize=maxsize)
+        self.__condition = threading.Condition()
+        self.__unfinished = 0
+        self.__sent = 0
+        self.__failed = 0
+        self.__dropped = 0
+        self.__completed = deque()
+        self.__closed = False
+        self.__workers = [threading.Thread(target=self.__work, name="oc-mailer-outbox-%d" % _i, daemon=True)
+                for _i in range(workers)]
+
+        for __worker in self.__workers:
+            __worker.start()
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Queue message for sending
+
+        :return dict: always empty since recipients are not known to be refused yet
+        """
+        __envelope = (from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+        with self.__condition:
+            if self.__closed:
+                raise MailerError('Cannot send email. Outbox is already closed.')
+
+            self.__unfinished += 1
+
+        try:
+            if self.__on_full == 'drop':
+                self.__queue.put_nowait(__envelope)
+            else:
+                self.__queue.put(__envelope, timeout=self.__put_timeout)
+        except queue.Full:
+            self.__done(dropped=True)
+
+            if self.__on_full == 'block':
+                raise MailerError('Outbox is full for %s seconds' % self.__put_timeout)
+
+            self.__report(MailerError('Outbox is full, message dropped'), __envelope)
+
+        return dict()
+
+    @property
+    def depth(self):
+        """
+        Number of messages in the queue
+        """
+        return self.__queue.qsize()
+
+    @property
+    def drain_rate(self):
+        """
+        Messages processed per second averaged over the rate window
+        """
+        with self.__condition:
+            self.__prune(time.monotonic())
+            return len(self.__completed) / self.__rate_window
+
+    def stats(self):
+        """
+        Get outbox counters
+
+        :return dict: 'depth' - queued messages, 'unfinished' - queued and being sent,
+            'sent', 'failed', 'dropped' - totals, 'drain_rate' - messages per second
+        """
+        __drain_rate = self.drain_rate
+
+        with self.__condition:
+            return {
+                    "depth": self.depth,
+                    "unfinished": self.__unfinished,
+                    "sent": self.__sent,
+                    "failed": self.__failed,
+                    "dropped": self.__dropped,
+                    "drain_rate": __drain_rate}
+
+    def flush(self, timeout=None):
+        """
+        Wait until all queued messages are processed
+
+        :param float timeout: seconds to wait, None to wait forever
+        :return bool: False if timeout expired
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__unfinished, timeout=timeout)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting messages, send those already queued and stop background threads
+
+        :param float timeout: seconds to wait for queued messages, None to wait forever
+        :return bool: False if some messages were not processed before timeout
+        """
+        with self.__condition:
+            if self.__closed:
+                return not self.__unfinished
+
+            self.__closed = True
+
+        if not self.flush(timeout):
+            # workers keep sending in background
+            return False
+
+        for __worker in self.__workers:
+            self.__queue.put(None)
+
+        for __worker in self.__workers:
+            __worker.join()
+
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __work(self):
+        while True:
+            __envelope = self.__queue.get()
+
+            if __envelope is None:
+                return
+
+            try:
+                self.__smtp.sendmail(*__envelope)
+            except Exception as _e:
+                self.__report(_e, __envelope)
+                self.__done(failed=True)
+                continue
+
+            self.__done()
+
+    def __done(self, failed=False, dropped=False):
+        __now = time.monotonic()
+
+        with self.__condition:
+            self.__unfinished -= 1
+
+            if dropped:
+                self.__dropped += 1
+            else:
+                if failed:
+                    self.__failed += 1
+                else:
+                    self.__sent += 1
+
+                self.__completed.append(__now)
+                self.__prune(__now)
+
+            self.__condition.notify_all()
+
+    def __prune(self, now):
+        while self.__completed and now - self.__completed[0] > self.__rate_window:
+            self.__completed.popleft()
+
+    def __report(self, error, envelope):
+        if self.__on_error:
+            try:
+                self.__on_error(error, envelope[:3])
+                return
+            except Exception as _e:
+                error = _e
+
+        logging.getLogger(__name__).error("Message from '%s' to %s is not sent: %s", envelope[0], envelope[1], error)
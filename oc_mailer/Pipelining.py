@@ -0,0 +1,112 @@
+# coding=utf-8
+import smtplib
+
+from .Attachments import StreamedMessage, close_or_reset, execute, send_data, stream_sendmail
+
+
+class PipeliningSMTP(object):
+    """
+    Adapter of SMTP client or SMTPPool sending MAIL and all RCPT commands at once if server supports
+    ESMTP PIPELINING, see RFC 2920. Clients other than smtplib.SMTP are used as is.
+    Messages with attachments are streamed, see oc_mailer.Attachments.
+    """
+
+    def __init__(self, smtp_client):
+        """
+        Initialize.
+
+        :param smtp_client: SMTP client or SMTPPool
+        """
+        self.__smtp = smtp_client
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message, see smtplib.SMTP.sendmail
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        return execute(self.__smtp,
+                lambda _smtp: pipelined_sendmail(_smtp, from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+
+def pipelined_sendmail(smtp, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+    """
+    Send message pipelining MAIL and RCPT commands if server supports it.
+    Behaves exactly as smtplib.SMTP.sendmail, which is used if pipelining is not possible.
+
+    :param smtp: SMTP client
+    :return dict: refused recipients as returned by smtplib
+    """
+    if not isinstance(smtp, smtplib.SMTP):
+        return stream_sendmail(smtp, from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+    smtp.ehlo_or_helo_if_needed()
+
+    if not smtp.has_extn('pipelining'):
+        return stream_sendmail(smtp, from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+    if isinstance(msg, str):
+        msg = smtplib._fix_eols(msg).encode('ascii')
+
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    __mail_options = list()
+
+    if smtp.has_extn('size'):
+        __mail_options.append("size=%d" % len(msg))
+
+    __mail_options.extend(mail_options)
+
+    if any(_o.lower() == 'smtputf8' for _o in __mail_options):
+        if not smtp.has_extn('smtputf8'):
+            raise smtplib.SMTPNotSupportedError('SMTPUTF8 not supported by server')
+
+        smtp.command_encoding = 'utf-8'
+
+    __commands = ["mail FROM:%s%s" % (smtplib.quoteaddr(from_addr), _options_string(__mail_options))]
+    __rcpt_options = _options_string(rcpt_options)
+    __commands.extend("rcpt TO:%s%s" % (smtplib.quoteaddr(_a), __rcpt_options) for _a in to_addrs)
+    smtp.send("".join("%s\r\n" % _c for _c in __commands))
+
+    # replies come in order of commands, all of them must be read
+    __code, __response = smtp.getreply()
+    __replies = [smtp.getreply() for _a in to_addrs] if __code != 421 else list()
+
+    if __code != 250:
+        close_or_reset(smtp, __code)
+        raise smtplib.SMTPSenderRefused(__code, __response, from_addr)
+
+    __refused = dict()
+    __accepted = 0
+
+    for __address, (__code, __response) in zip(to_addrs, __replies):
+        if __code in (250, 251):
+            __accepted += 1
+        else:
+            __refused[__address] = (__code, __response)
+
+        if __code == 421:
+            smtp.close()
+            raise smtplib.SMTPRecipientsRefused(__refused)
+
+    if not __accepted:
+        # the server refused all our recipients
+        close_or_reset(smtp, 0)
+        raise smtplib.SMTPRecipientsRefused(__refused)
+
+    if isinstance(msg, StreamedMessage):
+        __code, __response = send_data(smtp, msg)
+    else:
+        __code, __response = smtp.data(msg)
+
+    if __code != 250:
+        close_or_reset(smtp, __code)
+        raise smtplib.SMTPDataError(__code, __response)
+
+    return __refused
+
+
+def _options_string(options):
+    return (' ' + ' '.join(options)) if options else ''
+
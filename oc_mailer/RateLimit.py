@@ -0,0 +1,273 @@
+# coding=utf-8
+import smtplib
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket with adaptive rate: the rate is cut by 'backoff' when the server throttles
+    sending and grows back by 'recovery' of the configured rate with each successful sending (AIMD).
+    Tokens are reserved ahead, so waiting callers are served in order of their reservations.
+    """
+
+    # seconds between two cuts of the rate, throttling replies of messages already in flight are ignored
+    BACKOFF_INTERVAL = 1.0
+
+    def __init__(self, rate, burst=None, backoff=0.5, recovery=0.05, min_factor=0.05):
+        """
+        Initialize.
+
+        :param float rate: configured number of tokens per second
+        :param float burst: capacity of the bucket, 'rate' (but at least one token) if omitted
+        :param float backoff: factor the rate is multiplied by when throttled
+        :param float recovery: part of the configured rate added with each success
+        :param float min_factor: minimal part of the configured rate
+        """
+        if rate <= 0 or (burst is not None and burst < 1):
+            raise ValueError('rate must be positive and burst must be at least 1')
+
+        if not 0 < backoff < 1 or recovery <= 0 or not 0 < min_factor <= 1:
+            raise ValueError('backoff and min_factor must be between 0 and 1, recovery must be positive')
+
+        self.__rate = float(rate)
+        self.__burst = float(burst if burst is not None else max(rate, 1))
+        self.__backoff = backoff
+        self.__recovery = recovery
+        self.__min_factor = min_factor
+        self.__lock = threading.Lock()
+        self.__factor = 1.0
+        self.__tokens = self.__burst
+        self.__updated = time.monotonic()
+        self.__backed_off = None
+
+    @property
+    def rate(self):
+        """
+        Current number of tokens per second
+        """
+        with self.__lock:
+            return self.__rate * self.__factor
+
+    def reserve(self, tokens=1):
+        """
+        Take tokens, the bucket may go into debt
+
+        :param float tokens: number of tokens
+        :return float: seconds to wait before the tokens are available
+        """
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= tokens
+
+            if self.__tokens >= 0:
+                return 0.0
+
+            return -self.__tokens / (self.__rate * self.__factor)
+
+    def throttled(self):
+        """
+        Cut the rate and take the tokens left since the server asked to slow down
+        """
+        __now = time.monotonic()
+
+        with self.__lock:
+            if self.__backed_off is not None and __now - self.__backed_off < self.BACKOFF_INTERVAL:
+                return
+
+            self.__refill()
+            self.__backed_off = __now
+            self.__factor = max(self.__min_factor, self.__factor * self.__backoff)
+            self.__tokens = min(self.__tokens, 0.0)
+
+    def succeeded(self):
+        """
+        Ramp the rate up after successful sending
+        """
+        with self.__lock:
+            if self.__factor < 1.0:
+                self.__refill()
+                self.__factor = min(1.0, self.__factor + self.__recovery)
+
+    def __refill(self):
+        __now = time.monotonic()
+        self.__tokens = min(self.__burst, self.__tokens + (__now - self.__updated) * self.__rate * self.__factor)
+        self.__updated = __now
+
+
+class RateLimiter(object):
+    """
+    Global and per destination domain limits of messages sent per second.
+    A message takes a token of the global bucket and of the bucket of each configured domain of its recipients.
+    Temporary (4xx) failures of recipients cut the rate of their domain, or the global one if their domain
+    is not configured; temporary failures of the whole message cut the global rate.
+    It may be shared by Mailers sending through the same relay and used by threads and coroutines at once.
+    """
+
+    def __init__(self, rate=None, burst=None, domains=None, **kwargs):
+        """
+        Initialize.
+
+        :param float rate: global number of messages per second, not limited if omitted
+        :param float burst: global number of messages sent at once before the rate applies
+        :param dict domains: destination mail domain to dictionary with 'rate' and optional 'burst'
+        :param kwargs: adaptation arguments of TokenBucket: backoff, recovery, min_factor
+        """
+        self.__global = TokenBucket(rate, burst, **kwargs) if rate else None
+        self.__domains = {_d.lower(): TokenBucket(_l["rate"], _l.get("burst"), **kwargs)
+                for _d, _l in (domains or dict()).items()}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create limiter from 'rate_limit' section of configuration
+
+        :param dict config: 'rate', 'burst', 'domains' and adaptation arguments, see RateLimiter and TokenBucket
+        :return RateLimiter: limiter
+        """
+        return cls(**config)
+
+    def rate(self, domain=None):
+        """
+        Get current rate
+
+        :param str domain: destination mail domain, the global rate is returned if omitted
+        :return float: messages per second, None if not limited
+        """
+        __bucket = self.__domains.get(domain.lower()) if domain else self.__global
+        return __bucket.rate if __bucket else None
+
+    def reserve(self, to_addresses):
+        """
+        Take tokens for a message
+
+        :param to_addresses: recipient address or list of them
+        :return float: seconds to wait before sending
+        """
+        return max([0.0] + [_b.reserve() for _b in self.__buckets(to_addresses)])
+
+    def acquire(self, to_addresses):
+        """
+        Wait until a message may be sent
+
+        :param to_addresses: recipient address or list of them
+        """
+        __delay = self.reserve(to_addresses)
+
+        if __delay > 0:
+            time.sleep(__delay)
+
+    async def acquire_async(self, to_addresses):
+        """
+        Wait until a message may be sent without blocking the event loop
+
+        :param to_addresses: recipient address or list of them
+        """
+        # imported here since asyncio is slow to import and is loaded by asynchronous callers anyway
+        import asyncio
+        __delay = self.reserve(to_addresses)
+
+        if __delay > 0:
+            await asyncio.sleep(__delay)
+
+    def report(self, to_addresses, refused=None, error=None):
+        """
+        Adapt rates to the outcome of sending a message
+
+        :param to_addresses: recipient address or list of them
+        :param dict refused: refused recipients as returned by smtplib: address to (code, response) mapping
+        :param Exception error: error raised by 'sendmail', of smtplib or of an asynchronous client (aiosmtplib)
+        """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            refused, error = error.recipients, None
+        elif isinstance(getattr(error, "recipients", None), list):
+            # aiosmtplib lists refused recipients with their replies
+            refused, error = {_r.recipient: (_r.code, _r.message) for _r in error.recipients}, None
+
+        if error is not None:
+            if _is_throttling(error):
+                self.__throttled(self.__global)
+
+            return
+
+        __throttled = [_a for _a, (_code, _response) in (refused or dict()).items() if 400 <= _code < 500]
+
+        for __address in __throttled:
+            self.__throttled(self.__domains.get(_get_domain(__address), self.__global))
+
+        if not __throttled:
+            for __bucket in self.__buckets(to_addresses):
+                __bucket.succeeded()
+
+    def __throttled(self, bucket):
+        if bucket is not None:
+            bucket.throttled()
+
+    def __buckets(self, to_addresses):
+        if isinstance(to_addresses, str):
+            to_addresses = [to_addresses]
+
+        __buckets = [self.__global] if self.__global else list()
+
+        if self.__domains:
+            for __domain in set(_get_domain(_a) for _a in to_addresses):
+                if __domain in self.__domains:
+                    __buckets.append(self.__domains[__domain])
+
+        return __buckets
+
+
+class RateLimitedSMTP(object):
+    """
+    Adapter of SMTP client waiting for RateLimiter before each 'sendmail' and reporting outcomes to it
+    """
+
+    def __init__(self, smtp_client, limiter):
+        """
+        Initialize.
+
+        :param smtp_client: SMTP client or another adapter
+        :param RateLimiter limiter: limiter
+        """
+        self.__smtp = smtp_client
+        self.__limiter = limiter
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Send message, see smtplib.SMTP.sendmail
+
+        :return dict: refused recipients as returned by smtplib
+        """
+        self.__limiter.acquire(to_addrs)
+
+        try:
+            if mail_options or rcpt_options:
+                __refused = self.__smtp.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+            else:
+                __refused = self.__smtp.sendmail(from_addr, to_addrs, msg)
+        except Exception as _e:
+            self.__limiter.report(to_addrs, error=_e)
+            raise
+
+        self.__limiter.report(to_addrs, refused=__refused)
+        return __refused
+
+
+def _is_throttling(error):
+    """
+    Check if error of the whole message means the server asks to slow down
+
+    :param Exception error: error raised by 'sendmail', of smtplib or of an asynchronous client (aiosmtplib)
+    :return bool: True for lost connection and 4xx replies
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError)):
+        # the server closes the connection after 421
+        return True
+
+    # reply code is 'smtp_code' of smtplib exceptions and 'code' of aiosmtplib ones
+    __code = getattr(error, "smtp_code", getattr(error, "code", None))
+    return isinstance(__code, int) and 400 <= __code < 500
+
+
+def _get_domain(address):
+    return address.rsplit('@', 1).pop().strip(' >').lower()
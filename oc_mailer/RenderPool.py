@@ -0,0 +1,188 @@
+# coding=utf-8
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .Mailer import Mailer, MailerError
+from .Metrics import MailerObserver
+import itertools
+import multiprocessing
+
+
+class RenderPool(object):
+    """
+    Pool of processes rendering messages for Mailer.send_many, so rendering of large campaigns is not limited
+    by a single core. Each process creates its own Mailer once from the arguments and the compiled profile
+    of the sending Mailer, messages are sent to processes and rendered in batches.
+    Processes are started by 'forkserver' where available, 'spawn' otherwise: forking the caller is unsafe
+    while its threads (e.g. of SMTPPool or hot reload) hold locks.
+    """
+
+    def __init__(self, mailer_arguments, processes=None, batch_size=32, observed=False):
+        """
+        Initialize.
+
+        :param dict mailer_arguments: picklable arguments of Mailer rendering messages, without SMTP client
+        :param int processes: number of processes, number of CPUs if omitted
+        :param int batch_size: number of messages rendered by a process at once
+        :param bool observed: record phases and sizes of rendering to replay them to an observer of the caller
+        """
+        self.__batch_size = batch_size
+        __method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.__executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(__method),
+                initializer=_initialize, initargs=(mailer_arguments, observed))
+
+    def render(self, messages, ahead, observer=None):
+        """
+        Render messages.
+        Batches are rendered in parallel while the caller processes results, at most about 'ahead' messages
+        are taken from the iterable and not yielded yet.
+
+        :param iterable messages: tuples of 'to_addresses', 'subject' and dictionary with mapping for substitution
+        :param int ahead: number of messages rendered ahead
+        :param MailerObserver observer: receiver of recorded phases and sizes, see 'observed'
+        :return generator: tuples of 'to_addresses' and future-like object of the message rendered,
+            see RenderedMessage, in order of the iterable
+        """
+        __messages = iter(messages)
+        __batches = deque()
+        __pending = 0
+
+        try:
+            while True:
+                while __pending < ahead:
+                    __batch = list(itertools.islice(__messages, min(self.__batch_size, ahead - __pending)))
+
+                    if not __batch:
+                        break
+
+                    __batches.append((self.__executor.submit(_render_batch, __batch), __batch))
+                    __pending += len(__batch)
+
+                if not __batches:
+                    return
+
+                __future, __batch = __batches.popleft()
+                __pending -= len(__batch)
+
+                for __index, (__to_addresses, __subject, __kwargs) in enumerate(__batch):
+                    yield __to_addresses, RenderedMessage(__future, __index, observer)
+        finally:
+            # the generator may be closed before all messages are rendered
+            for __future, __batch in __batches:
+                __future.cancel()
+
+    def close(self):
+        """
+        Stop processes
+        """
+        self.__executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RenderedMessage(object):
+    """
+    Message of a batch rendered by RenderPool
+    """
+
+    def __init__(self, batch, index, observer=None):
+        """
+        Initialize.
+
+        :param Future batch: future of the batch
+        :param int index: index of the message in the batch
+        :param MailerObserver observer: receiver of recorded phases and sizes
+        """
+        self.__batch = batch
+        self.__index = index
+        self.__observer = observer
+
+    def result(self):
+        """
+        Wait for the message
+
+        :return list: tuples of recipients and rendered message text, one for each chunk of recipients
+        """
+        __error, __emails, __events = self.__batch.result()[self.__index]
+        __observer, self.__observer = self.__observer, None
+
+        if __observer is not None:
+            # replayed once in the process of the caller
+            for __method, __args in __events:
+                getattr(__observer, __method)(*__args)
+
+        if __error is not None:
+            raise __error
+
+        return __emails
+
+
+class _Recorder(MailerObserver):
+    """
+    Observer of Mailer of a rendering process recording calls to replay them
+    """
+
+    def __init__(self):
+        self.events = list()
+
+    def on_phase(self, phase, seconds):
+        self.events.append(('on_phase', (phase, seconds)))
+
+    def on_message(self, recipients, size):
+        self.events.append(('on_message', (recipients, size)))
+
+    def on_error(self, error, recipients):
+        self.events.append(('on_error', (error, recipients)))
+
+
+class _NoSMTP(object):
+    """
+    SMTP client of Mailer of a rendering process, which never sends
+    """
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        raise MailerError('Cannot send email. Messages are sent by the caller of RenderPool.')
+
+
+# Mailer and recorder of the rendering process
+_mailer = None
+_recorder = None
+
+
+def _initialize(mailer_arguments, observed):
+    """
+    Create Mailer of the rendering process, called once in each process
+
+    :param dict mailer_arguments: arguments of Mailer
+    :param bool observed: record phases and sizes
+    """
+    global _mailer, _recorder
+    _recorder = _Recorder() if observed else None
+    _mailer = Mailer(_NoSMTP(), observer=_recorder, **mailer_arguments)
+
+
+def _render_batch(batch):
+    """
+    Render batch of messages in the rendering process
+
+    :param list batch: tuples of 'to_addresses', 'subject' and dictionary with mapping for substitution
+    :return list: tuples of exception or None, list of tuples of recipients and rendered message text
+        or None, recorded calls of observer
+    """
+    __results = list()
+
+    for __to_addresses, __subject, __kwargs in batch:
+        if _recorder is not None:
+            _recorder.events = list()
+
+        try:
+            # more than one message if recipients are split into chunks of 'max_recipients'
+            __emails = list(_mailer.render_email(__to_addresses, __subject, **(__kwargs or dict())))
+            __results.append((None, __emails, _recorder.events if _recorder else ()))
+        except Exception as _e:
+            __results.append((_e, None, _recorder.events if _recorder else ()))
+
+    return __results
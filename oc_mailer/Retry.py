@@ -0,0 +1,152 @@
+# coding=utf-8
+from .Mailer import SendResult, MailerArgumentError
+import random
+import smtplib
+import time
+
+
+class RetryPolicy(object):
+    """
+    Retrying of temporarily failed sending with exponential backoff and jitter.
+    Only recipients refused with a temporary (4xx) reply are retried, the same rendered message is sent again.
+    Recipients refused permanently (5xx) are not retried.
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=30.0, jitter=0.5):
+        """
+        Initialize.
+
+        :param int attempts: maximal number of sending attempts, including the first one
+        :param float base_delay: seconds to wait before the first retry, doubled for each next one
+        :param float max_delay: maximal seconds to wait between attempts
+        :param float jitter: fraction of a delay randomly subtracted from it, between 0 and 1
+        """
+        if attempts < 1:
+            raise MailerArgumentError('attempts must be positive')
+
+        if not 0 <= jitter <= 1:
+            raise MailerArgumentError('jitter must be between 0 and 1')
+
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry):
+        """
+        Get delay before a retry
+
+        :param int retry: number of the retry, starting from 0
+        :return float: seconds to wait
+        """
+        __delay = min(self.max_delay, self.base_delay * (2 ** retry))
+        return __delay * (1 - self.jitter * random.random())
+
+    def deliver(self, smtp, from_addr, to_addrs, msg):
+        """
+        Send message retrying temporarily failed recipients.
+        Errors not related to particular recipients are raised if permanent or if attempts are exhausted.
+
+        :param smtp: SMTP client
+        :param str from_addr: sender address
+        :param to_addrs: recipient address or list of them, passed to 'sendmail' as is on the first attempt
+        :param str msg: rendered message
+        :return SendResult: recipients the message was not accepted for are in 'refused'
+        """
+        __attempts = self.__attempts(to_addrs)
+        __outcome = None
+
+        try:
+            while True:
+                __delay, __recipients = __attempts.send(__outcome)
+
+                if __delay:
+                    time.sleep(__delay)
+
+                try:
+                    __outcome = smtp.sendmail(from_addr, __recipients, msg)
+                except Exception as _e:
+                    __outcome = _e
+        except StopIteration as _stop:
+            return _stop.value
+
+    async def deliver_async(self, smtp, from_addr, to_addrs, msg):
+        """
+        Send message with asynchronous SMTP client retrying temporarily failed recipients, see 'deliver'.
+        The event loop keeps running while waiting between attempts.
+
+        :param smtp: asynchronous SMTP client with 'sendmail' coroutine returning refused recipients
+        :return SendResult: recipients the message was not accepted for are in 'refused'
+        """
+        # imported here since asyncio is slow to import and is loaded by asynchronous callers anyway
+        import asyncio
+        __attempts = self.__attempts(to_addrs)
+        __outcome = None
+
+        try:
+            while True:
+                __delay, __recipients = __attempts.send(__outcome)
+
+                if __delay:
+                    await asyncio.sleep(__delay)
+
+                try:
+                    __outcome = await smtp.sendmail(from_addr, __recipients, msg)
+                except Exception as _e:
+                    __outcome = _e
+        except StopIteration as _stop:
+            return _stop.value
+
+    def __attempts(self, to_addrs):
+        """
+        Plan attempts of sending, shared by blocking and asynchronous delivery
+
+        :param to_addrs: recipient address or list of them, passed to 'sendmail' as is on the first attempt
+        :return generator: yields delay and recipients of the next attempt, receives refused recipients
+            or exception raised by 'sendmail', returns SendResult; errors which are not retried are raised
+        """
+        __remaining = to_addrs if isinstance(to_addrs, list) else [to_addrs]
+        __refused = dict()
+        __failed = dict()
+        __attempt = 0
+
+        while __remaining and __attempt < self.attempts:
+            __delay = self.delay(__attempt - 1) if __attempt else 0
+            __attempt += 1
+            __exhausted = __attempt >= self.attempts
+            __outcome = yield __delay, (__remaining if __attempt > 1 else to_addrs)
+
+            if isinstance(__outcome, smtplib.SMTPRecipientsRefused):
+                __failed = __outcome.recipients
+            elif isinstance(__outcome, smtplib.SMTPResponseException):
+                if __exhausted or not is_temporary(__outcome.smtp_code):
+                    raise __outcome
+
+                continue
+            elif isinstance(__outcome, (smtplib.SMTPServerDisconnected, OSError)):
+                if __exhausted:
+                    raise __outcome
+
+                continue
+            elif isinstance(__outcome, BaseException):
+                raise __outcome
+            else:
+                __failed = __outcome
+
+            __failed = dict(__failed or dict())
+            __refused.update((_a, _r) for _a, _r in __failed.items() if not is_temporary(_r[0]))
+            __remaining = [_a for _a in __remaining if _a in __failed and is_temporary(__failed[_a][0])]
+
+        # still failing after the last attempt
+        __refused.update((_a, __failed[_a]) for _a in __remaining)
+        return SendResult(to_addrs, refused=__refused, attempts=__attempt)
+
+
+def is_temporary(code):
+    """
+    Check SMTP reply code means a temporary failure
+
+    :param int code: SMTP reply code
+    :return bool: True for 4xx codes
+    """
+    return 400 <= code < 500
@@ -0,0 +1,345 @@
+# coding=utf-8
+from .Mailer import MailerError, MailerArgumentError
+import json
+import logging
+import os
+import smtplib
+import struct
+import threading
+import zlib
+
+
+class Spool(object):
+    """
+    Durable on-disk spool of rendered messages.
+    It provides 'sendmail' so it may be given to Mailer instead of SMTP client: rendered messages are appended
+    to segment files and delivered later by 'drain' in batches, so they survive a crash of the process
+    and are never rendered again.
+
+    Each record of a segment is: header length, message length and CRC32 of both (big-endian unsigned 32-bit),
+    JSON header with envelope and the message itself. Delivery progress of a segment is kept in a separate
+    position file. Delivered segments are removed.
+    """
+
+    _RECORD = struct.Struct(">III")
+    _SEGMENT_SUFFIX = ".seg"
+    _POSITION_SUFFIX = ".pos"
+
+    def __init__(self, directory, smtp_client, segment_size=16 * 1024 * 1024, batch_size=100,
+            fsync_every=100, fsync_interval=1.0, drain_interval=None, on_error=None):
+        """
+        Initialize.
+
+        :param str directory: spool directory, it is created if absent; one Spool per directory at once
+        :param smtp_client: SMTP client to deliver messages with, e.g. SMTPPool
+        :param int segment_size: size in bytes after which the next segment file is started
+        :param int batch_size: number of messages delivered between saving delivery progress
+        :param int fsync_every: number of appended messages after which the segment is synced to disk
+        :param float fsync_interval: seconds after which appended messages are synced to disk at the latest
+        :param float drain_interval: seconds between deliveries by background thread, None to call 'drain' manually
+        :param callable on_error: function receiving exception and (from_addr, to_addrs, msg) tuple
+            of a message permanently failed or refused for some recipients; errors are logged if omitted
+        """
+        if not directory or not smtp_client:
+            raise MailerArgumentError('directory and smtp_client must not be empty')
+
+        if segment_size < 1 or batch_size < 1 or fsync_every < 1:
+            raise MailerArgumentError('segment_size, batch_size and fsync_every must be positive')
+
+        self.__directory = os.path.abspath(directory)
+        self.__smtp = smtp_client
+        self.__segment_size = segment_size
+        self.__batch_size = batch_size
+        self.__fsync_every = fsync_every
+        self.__fsync_interval = fsync_interval
+        self.__on_error = on_error
+        self.__write_lock = threading.Lock()
+        self.__drain_lock = threading.Lock()
+        self.__unsynced = 0
+        self.__sync_timer = None
+        self.__closed = False
+        os.makedirs(self.__directory, exist_ok=True)
+
+        # segments of the previous run are replayed, new messages always go to a new segment
+        __segments = self.__list_segments()
+        self.__sequence = (__segments[-1] + 1) if __segments else 0
+        self.__active = None
+        self.__active_sequence = None
+        self.__open_segment()
+
+        self.__wakeup = threading.Event()
+        self.__drainer = None
+
+        if drain_interval:
+            self.__drain_interval = drain_interval
+            self.__drainer = threading.Thread(target=self.__drain_forever, name="oc-mailer-spool", daemon=True)
+            self.__drainer.start()
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Append message to the spool
+
+        :return dict: always empty since recipients are not known to be refused yet
+        """
+        __header = json.dumps({
+            "from": from_addr,
+            "to": to_addrs,
+            "text": isinstance(msg, str),
+            "mail_options": list(mail_options),
+            "rcpt_options": list(rcpt_options)}).encode("utf-8")
+
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8", "surrogateescape")
+
+        __crc = zlib.crc32(msg, zlib.crc32(__header))
+        __record = self._RECORD.pack(len(__header), len(msg), __crc) + __header + msg
+
+        with self.__write_lock:
+            if self.__closed:
+                raise MailerError('Cannot send email. Spool is already closed.')
+
+            # the record reaches the OS at once, so it survives a crash of the process; only fsync is batched
+            self.__active.write(__record)
+            self.__active.flush()
+            self.__unsynced += 1
+
+            if self.__unsynced >= self.__fsync_every:
+                self.__sync()
+            elif self.__sync_timer is None and self.__fsync_interval:
+                # without further messages the batch is synced by the timer
+                self.__sync_timer = threading.Timer(self.__fsync_interval, self.sync)
+                self.__sync_timer.daemon = True
+                self.__sync_timer.start()
+
+            if self.__active.tell() >= self.__segment_size:
+                self.__sync()
+                self.__active.close()
+                self.__open_segment()
+
+        return dict()
+
+    def sync(self):
+        """
+        Write appended messages to disk
+        """
+        with self.__write_lock:
+            if not self.__closed and self.__unsynced:
+                self.__sync()
+
+    def pending(self):
+        """
+        Count messages not delivered yet
+
+        :return int: number of messages
+        """
+        self.sync()
+        return sum(len(list(self.__read_records(_s, self.__read_position(_s)))) for _s in self.__list_segments())
+
+    def drain(self):
+        """
+        Deliver spooled messages in batches over the SMTP client.
+        Delivery stops on a temporary error (connection lost, 4xx response), the message is retried
+        on the next call. Permanently failed messages are reported and skipped.
+
+        :return int: number of processed messages
+        """
+        __processed = 0
+
+        with self.__drain_lock:
+            self.sync()
+
+            for __sequence in self.__list_segments():
+                __position = self.__read_position(__sequence)
+                __batch = 0
+
+                with self.__write_lock:
+                    # records appended while reading are left for the next call, the segment may be rotated
+                    # meanwhile, so only segments rotated before reading are removed
+                    __active = (__sequence == self.__active_sequence)
+                    __size = self.__active.tell() if __active and not self.__closed else None
+
+                try:
+                    for __end, __envelope in self.__read_records(__sequence, __position, __size):
+                        self.__deliver(__envelope)
+                        __processed += 1
+                        __batch += 1
+                        __position = __end
+
+                        if __batch >= self.__batch_size:
+                            self.__write_position(__sequence, __position)
+                            __batch = 0
+                except _TemporaryError as _e:
+                    logging.getLogger(__name__).warning("Spool delivery is postponed: %s", _e.error)
+                    self.__write_position(__sequence, __position)
+                    return __processed
+
+                if __active:
+                    self.__write_position(__sequence, __position)
+                else:
+                    self.__compact(__sequence)
+
+        return __processed
+
+    def close(self, drain=True):
+        """
+        Stop background delivery and close the spool
+
+        :param bool drain: deliver spooled messages before closing
+        """
+        with self.__write_lock:
+            if self.__closed:
+                return
+
+            self.__sync()
+
+        if self.__drainer:
+            self.__drain_interval = None
+            self.__wakeup.set()
+            self.__drainer.join()
+
+        if drain:
+            self.drain()
+
+        with self.__write_lock:
+            self.__closed = True
+            self.__active.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __drain_forever(self):
+        while self.__drain_interval:
+            self.__wakeup.wait(self.__drain_interval)
+            self.__wakeup.clear()
+
+            try:
+                self.drain()
+            except Exception as _e:
+                logging.getLogger(__name__).exception("Spool delivery failed: %s", _e)
+
+    def __deliver(self, envelope):
+        """
+        Deliver single message
+
+        :param tuple envelope: sendmail arguments
+        """
+        try:
+            __refused = self.__smtp.sendmail(*envelope)
+        except smtplib.SMTPRecipientsRefused as _e:
+            if any(_code < 500 for _code, _response in _e.recipients.values()):
+                raise _TemporaryError(_e)
+
+            self.__report(_e, envelope)
+            return
+        except smtplib.SMTPResponseException as _e:
+            if _e.smtp_code < 500:
+                raise _TemporaryError(_e)
+
+            self.__report(_e, envelope)
+            return
+        except (smtplib.SMTPException, OSError) as _e:
+            raise _TemporaryError(_e)
+
+        if __refused:
+            self.__report(smtplib.SMTPRecipientsRefused(__refused), envelope)
+
+    def __report(self, error, envelope):
+        if self.__on_error:
+            try:
+                self.__on_error(error, envelope[:3])
+                return
+            except Exception as _e:
+                error = _e
+
+        logging.getLogger(__name__).error("Message from '%s' to %s is not sent: %s", envelope[0], envelope[1], error)
+
+    def __sync(self):
+        self.__active.flush()
+        os.fsync(self.__active.fileno())
+        self.__unsynced = 0
+
+        if self.__sync_timer is not None:
+            self.__sync_timer.cancel()
+            self.__sync_timer = None
+
+        # the batch is on disk, background delivery may start
+        self.__wakeup.set()
+
+    def __open_segment(self):
+        self.__active_sequence = self.__sequence
+        self.__active = open(self.__segment_path(self.__sequence), mode='ab')
+        self.__sequence += 1
+
+    def __segment_path(self, sequence):
+        return os.path.join(self.__directory, "%020d%s" % (sequence, self._SEGMENT_SUFFIX))
+
+    def __position_path(self, sequence):
+        return os.path.join(self.__directory, "%020d%s" % (sequence, self._POSITION_SUFFIX))
+
+    def __list_segments(self):
+        return sorted(int(_fn[:-len(self._SEGMENT_SUFFIX)]) for _fn in os.listdir(self.__directory)
+                if _fn.endswith(self._SEGMENT_SUFFIX))
+
+    def __read_position(self, sequence):
+        try:
+            with open(self.__position_path(sequence), mode='rt') as _f:
+                return int(_f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def __write_position(self, sequence, position):
+        __path = self.__position_path(sequence)
+
+        with open(__path + ".tmp", mode='wt') as _f:
+            _f.write(str(position))
+            _f.flush()
+            os.fsync(_f.fileno())
+
+        os.replace(__path + ".tmp", __path)
+
+    def __compact(self, sequence):
+        for __path in [self.__segment_path(sequence), self.__position_path(sequence)]:
+            if os.path.exists(__path):
+                os.remove(__path)
+
+    def __read_records(self, sequence, position, size=None):
+        """
+        Read records of a segment, incomplete or corrupted tail is ignored
+
+        :param int sequence: segment sequence number
+        :param int position: offset of the first record to read
+        :param int size: offset to stop reading at, the end of the file if omitted
+        :return generator: tuples of the record end offset and sendmail arguments
+        """
+        with open(self.__segment_path(sequence), mode='rb') as _f:
+            _f.seek(position)
+
+            while size is None or _f.tell() < size:
+                __prefix = _f.read(self._RECORD.size)
+
+                if len(__prefix) < self._RECORD.size:
+                    return
+
+                __header_length, __msg_length, __crc = self._RECORD.unpack(__prefix)
+                __header = _f.read(__header_length)
+                __msg = _f.read(__msg_length)
+
+                if len(__msg) < __msg_length or zlib.crc32(__msg, zlib.crc32(__header)) != __crc:
+                    return
+
+                __header = json.loads(__header.decode("utf-8"))
+
+                if __header["text"]:
+                    __msg = __msg.decode("utf-8", "surrogateescape")
+
+                yield _f.tell(), (__header["from"], __header["to"], __msg,
+                        __header["mail_options"], __header["rcpt_options"])
+
+
+class _TemporaryError(Exception):
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
@@ -0,0 +1,408 @@
+# coding=utf-8
+from .Attachments import StreamedMessage
+from .Mailer import MailerError, MailerArgumentError
+import logging
+import mailbox
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+
+
+class Transport(object):
+    """
+    Base of transports Mailer may be given instead of SMTP client: messages are rendered the same way
+    and passed to 'sendmail' as they are - str, bytes with 8bit bodies ('eight_bit') or StreamedMessage
+    (attachments), see 'message_chunks'. smtplib.SMTP and SMTPPool are the SMTP transport.
+    """
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Deliver message
+
+        :param str from_addr: envelope sender
+        :param to_addrs: envelope recipient or list of them
+        :param msg: rendered message
+        :return dict: refused recipients as returned by smtplib
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """
+        Deliver messages buffered by the transport
+        """
+        pass
+
+    def close(self):
+        """
+        Deliver buffered messages and stop accepting new ones
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemoryTransport(Transport):
+    """
+    In-memory sink for tests and benchmarks: messages are kept as they are passed, without copying.
+    It is thread-safe.
+    """
+
+    def __init__(self, keep=True):
+        """
+        Initialize.
+
+        :param bool keep: keep messages, only count them otherwise
+        """
+        self.__keep = keep
+        self.__lock = threading.Lock()
+        self.__messages = list()
+        self.__count = 0
+        self.__size = 0
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Keep message, see Transport.sendmail
+        """
+        with self.__lock:
+            self.__count += 1
+            self.__size += len(msg)
+
+            if self.__keep:
+                self.__messages.append((from_addr, to_addrs, msg))
+
+        return dict()
+
+    @property
+    def messages(self):
+        """
+        Kept messages
+
+        :return list: tuples of from_addr, to_addrs and msg as passed to 'sendmail'
+        """
+        with self.__lock:
+            return list(self.__messages)
+
+    def stats(self):
+        """
+        Get counters
+
+        :return dict: 'messages' - number of messages, 'bytes' - their total length
+        """
+        with self.__lock:
+            return {"messages": self.__count, "bytes": self.__size}
+
+    def clear(self):
+        """
+        Forget kept messages and reset counters
+        """
+        with self.__lock:
+            self.__messages = list()
+            self.__count = 0
+            self.__size = 0
+
+
+class _BatchTransport(Transport):
+    """
+    Transport buffering messages and writing them in batches.
+    Buffered messages are lost if the process exits before 'flush' or 'close'. Messages with attachments
+    (StreamedMessage) are not buffered: attachments are read while 'sendmail' is called.
+    """
+
+    def __init__(self, batch_size, on_error=None):
+        if batch_size < 1:
+            raise MailerArgumentError('batch_size must be positive')
+
+        self.__batch_size = batch_size
+        self.__on_error = on_error
+        self.__lock = threading.Lock()
+        self.__batch = list()
+        self.__closed = False
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """
+        Buffer message, the batch is written when it is full, see Transport.sendmail
+        """
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+
+        with self.__lock:
+            if self.__closed:
+                raise MailerError('Cannot send email. Transport is already closed.')
+
+            if isinstance(msg, StreamedMessage):
+                # files of attachments may be gone when the batch is written, buffered messages go first
+                self.__flush()
+
+                __failed = self._write([(from_addr, to_addrs, msg)])
+
+                if __failed:
+                    raise __failed[0][1]
+
+                return dict()
+
+            self.__batch.append((from_addr, to_addrs, msg))
+
+            if len(self.__batch) >= self.__batch_size:
+                self.__flush()
+
+        return dict()
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            self.__flush()
+
+    def __flush(self):
+        __batch, self.__batch = self.__batch, list()
+
+        if __batch:
+            for __message, __error in self._write(__batch):
+                self.__report(__error, __message)
+
+    def __report(self, error, message):
+        if self.__on_error:
+            try:
+                self.__on_error(error, message)
+                return
+            except Exception as _e:
+                error = _e
+
+        logging.getLogger(__name__).error("Message from '%s' to %s is not written: %s", message[0], message[1],
+                error)
+
+    def _write(self, batch):
+        """
+        Write batch of messages, called with the lock held. A failed message does not stop writing the rest.
+
+        :param list batch: tuples of from_addr, list of to_addrs and msg
+        :return list: tuples of failed message and exception
+        """
+        __failed = list()
+
+        for __message in batch:
+            try:
+                self._write_message(*__message)
+            except Exception as _e:
+                __failed.append((__message, _e))
+
+        return __failed
+
+    def _write_message(self, from_addr, to_addrs, msg):
+        """
+        Write single message
+
+        :param str from_addr: envelope sender
+        :param list to_addrs: envelope recipients
+        :param msg: rendered message
+        """
+        raise NotImplementedError()
+
+
+class PickupDirectoryTransport(_BatchTransport):
+    """
+    Transport writing messages as files into the pickup directory of a local MTA, e.g. IIS SMTP or Exchange.
+    Each message is written into a temporary file and renamed into the directory, so the MTA never picks up
+    a partial one. The envelope is written as 'X-Sender' and 'X-Receiver' headers before the message.
+    """
+
+    def __init__(self, directory, batch_size=100, fsync=False, suffix=".eml", envelope=True, on_error=None):
+        """
+        Initialize.
+
+        :param str directory: pickup directory, it is created if absent
+        :param int batch_size: number of messages buffered before writing them
+        :param bool fsync: sync files and the directory to disk after each batch
+        :param str suffix: suffix of file names
+        :param bool envelope: write envelope headers
+        :param callable on_error: function receiving exception and (from_addr, to_addrs, msg) tuple
+            of a buffered message failed to be written; errors are logged if omitted
+        """
+        if not directory:
+            raise MailerArgumentError('directory must not be empty')
+
+        _BatchTransport.__init__(self, batch_size, on_error)
+        self.__directory = os.path.abspath(directory)
+        # inside the pickup directory, so renaming is atomic; MTAs do not pick up directories
+        self.__temp_directory = os.path.join(self.__directory, ".oc-mailer-tmp")
+        self.__fsync = fsync
+        self.__suffix = suffix
+        self.__envelope = envelope
+        os.makedirs(self.__temp_directory, exist_ok=True)
+
+    def _write(self, batch):
+        __failed = _BatchTransport._write(self, batch)
+
+        if self.__fsync:
+            _fsync_directory(self.__directory)
+
+        return __failed
+
+    def _write_message(self, from_addr, to_addrs, msg):
+        __name = uuid.uuid4().hex + self.__suffix
+        __chunks = message_chunks(msg)
+
+        if self.__envelope:
+            __chunks = _prepend(_envelope_headers(from_addr, to_addrs), __chunks)
+
+        _write_file(os.path.join(self.__temp_directory, __name), os.path.join(self.__directory, __name),
+                __chunks, self.__fsync)
+
+
+class MaildirTransport(_BatchTransport):
+    """
+    Transport delivering messages into a Maildir: each message is written into 'tmp' and renamed into 'new'.
+    Messages get 'Return-Path' header with the envelope sender and local line breaks.
+    """
+
+    def __init__(self, path, batch_size=100, fsync=False, on_error=None):
+        """
+        Initialize.
+
+        :param str path: path to the Maildir, it is created if absent
+        :param int batch_size: number of messages buffered before writing them
+        :param bool fsync: sync files and 'new' directory to disk after each batch
+        :param callable on_error: function receiving exception and (from_addr, to_addrs, msg) tuple
+            of a buffered message failed to be written; errors are logged if omitted
+        """
+        if not path:
+            raise MailerArgumentError('path must not be empty')
+
+        _BatchTransport.__init__(self, batch_size, on_error)
+        self.__path = os.path.abspath(path)
+        self.__fsync = fsync
+        self.__host = socket.gethostname().replace('/', r'\057').replace(':', r'\072')
+
+        for __subdirectory in ['tmp', 'new', 'cur']:
+            os.makedirs(os.path.join(self.__path, __subdirectory), exist_ok=True)
+
+    def _write(self, batch):
+        __failed = _BatchTransport._write(self, batch)
+
+        if self.__fsync:
+            _fsync_directory(os.path.join(self.__path, 'new'))
+
+        return __failed
+
+    def _write_message(self, from_addr, to_addrs, msg):
+        __name = "%d.%s.%s" % (time.time(), uuid.uuid4().hex, self.__host)
+        __chunks = _prepend(b"Return-Path: <%s>\n" % from_addr.encode('utf-8'),
+                (_c.replace(b'\r\n', b'\n') for _c in message_chunks(msg)))
+        _write_file(os.path.join(self.__path, 'tmp', __name), os.path.join(self.__path, 'new', __name),
+                __chunks, self.__fsync)
+
+
+class MboxTransport(_BatchTransport):
+    """
+    Transport appending messages to an mbox file, locked for each batch, see mailbox.mbox.
+    'From ' line of each message has the envelope sender.
+    """
+
+    def __init__(self, path, batch_size=100, on_error=None):
+        """
+        Initialize.
+
+        :param str path: path to the mbox file, it is created if absent
+        :param int batch_size: number of messages buffered before writing them
+        :param callable on_error: function receiving exception and (from_addr, to_addrs, msg) tuple
+            of a buffered message failed to be written; errors are logged if omitted
+        """
+        if not path:
+            raise MailerArgumentError('path must not be empty')
+
+        _BatchTransport.__init__(self, batch_size, on_error)
+        self.__mbox = mailbox.mbox(os.path.abspath(path), create=True)
+
+    def _write(self, batch):
+        self.__mbox.lock()
+
+        try:
+            __failed = _BatchTransport._write(self, batch)
+            self.__mbox.flush()
+        finally:
+            self.__mbox.unlock()
+
+        return __failed
+
+    def _write_message(self, from_addr, to_addrs, msg):
+        # the whole message is needed since mailbox escapes 'From ' lines of the body
+        __text = b"".join(message_chunks(msg)).replace(b'\r\n', b'\n')
+        self.__mbox.add(b"From %s %s\n" % (from_addr.encode('utf-8'), time.asctime(time.gmtime()).encode('ascii'))
+                + __text)
+
+    def close(self):
+        try:
+            _BatchTransport.close(self)
+        finally:
+            self.__mbox.close()
+
+
+def message_chunks(msg):
+    """
+    Get content of rendered message, attachments of StreamedMessage are read while iterating
+
+    :param msg: str, bytes or StreamedMessage
+    :return iterable: bytes chunks with CRLF line breaks
+    """
+    if isinstance(msg, StreamedMessage):
+        return msg.chunks()
+
+    if isinstance(msg, str):
+        msg = msg.encode('utf-8')
+
+    return [re.sub(br'(?:\r\n|\n|\r(?!\n))', b'\r\n', msg)]
+
+
+def _envelope_headers(from_addr, to_addrs):
+    return ("X-Sender: <%s>\r\n" % from_addr + "".join(
+            "X-Receiver: <%s>\r\n" % _a for _a in to_addrs)).encode('utf-8')
+
+
+def _prepend(chunk, chunks):
+    yield chunk
+    yield from chunks
+
+
+def _write_file(temp_path, path, chunks, fsync):
+    """
+    Write file atomically: into a temporary file renamed then
+
+    :param str temp_path: path to the temporary file on the same file system
+    :param str path: path to the file
+    :param iterable chunks: bytes chunks of content
+    :param bool fsync: sync the file to disk before renaming
+    """
+    try:
+        with open(temp_path, mode='wb') as _f:
+            for __chunk in chunks:
+                _f.write(__chunk)
+
+            if fsync:
+                _f.flush()
+                os.fsync(_f.fileno())
+
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        raise
+
+
+def _fsync_directory(directory):
+    __fd = os.open(directory, os.O_RDONLY)
+
+    try:
+        os.fsync(__fd)
+    finally:
+        os.close(__fd)
@@ -0,0 +1,170 @@
+import socket
+import socketserver
+import threading
+
+
+class FakeSMTPServer(object):
+    """
+    Minimal SMTP server on loopback interface, accepts everything and keeps received messages in memory
+    """
+
+    def __init__(self, extensions=("PIPELINING", "8BITMIME", "SMTPUTF8"), refused=None, keep_messages=True):
+        """
+        Initialize.
+
+        :param list extensions: ESMTP extensions advertised in EHLO response
+        :param dict refused: recipient address to (code, message) to reply on RCPT
+        :param bool keep_messages: keep received messages, only count them otherwise
+        """
+        self.extensions = list(extensions)
+        self.refused = dict(refused or {})
+        self.keep_messages = keep_messages
+        self.received = 0
+        self.messages = list()
+        self.commands = list()
+        self.connections = 0
+        self.active = set()
+        self.lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+
+    @property
+    def address(self):
+        return self.__server.server_address
+
+    def start(self):
+        _owner = self
+
+        class _Handler(_SMTPHandler):
+            owner = _owner
+
+        self.__server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.disconnect_all()
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def disconnect_all(self):
+        """
+        Drop all client connections as a server restart does
+        """
+        with self.lock:
+            _active = list(self.active)
+
+        for _sock in _active:
+            try:
+                _sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    owner = None
+
+    def reply(self, code, text):
+        self.wfile.write(("%d %s\r\n" % (code, text)).encode("utf-8"))
+
+    def handle(self):
+        with self.owner.lock:
+            self.owner.connections += 1
+            self.owner.active.add(self.request)
+
+        try:
+            self.session()
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.owner.lock:
+                self.owner.active.discard(self.request)
+
+    def session(self):
+        self.reply(220, "localhost fake SMTP")
+        _mail_from = None
+        _rcpt_tos = list()
+
+        while True:
+            _line = self.rfile.readline()
+
+            if not _line:
+                return
+
+            _line = _line.decode("utf-8", "surrogateescape").rstrip("\r\n")
+            _command = _line.split(" ", 1)[0].upper()
+
+            with self.owner.lock:
+                self.owner.commands.append(_line)
+
+            if _command == "EHLO":
+                _lines = ["localhost"] + self.owner.extensions
+                for _ext in _lines[:-1]:
+                    self.wfile.write(("250-%s\r\n" % _ext).encode("utf-8"))
+                self.reply(250, _lines[-1])
+            elif _command == "HELO":
+                self.reply(250, "localhost")
+            elif _command == "MAIL":
+                _mail_from = _line.split(":", 1)[1].strip().split(" ")[0].strip("<>")
+                _rcpt_tos = list()
+                self.reply(250, "OK")
+            elif _command == "RCPT":
+                _rcpt_to = _line.split(":", 1)[1].strip().split(" ")[0].strip("<>")
+                _refused = self.owner.refused.get(_rcpt_to)
+
+                if _refused:
+                    self.reply(*_refused)
+                    continue
+
+                _rcpt_tos.append(_rcpt_to)
+                self.reply(250, "OK")
+            elif _command == "DATA":
+                if not _rcpt_tos:
+                    self.reply(503, "No valid recipients")
+                    continue
+
+                self.reply(354, "End data with <CR><LF>.<CR><LF>")
+                _data = list()
+
+                while True:
+                    _data_line = self.rfile.readline()
+
+                    if not _data_line:
+                        return
+
+                    if _data_line in (b".\r\n", b".\n"):
+                        break
+
+                    if _data_line.startswith(b"."):
+                        _data_line = _data_line[1:]
+
+                    _data.append(_data_line)
+
+                with self.owner.lock:
+                    self.owner.received += 1
+
+                    if self.owner.keep_messages:
+                        self.owner.messages.append((_mail_from, _rcpt_tos, b"".join(_data)))
+
+                _mail_from = None
+                _rcpt_tos = list()
+                self.reply(250, "OK queued")
+            elif _command == "RSET":
+                _mail_from = None
+                _rcpt_tos = list()
+                self.reply(250, "OK")
+            elif _command == "NOOP":
+                self.reply(250, "OK")
+            elif _command == "QUIT":
+                self.reply(221, "Bye")
+                return
+            else:
+                self.reply(502, "Command not implemented")
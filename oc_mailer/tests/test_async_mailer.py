@@ -0,0 +1,166 @@
+import unittest
+import unittest.mock
+
+import asyncio
+import os
+import smtplib
+import time
+
+import oc_mailer.Mailer
+import oc_mailer.AsyncMailer
+import oc_mailer.Retry
+from oc_mailer.RateLimit import RateLimiter
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+
+class SlowAsyncSMTP(object):
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = list()
+        self.closed = False
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        await asyncio.sleep(self.delay)
+        self.sent.append((from_addr, to_addrs, msg))
+        return dict()
+
+    async def close(self):
+        self.closed = True
+
+
+class AiosmtplibSMTP(object):
+    """
+    Client returning the same as aiosmtplib.SMTP.sendmail: refused recipients and the server response
+    """
+
+    def __init__(self, refused=None, errors=()):
+        self.sent = list()
+        self.refused = list(refused or ())
+        self.errors = list(errors)
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        self.sent.append(to_addrs)
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return (self.refused.pop(0) if self.refused else dict()), "250 OK"
+
+
+class TestAsyncMailer(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+        self._loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self._loop.close()
+
+    def test_native_client__concurrent(self):
+        _smtp = SlowAsyncSMTP(0.2)
+        _mailer = oc_mailer.AsyncMailer.AsyncMailer(_smtp, "from@html.example.com", config_path=self._config_pth)
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(200)]
+        _started = time.monotonic()
+        self._loop.run_until_complete(_mailer.send_email(_to_addresses, "Test subject", split=True, text="test"))
+
+        # sent at once, not one after another
+        self.assertLess(time.monotonic() - _started, 2)
+        self.assertEqual(sorted(_to_addresses), sorted(_s[1] for _s in _smtp.sent))
+        self.assertTrue(all(_s[0] == "from@html.example.com" for _s in _smtp.sent))
+        self.assertTrue(all("Content-ID: <signature_image>" in _s[2] for _s in _smtp.sent))
+
+        self._loop.run_until_complete(_mailer.close())
+        self.assertTrue(_smtp.closed)
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            self._loop.run_until_complete(_mailer.send_email("to@example.com", "Test subject", text="test"))
+
+    def test_same_rendering(self):
+        _smtp = unittest.mock.MagicMock()
+        _async_smtp = SlowAsyncSMTP(0)
+        _mailer = oc_mailer.Mailer.Mailer(_smtp, "from@plain.example.com", config_path=self._config_pth)
+        _async_mailer = oc_mailer.AsyncMailer.AsyncMailer(_async_smtp, "from@plain.example.com",
+                config_path=self._config_pth)
+
+        with unittest.mock.patch("email.generator.Generator._make_boundary", return_value="===boundary=="):
+            _mailer.send_email(["to-first@example.com", "to-second@example.com"], "Test subject", text="test")
+            self._loop.run_until_complete(_async_mailer.send_email(
+                ["to-first@example.com", "to-second@example.com"], "Test subject", text="test"))
+
+        _smtp.sendmail.assert_called_once_with(*_async_smtp.sent[0])
+
+    def test_blocking_client(self):
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            oc_mailer.AsyncMailer.AsyncMailer(unittest.mock.MagicMock(), "from@example.com")
+
+    def test_executor(self):
+        with FakeSMTPServer() as _server:
+            _mailer = oc_mailer.AsyncMailer.AsyncMailer.from_factory(lambda: smtplib.SMTP(*_server.address),
+                    "from@plain.example.com", connections=3, config_path=self._config_pth, render_once=True)
+            _to_addresses = ["to-%d@example.com" % _i for _i in range(50)]
+
+            async def _send():
+                await asyncio.gather(
+                        _mailer.send_email(_to_addresses[:25], "Test subject", split=True, text="first"),
+                        _mailer.send_email(_to_addresses[25:], "Test subject", split=True, text="second"))
+                await _mailer.close()
+
+            self._loop.run_until_complete(_send())
+
+        self.assertEqual(sorted(_to_addresses), sorted(_m[1][0] for _m in _server.messages))
+        self.assertLessEqual(_server.connections, 3)
+
+    def test_aiosmtplib_result(self):
+        _smtp = AiosmtplibSMTP(refused=[{"to-2@example.com": (550, "No such user")}])
+        _mailer = oc_mailer.AsyncMailer.AsyncMailer(_smtp, "from@example.com")
+        _result, = self._loop.run_until_complete(_mailer.send_email(["to-1@example.com", "to-2@example.com"],
+                "Test subject", text="test"))
+
+        self.assertEqual(["to-1@example.com"], _result.accepted)
+        self.assertEqual({"to-2@example.com": (550, "No such user")}, _result.refused)
+
+    def test_retry(self):
+        _smtp = AiosmtplibSMTP(refused=[{"to-2@example.com": (451, "Try again later")}],
+                errors=[smtplib.SMTPServerDisconnected()])
+        _mailer = oc_mailer.AsyncMailer.AsyncMailer(_smtp, "from@example.com",
+                retry=oc_mailer.Retry.RetryPolicy(attempts=3, base_delay=0.01, jitter=0))
+        _result, = self._loop.run_until_complete(_mailer.send_email(["to-1@example.com", "to-2@example.com"],
+                "Test subject", text="test"))
+
+        self.assertTrue(_result.ok)
+        self.assertEqual(3, _result.attempts)
+        self.assertEqual([["to-1@example.com", "to-2@example.com"]] * 2 + [["to-2@example.com"]], _smtp.sent)
+
+    @unittest.skipIf(aiosmtplib is None, "aiosmtplib is not installed")
+    def test_aiosmtplib_errors(self):
+        _smtp = AiosmtplibSMTP(refused=[{"to-2@example.com": (550, "No such user")}], errors=[
+                aiosmtplib.SMTPRecipientsRefused([aiosmtplib.SMTPRecipientRefused(451, "Try again later", _a)
+                    for _a in ["to-1@example.com", "to-2@example.com"]]),
+                aiosmtplib.SMTPServerDisconnected("Connection lost")])
+        _limiter = RateLimiter(rate=1000, burst=10)
+        _mailer = oc_mailer.AsyncMailer.AsyncMailer(_smtp, "from@example.com", rate_limiter=_limiter,
+                retry=oc_mailer.Retry.RetryPolicy(attempts=4, base_delay=0.01, jitter=0))
+        _result, = self._loop.run_until_complete(_mailer.send_email(["to-1@example.com", "to-2@example.com"],
+                "Test subject", text="test"))
+
+        # temporary failures are retried, permanent ones are reported the way smtplib does
+        self.assertEqual(3, _result.attempts)
+        self.assertEqual(["to-1@example.com"], _result.accepted)
+        self.assertEqual({"to-2@example.com": (550, "No such user")}, _result.refused)
+        # and they slow sending down
+        self.assertLess(_limiter.rate(), 1000)
+
+        # errors which are not retried are raised as smtplib ones
+        _smtp.errors = [aiosmtplib.SMTPSenderRefused(553, "Sender refused", "from@example.com")]
+
+        with self.assertRaises(smtplib.SMTPResponseException) as _context:
+            self._loop.run_until_complete(_mailer.send_email("to@example.com", "Test subject", text="test"))
+
+        self.assertEqual(553, _context.exception.smtp_code)
+        self.assertIsInstance(_context.exception.__cause__, aiosmtplib.SMTPSenderRefused)
@@ -0,0 +1,162 @@
+import unittest
+import unittest.mock
+
+import email
+import io
+import os
+import smtplib
+import tempfile
+
+import oc_mailer.Attachments
+import oc_mailer.Mailer
+import oc_mailer.MailerPool
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+
+class _SMTP(object):
+    def __init__(self):
+        self.messages = list()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.messages.append((to_addrs, msg))
+        return dict()
+
+
+class _Pipe(io.RawIOBase):
+    def __init__(self, data):
+        self.data = data
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        _size = min(len(buffer), len(self.data), 3)
+        buffer[:_size] = self.data[:_size]
+        self.data = self.data[_size:]
+        return _size
+
+
+class TestAttachments(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._server = FakeSMTPServer().start()
+        self._smtp = smtplib.SMTP(*self._server.address)
+        # not a multiple of base64 line to check the last line
+        self._content = os.urandom(1024 * 1024 + 7)
+        _fd, self._path = tempfile.mkstemp(suffix=".pdf")
+
+        with os.fdopen(_fd, mode="wb") as _f:
+            _f.write(self._content)
+
+    def tearDown(self):
+        self._smtp.quit()
+        self._server.stop()
+        os.remove(self._path)
+
+    def _attachments(self, data):
+        _message = email.message_from_bytes(data)
+        self.assertEqual("multipart/mixed", _message.get_content_type())
+        _body = _message.get_payload()[0]
+        self.assertEqual("multipart/related", _body.get_content_type())
+        return _body, _message.get_payload()[1:]
+
+    def test_path(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com")
+
+        with unittest.mock.patch.object(self._smtp, "send", wraps=self._smtp.send) as _send:
+            _result, = _m.send_email("to@example.com", "Test subject", attachments=[self._path], text="test")
+
+        self.assertTrue(_result.ok)
+        _body, (_attachment,) = self._attachments(self._server.messages[0][2])
+        self.assertEqual("test", _body.get_payload()[0].get_payload(decode=True).decode("utf-8"))
+        self.assertEqual("application/pdf", _attachment.get_content_type())
+        self.assertEqual(os.path.basename(self._path), _attachment.get_filename())
+        self.assertEqual(self._content, _attachment.get_payload(decode=True))
+
+        # the message is never sent as a whole
+        self.assertLess(max(len(_c.args[0]) for _c in _send.call_args_list), 100 * 1024)
+
+    def test_split_reads_again(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", render_once=True)
+        _attachment = oc_mailer.Attachments.Attachment(self._path, filename="report.pdf")
+
+        with unittest.mock.patch("builtins.open", wraps=open) as _open:
+            _results = _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", split=True,
+                    attachments=[_attachment], text="test")
+
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual(2, len([_c for _c in _open.call_args_list if _c.args[0] == self._path]))
+
+        for _to, (_from, _rcpt_tos, _data) in zip(["to-1@example.com", "to-2@example.com"], self._server.messages):
+            self.assertEqual([_to], _rcpt_tos)
+            self.assertEqual(_to, email.message_from_bytes(_data)["To"])
+            _body, (_part,) = self._attachments(_data)
+            self.assertEqual("report.pdf", _part.get_filename())
+            self.assertEqual(self._content, _part.get_payload(decode=True))
+
+    def test_file_object(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=1)
+        _file = io.BytesIO(b"prefix" + b".\n" * 1000)
+        _file.read(6)
+        _results = _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject",
+                attachments=[_file], text=".\n.leading period")
+
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual(2, len(self._server.messages))
+
+        for _from, _rcpt_tos, _data in self._server.messages:
+            _body, (_part,) = self._attachments(_data)
+            self.assertEqual("application/octet-stream", _part.get_content_type())
+            self.assertEqual(b".\n" * 1000, _part.get_payload(decode=True))
+            self.assertEqual(".\n.leading period", _body.get_payload()[0].get_payload(decode=True).decode("utf-8"))
+
+    def test_not_seekable(self):
+        # short reads are gathered into whole base64 lines
+        _attachment = oc_mailer.Attachments.Attachment(_Pipe(b"data"), filename="a.txt")
+        self.assertEqual("text/plain", _attachment.content_type)
+        self.assertEqual(b"ZGF0YQ==", b"".join(_attachment.encoded_chunks()))
+
+        with self.assertRaises(ValueError):
+            list(_attachment.encoded_chunks())
+
+    def test_pool(self):
+        _pool = oc_mailer.MailerPool.SMTPPool(lambda: smtplib.SMTP(*self._server.address), size=2)
+
+        try:
+            _m = oc_mailer.Mailer.Mailer(_pool, "from@example.com")
+            _result, = _m.send_email("to@example.com", "Test subject", attachments=[self._path], text="test")
+        finally:
+            _pool.close()
+
+        self.assertTrue(_result.ok)
+        _body, (_part,) = self._attachments(self._server.messages[0][2])
+        self.assertEqual(self._content, _part.get_payload(decode=True))
+
+    def test_other_client(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com")
+        _m.send_email("to@example.com", "Test subject", attachments=[self._path], text="test")
+
+        (_to, _msg), = _smtp.messages
+        self.assertIsInstance(_msg, str)
+        _body, (_part,) = self._attachments(_msg.encode("ascii"))
+        self.assertEqual(self._content, _part.get_payload(decode=True))
+
+    def test_invalid(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com")
+
+        for _attachments in [[self._path + ".missing"], [io.StringIO("text")], [42]]:
+            with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+                _m.render_email("to@example.com", "Test subject", attachments=_attachments, text="test")
+
+    def test_render(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com")
+        (_to, _message), = _m.render_email("to@example.com", "Test subject", attachments=[self._path], text="test")
+
+        self.assertIsInstance(_message, oc_mailer.Attachments.StreamedMessage)
+        self.assertEqual(len(_message.as_string()), len(_message))
+
+
+if __name__ == "__main__":
+    unittest.main()
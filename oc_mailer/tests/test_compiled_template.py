@@ -0,0 +1,104 @@
+import unittest
+
+import email
+import email.mime.text
+import os
+import string
+
+import oc_mailer.Mailer
+from oc_mailer.CompiledTemplate import CompiledTemplate
+
+
+class TestCompiledTemplate(unittest.TestCase):
+    _TEMPLATES = [
+            "",
+            "plain text",
+            "${text}",
+            "$text",
+            "<p>${text}</p>",
+            "$a$b${c}d $$a $$$a $$${b}",
+            "$text, ${text} and $text again",
+            "price: 10$$",
+            "$_private ${Mixed_1} $a.b",
+            "multi\nline\r\n$text\n"]
+
+    def test_same_as_string_template(self):
+        _mapping = {"text": "<b>Привет</b>", "a": 1, "b": None, "c": 2.5, "_private": "x", "Mixed_1": "y"}
+
+        for _template in self._TEMPLATES:
+            self.assertEqual(string.Template(_template).substitute(_mapping),
+                    CompiledTemplate(_template).substitute(_mapping), _template)
+            self.assertEqual(string.Template(_template).substitute(**_mapping),
+                    CompiledTemplate(_template).substitute(**_mapping), _template)
+
+    def test_kwargs_precedence(self):
+        _template = CompiledTemplate("${a} ${b}")
+        self.assertEqual("1 3", _template.substitute({"a": 1, "b": 2}, b=3))
+
+        with self.assertRaises(TypeError):
+            _template.substitute({"a": 1}, {"b": 2})
+
+    def test_missing_key(self):
+        with self.assertRaises(KeyError) as _e:
+            CompiledTemplate("$a ${b}").substitute(a=1)
+
+        self.assertEqual("'b'", str(_e.exception))
+
+    def test_invalid_placeholder(self):
+        for _template in ["$", "text $ text", "${a", "$1", "$a ${"]:
+            with self.assertRaises(ValueError) as _expected:
+                string.Template(_template).substitute(a=1)
+
+            with self.assertRaises(ValueError) as _e:
+                CompiledTemplate(_template).substitute(a=1)
+
+            self.assertEqual(str(_expected.exception), str(_e.exception))
+
+        # missing key before the invalid placeholder is reported first, as string.Template does
+        with self.assertRaises(KeyError):
+            CompiledTemplate("$b $").substitute(a=1)
+
+    def test_slots(self):
+        self.assertEqual(["a", "b", "a"], CompiledTemplate("$a $$b ${b} $a").slots)
+
+    def test_render_part(self):
+        _template = CompiledTemplate("<p>${text}</p>" * 100)
+
+        for _subtype in ["plain", "html"]:
+            for _text in ["test", "Привет", "x" * 1000]:
+                _expected = email.mime.text.MIMEText(_template.substitute(text=_text), _subtype, "utf-8")
+                _part = _template.render_part(_subtype, text=_text)
+                self.assertEqual(_expected.as_string(), _part.as_string())
+
+        # the part may be modified without affecting next ones
+        _part["X-Test"] = "test"
+        self.assertNotIn("X-Test", _template.render_part("html", text="test"))
+
+
+class TestFastRender(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_path = os.path.join(os.path.dirname(__file__), "resources", "config.json")
+
+    def test_fast_render(self):
+        _bodies = list()
+
+        for _fast_render in [False, True]:
+            _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@html.example.com", config_path=self._config_path,
+                    fast_render=_fast_render)
+            (_to, _email), = _m.render_email(["to@example.com"], "Test subject", text="Привет")
+            _message = email.message_from_string(_email)
+            _bodies.append([(_p.get_content_type(), _p.get_payload(decode=True)) for _p in _message.walk()])
+
+        self.assertEqual(_bodies[0], _bodies[1])
+        self.assertIn("<div>Привет</div>".encode("utf-8"), dict(_bodies[1])["text/html"])
+
+
+class _SMTP(object):
+    def sendmail(self, from_addr, to_addrs, msg):
+        return dict()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+
+import email
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+
+import oc_mailer.Digest
+import oc_mailer.Mailer
+
+
+class _SMTP(object):
+    def __init__(self, error=None):
+        self.messages = list()
+        self.error = error
+        self.lock = threading.Lock()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.error:
+            raise self.error
+
+        with self.lock:
+            self.messages.append((to_addrs, msg))
+
+        return dict()
+
+    def texts(self):
+        with self.lock:
+            return [(_to, _text(_msg)) for _to, _msg in self.messages]
+
+
+def _text(msg):
+    _part = [_p for _p in email.message_from_string(msg).walk() if _p.get_content_maintype() == "text"][0]
+    return _part.get_payload(decode=True).decode("utf-8")
+
+
+class TestDigest(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._directory = tempfile.mkdtemp()
+        self._config_path = os.path.join(self._directory, "config.json")
+
+        with open(os.path.join(self._directory, "digest.txt"), mode="wt") as _f:
+            _f.write("${count} notifications:\n${items}")
+
+        with open(self._config_path, mode="wt") as _f:
+            json.dump({
+                    "example.com": {"template_type": "plain", "template": "* ${text}",
+                            "digest_template_file": "digest.txt"},
+                    "": {"template_type": "plain"}}, _f)
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_send_digest(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_path)
+        _m.send_digest("to@example.com", "Test subject", [{"text": "first"}, {"text": "second"}])
+        _m.send_email("to@example.com", "Test subject", text="single")
+
+        self.assertEqual([("to@example.com", "2 notifications:\n* first\n* second"),
+                ("to@example.com", "* single")], [(_to[0], _t) for _to, _t in _smtp.texts()])
+
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            _m.send_digest("to@example.com", "Test subject", [])
+
+        # items are joined as is without digest template
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@other.example.com", config_path=self._config_path)
+        _m.send_digest("to@example.com", "Test subject", [{"text": "first"}, {"text": "second"}])
+        self.assertEqual("first\nsecond", _smtp.texts()[-1][1])
+
+    def test_signed(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@html.example.com", config_path=os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "resources", "config.json"))
+        (_to, _email), = _m.render_digest("to@example.com", "Test subject", [{"text": "first"}, {"text": "second"}])
+
+        # the signature is referenced once
+        self.assertEqual(1, _text(_email).count("cid:signature_image"))
+
+    def test_burst(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_path)
+
+        with oc_mailer.Digest.DigestMailer(_m, window=60) as _digest:
+            for _i in range(30):
+                _digest.send_email(["to-1@example.com", "to-2@example.com"], "Build failed", text="build %d" % _i)
+
+            _digest.send_email("to-3@example.com", "Build failed", text="other")
+            _digest.send_email("to-1@example.com", "Build fixed", text="fixed")
+            self.assertEqual(62, _digest.pending)
+            self.assertEqual([], _smtp.messages)
+            self.assertTrue(_digest.flush(timeout=5))
+
+        _texts = _smtp.texts()
+        self.assertEqual(3, len(_texts))
+        self.assertIn((["to-1@example.com", "to-2@example.com"], "30 notifications:\n%s" % "\n".join(
+                "* build %d" % _i for _i in range(30))), _texts)
+        self.assertIn((["to-3@example.com"], "* other"), _texts)
+        self.assertIn((["to-1@example.com"], "* fixed"), _texts)
+        self.assertEqual({"pending": 0, "notifications": 32, "sent": 3, "failed": 0}, _digest.stats())
+
+    def test_window(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_path)
+
+        with oc_mailer.Digest.DigestMailer(_m, window=0.1) as _digest:
+            _digest.send_email("to@example.com", "Build failed", text="first")
+            _digest.send_email("to@example.com", "Build failed", text="second")
+            _deadline = time.monotonic() + 5
+
+            while not _smtp.messages and time.monotonic() < _deadline:
+                time.sleep(0.01)
+
+            self.assertEqual([(["to@example.com"], "2 notifications:\n* first\n* second")], _smtp.texts())
+
+    def test_max_items(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_path)
+
+        with oc_mailer.Digest.DigestMailer(_m, window=60, max_items=3) as _digest:
+            for _i in range(4):
+                _digest.send_email("to@example.com", "Build failed", text="build %d" % _i)
+
+            _deadline = time.monotonic() + 5
+
+            while not _smtp.messages and time.monotonic() < _deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(1, _digest.pending)
+
+        self.assertEqual(["3 notifications:\n* build 0\n* build 1\n* build 2", "* build 3"],
+                [_t for _to, _t in _smtp.texts()])
+
+    def test_subject_key(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_path)
+
+        with oc_mailer.Digest.DigestMailer(_m, subject_key=lambda _s: _s.split(" #")[0]) as _digest:
+            _digest.send_email(["to-1@example.com", "to-2@example.com"], "Build #1", split=True, text="first")
+            _digest.send_email(["to-1@example.com", "to-2@example.com"], "Build #2", split=True, text="second")
+
+        self.assertEqual(2, len(_smtp.messages))
+        self.assertEqual(["to-1@example.com", "to-2@example.com"], sorted(_to for _to, _msg in _smtp.messages))
+        for _to, _msg in _smtp.messages:
+            self.assertEqual("Build #1", str(email.header.make_header(email.header.decode_header(
+                    email.message_from_string(_msg)["Subject"]))))
+            self.assertEqual("2 notifications:\n* first\n* second", _text(_msg))
+
+    def test_errors(self):
+        _errors = list()
+        _m = oc_mailer.Mailer.Mailer(_SMTP(error=smtplib.SMTPServerDisconnected()), "from@example.com",
+                config_path=self._config_path)
+        _digest = oc_mailer.Digest.DigestMailer(_m, on_error=lambda _e, _d: _errors.append((_e, _d)))
+        _digest.send_email("to@example.com", "Build failed", text="first")
+        _digest.send_email("to@example.com", "Build failed", text="second")
+        self.assertTrue(_digest.close(timeout=5))
+
+        (_error, (_to, _subject, _items)), = _errors
+        self.assertIsInstance(_error, smtplib.SMTPServerDisconnected)
+        self.assertEqual((["to@example.com"], "Build failed", [{"text": "first"}, {"text": "second"}]),
+                (_to, _subject, _items))
+        self.assertEqual(1, _digest.stats()["failed"])
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _digest.send_email("to@example.com", "Build failed", text="late")
+
+
+if __name__ == "__main__":
+    unittest.main()
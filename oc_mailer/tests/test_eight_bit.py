@@ -0,0 +1,179 @@
+import unittest
+
+import email
+import os
+import smtplib
+import tempfile
+
+import oc_mailer.EightBit
+import oc_mailer.Mailer
+from oc_mailer.CompiledTemplate import CompiledTemplate
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+_TEXT = "Релиз опубликован. " * 20
+
+
+class _SMTP(object):
+    def __init__(self):
+        self.messages = list()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.messages.append((to_addrs, msg))
+        return dict()
+
+
+class TestEightBit(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._servers = list()
+
+    def tearDown(self):
+        for _smtp, _server in self._servers:
+            _smtp.quit()
+            _server.stop()
+
+    def _connect(self, extensions=("PIPELINING", "8BITMIME", "SMTPUTF8")):
+        _server = FakeSMTPServer(extensions=extensions).start()
+        _smtp = smtplib.SMTP(*_server.address)
+        self._servers.append((_smtp, _server))
+        return _smtp, _server
+
+    def _text(self, data):
+        _parts = [_p for _p in email.message_from_bytes(data).walk() if _p.get_content_maintype() == "text"]
+        return _parts[0]["Content-Transfer-Encoding"], _parts[0].get_payload(decode=True).decode("utf-8")
+
+    def _mail_commands(self, server):
+        return [_c for _c in server.commands if _c.lower().startswith("mail")]
+
+    def test_eight_bit(self):
+        _smtp, _server = self._connect()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True)
+        _result, = _m.send_email("to@example.com", "Тема", text=_TEXT)
+
+        self.assertTrue(_result.ok)
+        self.assertEqual(["mail FROM:<from@example.com> BODY=8BITMIME"], self._mail_commands(_server))
+        _data = _server.messages[0][2]
+        self.assertIn(_TEXT.encode("utf-8"), _data)
+        self.assertEqual(("8bit", _TEXT), self._text(_data))
+        self.assertEqual("Тема", str(email.header.make_header(email.header.decode_header(
+                email.message_from_bytes(_data)["Subject"]))))
+
+        # base64 takes a third more
+        _default = oc_mailer.Mailer.Mailer(_smtp, "from@example.com")
+        _default.send_email("to@example.com", "Тема", text=_TEXT)
+        self.assertEqual(("base64", _TEXT), self._text(_server.messages[1][2]))
+        self.assertLess(len(_data) * 1.2, len(_server.messages[1][2]))
+
+    def test_fallback(self):
+        _smtp, _server = self._connect(extensions=("PIPELINING",))
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=_CONFIG_PATH, eight_bit=True)
+        _result, = _m.send_email("to@example.com", "Test subject", text=_TEXT)
+
+        self.assertTrue(_result.ok)
+        self.assertEqual(["mail FROM:<from@html.example.com>"], self._mail_commands(_server))
+        _data = _server.messages[0][2]
+        _encoding, _text = self._text(_data)
+        self.assertEqual("base64", _encoding)
+        self.assertIn(_TEXT, _text)
+        # the signature image is kept
+        self.assertEqual(["image/png"], [_p.get_content_type() for _p in email.message_from_bytes(_data).walk()
+                if _p.get_content_maintype() == "image"])
+
+    def test_ascii(self):
+        _smtp, _server = self._connect()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True)
+        _m.send_email("to@example.com", "Test subject", text="test")
+
+        self.assertEqual(["mail FROM:<from@example.com>"], self._mail_commands(_server))
+        self.assertEqual(("7bit", "test"), self._text(_server.messages[0][2]))
+
+    def test_split(self):
+        _smtp, _server = self._connect()
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(3)]
+
+        for _render_once in [False, True]:
+            _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", render_once=_render_once, eight_bit=True,
+                    fast_render=_render_once)
+            _results = _m.send_email(_to_addresses, "Test subject", split=True, text=_TEXT)
+            self.assertTrue(all(_r.ok for _r in _results))
+
+        for _index, (_from, _rcpt_tos, _data) in enumerate(_server.messages):
+            self.assertEqual([_to_addresses[_index % 3]], _rcpt_tos)
+            self.assertEqual(_to_addresses[_index % 3], email.message_from_bytes(_data)["To"])
+            self.assertEqual(("8bit", _TEXT), self._text(_data))
+
+    def test_max_recipients(self):
+        _smtp, _server = self._connect()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", max_recipients=2, eight_bit=True)
+        _results = _m.send_email(["to-%d@example.com" % _i for _i in range(3)], "Test subject", text=_TEXT)
+
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual(2, len(self._mail_commands(_server)))
+        self.assertTrue(all(_c.endswith(" BODY=8BITMIME") for _c in self._mail_commands(_server)))
+        self.assertEqual([("8bit", _TEXT)] * 2, [self._text(_m[2]) for _m in _server.messages])
+
+    def test_attachments(self):
+        _fd, _path = tempfile.mkstemp(suffix=".txt")
+
+        with os.fdopen(_fd, mode="wb") as _f:
+            _f.write("Вложение".encode("utf-8"))
+
+        try:
+            for _extensions in [("8BITMIME",), ()]:
+                _smtp, _server = self._connect(extensions=_extensions)
+                _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True)
+                _result, = _m.send_email("to@example.com", "Test subject", attachments=[_path], text=_TEXT)
+
+                self.assertTrue(_result.ok)
+                _message = email.message_from_bytes(_server.messages[0][2])
+                self.assertEqual(_TEXT, _message.get_payload()[0].get_payload()[0].get_payload(
+                        decode=True).decode("utf-8"))
+                self.assertEqual("Вложение".encode("utf-8"), _message.get_payload()[1].get_payload(decode=True))
+        finally:
+            os.remove(_path)
+
+    def test_smtputf8(self):
+        _smtp, _server = self._connect()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True)
+        _result, = _m.send_email("получатель@example.com", "Test subject", text="test")
+
+        self.assertTrue(_result.ok)
+        self.assertEqual(["mail FROM:<from@example.com> SMTPUTF8"], self._mail_commands(_server))
+        self.assertEqual(["получатель@example.com"], _server.messages[0][1])
+
+    def test_other_client(self):
+        _smtp = _SMTP()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True)
+        _m.send_email("to@example.com", "Test subject", text=_TEXT)
+
+        (_to, _msg), = _smtp.messages
+        self.assertIsInstance(_msg, bytes)
+        self.assertFalse(oc_mailer.EightBit.is_eight_bit(_msg))
+        self.assertEqual(("base64", _TEXT), self._text(_msg))
+
+    def test_long_lines(self):
+        _long = "Релиз опубликован" * 90
+        for _fast_render in [False, True]:
+            _smtp, _server = self._connect()
+            _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", eight_bit=True, fast_render=_fast_render)
+            _result, = _m.send_email("to@example.com", "Тема", text=_long + "\n" + _TEXT)
+
+            self.assertTrue(_result.ok)
+            self.assertEqual(["mail FROM:<from@example.com>"], self._mail_commands(_server))
+            _data = _server.messages[0][2]
+            self.assertLessEqual(max(len(_l) for _l in _data.splitlines()), oc_mailer.EightBit.MAX_LINE_LENGTH)
+            self.assertEqual(("quoted-printable", _long + "\r\n" + _TEXT), self._text(_data))
+
+    def test_render_8bit_part(self):
+        for _text in [_TEXT, "ascii text", "Релиз опубликован" * 90]:
+            _charset = oc_mailer.EightBit.UTF8_8BIT if len(_text) < 999 else oc_mailer.EightBit.UTF8_QP
+            _expected = email.mime.text.MIMEText(_text, "html", _charset)
+            _part = CompiledTemplate("${text}").render_8bit_part("html", text=_text)
+            self.assertEqual(_expected.as_bytes(policy=oc_mailer.EightBit.SMTP_POLICY),
+                    _part.as_bytes(policy=oc_mailer.EightBit.SMTP_POLICY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+
+import email
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import oc_mailer.Mailer
+import oc_mailer.MailerFactory
+
+
+class _SMTP(object):
+    def sendmail(self, from_addr, to_addrs, msg):
+        return dict()
+
+
+class TestHotReload(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._directory = tempfile.mkdtemp()
+        self._config_path = os.path.join(self._directory, "config.json")
+        self._write_config({"example.com": {"template_type": "plain", "template_file": "template.txt"}})
+        self._write("template.txt", "first: ${text}")
+
+    def tearDown(self):
+        gc.collect()
+        oc_mailer.Mailer.profile_watcher.check()
+        shutil.rmtree(self._directory)
+
+    def _write(self, file_name, content):
+        with open(os.path.join(self._directory, file_name), mode="wt") as _f:
+            _f.write(content)
+
+    def _write_config(self, config):
+        self._write("config.json", json.dumps(config))
+
+    def _render(self, mailer):
+        (_to, _email), = mailer.render_email("to@example.com", "Test subject", text="test")
+        _part = [_p for _p in email.message_from_string(_email).walk() if _p.get_content_maintype() == "text"][0]
+        return _part.get_content_type(), _part.get_payload(decode=True).decode("utf-8")
+
+    def test_template_file_changed(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path, hot_reload=True)
+        self.assertEqual(("text/plain", "first: test"), self._render(_m))
+        self.assertEqual(0, oc_mailer.Mailer.profile_watcher.check())
+
+        # the background thread may get the change first
+        self._write("template.txt", "second version: ${text}")
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/plain", "second version: test"), self._render(_m))
+        self.assertEqual(0, oc_mailer.Mailer.profile_watcher.check())
+
+    def test_config_changed(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path, hot_reload=True)
+        _static = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path)
+
+        self._write_config({"example.com": {"template_type": "html", "template": "<p>${text}</p>"}})
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/html", "<p>test</p>"), self._render(_m))
+        self.assertEqual(("text/plain", "first: test"), self._render(_static))
+
+        # a file referenced by the new configuration only is watched too
+        self._write_config({"example.com": {"template_type": "plain", "template_file": "other.txt"}})
+        self._write("other.txt", "other: ${text}")
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/plain", "other: test"), self._render(_m))
+
+        self._write("other.txt", "other again: ${text}")
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/plain", "other again: test"), self._render(_m))
+
+    def test_broken_config(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path, hot_reload=True)
+
+        with self.assertLogs("oc_mailer.Mailer", level="ERROR"):
+            self._write("config.json", "{broken")
+            self.assertEqual(0, oc_mailer.Mailer.profile_watcher.check())
+
+        self.assertEqual(("text/plain", "first: test"), self._render(_m))
+
+        self._write_config({"example.com": {"template": "fixed: ${text}"}})
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/plain", "fixed: test"), self._render(_m))
+
+    def test_explicit_arguments_kept(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path,
+                template="explicit: ${text}", hot_reload=True)
+        self._write_config({"example.com": {"template_type": "html", "template": "<p>${text}</p>"}})
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/html", "explicit: test"), self._render(_m))
+
+    def test_factory(self):
+        _factory = oc_mailer.MailerFactory.MailerFactory(self._config_path, _SMTP(), hot_reload=True)
+        _m = _factory.get_mailer("from@example.com")
+
+        self._write("template.txt", "second version: ${text}")
+        oc_mailer.Mailer.profile_watcher.check()
+        self.assertEqual(("text/plain", "second version: test"), self._render(_m))
+        self.assertEqual(("text/plain", "second version: test"), self._render(_factory.get_mailer("a@example.com")))
+
+    def test_background(self):
+        _interval = oc_mailer.Mailer.profile_watcher.interval
+        oc_mailer.Mailer.profile_watcher.interval = 0.05
+
+        try:
+            _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path, hot_reload=True)
+            self._write("template.txt", "second version: ${text}")
+            _deadline = time.monotonic() + 5
+
+            while self._render(_m)[1] != "second version: test" and time.monotonic() < _deadline:
+                time.sleep(0.05)
+
+            self.assertEqual(("text/plain", "second version: test"), self._render(_m))
+        finally:
+            oc_mailer.Mailer.profile_watcher.interval = _interval
+
+    def test_mailer_collected(self):
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=self._config_path, hot_reload=True)
+        del _m
+        gc.collect()
+
+        self._write("template.txt", "second version: ${text}")
+        self.assertEqual(0, oc_mailer.Mailer.profile_watcher.check())
+
+
+if __name__ == "__main__":
+    unittest.main()
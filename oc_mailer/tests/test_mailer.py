@@ -3,8 +3,21 @@ import unittest.mock
 
 import os
 import json
-
+import email.errors
+import email.generator
+import email.mime.image
+import email.mime.multipart
+import email.mime.text
+import email.policy
+import shutil
+import smtplib
+import tempfile
+import threading
+
+import oc_mailer.CompiledTemplate
 import oc_mailer.Mailer
+import oc_mailer.MailerPool
+from oc_mailer.tests.smtp_server import FakeSMTPServer
 
 # to get rid of garbage output
 import logging
@@ -32,6 +45,11 @@ class MockMIMEImage():
         assert(signature_image == '<signature_image>')
 
 class TestMailer(unittest.TestCase):
+    def setUp(self):
+        # profiles and signatures are cached process-wide, mocked parts must not leak between tests
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
     @unittest.mock.patch("oc_mailer.Mailer.Header")
     @unittest.mock.patch("oc_mailer.Mailer.MIMEImage")
     @unittest.mock.patch("oc_mailer.Mailer.MIMEMultipart")
@@ -369,3 +387,267 @@ class TestMailer(unittest.TestCase):
                     template_type='html',
                     signature_image=b'signature',
                     config_path=_config_pth)
+
+
+class TestProfileCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        _resources = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+
+        for _fn in os.listdir(_resources):
+            shutil.copy(os.path.join(_resources, _fn), self._tmp)
+
+        self._config_pth = os.path.join(self._tmp, "config.json")
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
+    def tearDown(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        shutil.rmtree(self._tmp)
+
+    def test_second_construction__no_file_read(self):
+        _smtp = unittest.mock.MagicMock()
+        _first = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=self._config_pth)
+
+        with unittest.mock.patch("builtins.open") as _open:
+            _second = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=self._config_pth)
+            _third = oc_mailer.Mailer.Mailer(_smtp, "from@plain.example.com", config_path=self._config_pth)
+
+        _open.assert_not_called()
+        _second.send_email("to@example.com", "Test subject", text="test text")
+        _message = _smtp.sendmail.call_args[0][2]
+        self.assertIn("Content-ID: <signature_image>", _message)
+
+    def test_profiles_shared(self):
+        _cache = oc_mailer.Mailer.ProfileCache()
+        _profile = _cache.get_profile(self._config_pth, "html.example.com")
+        self.assertIs(_profile, _cache.get_profile(self._config_pth, "html.example.com"))
+        self.assertIs(_profile.get_template(signed=True), _profile.get_template(signed=True))
+        self.assertIs(_profile.get_signature_image(), _profile.get_signature_image())
+        self.assertEqual("html", _profile.template_type)
+        self.assertEqual("<h1>Here it is</h1>\n<div>${text}</div>\n", _profile.template_string)
+
+        # unknown domains fall back to defaults
+        self.assertIs(_cache.get_profile(self._config_pth, ""),
+                _cache.get_profile(self._config_pth, "unknown.example.com"))
+
+    def test_config_modified__reloaded(self):
+        _cache = oc_mailer.Mailer.ProfileCache()
+        _profile = _cache.get_profile(self._config_pth, "")
+
+        with open(self._config_pth, mode='wt') as _f:
+            json.dump({"": {"template_type": "plain", "template": "Modified: ${text}"}}, _f)
+
+        _profile_modified = _cache.get_profile(self._config_pth, "")
+        self.assertIsNot(_profile, _profile_modified)
+        self.assertEqual("Modified: ${text}", _profile_modified.template_string)
+        self.assertEqual(1, len(_cache))
+
+    def test_invalidate(self):
+        _cache = oc_mailer.Mailer.ProfileCache()
+        _profile = _cache.get_profile(self._config_pth, "")
+        _cache.invalidate(self._config_pth)
+        self.assertEqual(0, len(_cache))
+        self.assertIsNot(_profile, _cache.get_profile(self._config_pth, ""))
+
+    def test_bounded(self):
+        _cache = oc_mailer.Mailer.ProfileCache(max_size=1)
+        _other_pth = os.path.join(self._tmp, "other.json")
+        shutil.copy(self._config_pth, _other_pth)
+        _cache.get_profile(self._config_pth, "")
+        _cache.get_profile(_other_pth, "")
+        self.assertEqual(1, len(_cache))
+
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            oc_mailer.Mailer.ProfileCache(max_size=0)
+
+
+class TestRenderOnce(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+
+    def _send(self, render_once, to_addresses):
+        _smtp = unittest.mock.MagicMock()
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=self._config_pth,
+                render_once=render_once)
+
+        with unittest.mock.patch("email.generator.Generator._make_boundary", return_value="===boundary=="):
+            _m.send_email(to_addresses, "Test subject \u0442\u0435\u0441\u0442", split=True,
+                    text="test \u0442\u0435\u043a\u0441\u0442")
+
+        return [_c[0] for _c in _smtp.sendmail.call_args_list]
+
+    def test_byte_identical(self):
+        _to_addresses = ["to-first@example.com", "\u043f\u043e\u043b\u0443\u0447\u0430\u0442\u0435\u043b\u044c@example.com",
+                "Long Recipient Name To Check Header Is Not Wrapped %s <to-long@example.com>" % ("x" * 80)]
+        _expected = self._send(False, _to_addresses)
+        _actual = self._send(True, _to_addresses)
+        self.assertEqual(3, len(_actual))
+        self.assertEqual(_expected, _actual)
+
+        for _to_address, _call in zip(_to_addresses, _actual):
+            self.assertEqual(("from@html.example.com", _to_address), _call[:2])
+
+        self.assertIn("\nTo: to-first@example.com\n", _actual[0][2])
+
+    def test_header_injection__fallback(self):
+        # rejected the same way as without 'render_once'
+        _to_addresses = ["to@example.com", "to@example.com\nBcc: other@example.com"]
+
+        with self.assertRaises(email.errors.HeaderParseError):
+            self._send(True, _to_addresses)
+
+
+class TestSignatureImages(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+
+        with open(os.path.join(os.path.dirname(self._config_pth), "html.example.com.signature.png"), mode='rb') as _f:
+            self._signature = _f.read()
+
+    def test_deduplicated(self):
+        _registry = oc_mailer.Mailer.SignatureImageRegistry()
+        _part = _registry.get(self._signature)
+        self.assertIs(_part, _registry.get(bytes(self._signature)))
+        self.assertIsNot(_part, _registry.get(b"GIF89a"))
+        self.assertEqual("<signature_image>", _part.part.get("Content-ID"))
+
+        # config signature and argument signature are the same image
+        _smtp = unittest.mock.MagicMock()
+        _first = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=self._config_pth)
+        _second = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", config_path=self._config_pth,
+                template_type="html", signature_image=bytes(self._signature))
+        self.assertEqual(1, len(oc_mailer.Mailer.signature_images))
+
+    def test_prerendered(self):
+        _part = oc_mailer.Mailer.signature_images.get(self._signature)
+        _raw = email.mime.image.MIMEImage(self._signature)
+        _raw.add_header('Content-ID', '<signature_image>')
+
+        for _policy in [email.policy.compat32, email.policy.SMTP]:
+            _messages = list()
+
+            for _image in [_raw, _part]:
+                _message = email.mime.multipart.MIMEMultipart('related', boundary="===boundary==", policy=_policy)
+                _message['Subject'] = "Test subject"
+                _message.attach(email.mime.text.MIMEText("<p>test</p>", "html", "utf-8"))
+                _message.attach(_image)
+                _messages.append((_message.as_string(), _message.as_bytes()))
+
+            self.assertEqual(_messages[0], _messages[1])
+
+        with unittest.mock.patch.object(email.generator.Generator, "_handle_text", autospec=True,
+                side_effect=email.generator.Generator._handle_text) as _handle_text:
+            _message.as_string()
+
+        # the image is not serialized again
+        self.assertNotIn(_part.part, [_c[0][1] for _c in _handle_text.call_args_list])
+        self.assertIn(_part, [_c[0][1] for _c in _handle_text.call_args_list])
+
+
+class TestSendMany(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+        self._server = FakeSMTPServer(refused={"bad@example.com": (550, "No such user")}).start()
+
+    def tearDown(self):
+        self._server.stop()
+
+    def _messages(self, count, taken):
+        for _i in range(count):
+            taken.append(_i)
+
+            if _i == 3:
+                # template substitution fails
+                yield "to-3@example.com", "Test subject", {"missing": "value"}
+            elif _i == 5:
+                yield ["to-5@example.com", "bad@example.com"], "Test subject", {"text": "test 5"}
+            else:
+                yield "to-%d@example.com" % _i, "Test subject", {"text": "test %d" % _i}
+
+    def _check(self, results):
+        self.assertEqual(20, len(results))
+        self.assertEqual([["to-%d@example.com" % _i] for _i in range(20) if _i not in (3, 5)],
+                [_r.accepted for _r in results if _r.ok])
+        self.assertIsInstance(results[3].error, KeyError)
+        self.assertEqual([], results[3].accepted)
+        self.assertEqual(["to-5@example.com"], results[5].accepted)
+        self.assertEqual({"bad@example.com": (550, b"No such user")}, results[5].refused)
+        self.assertFalse(results[5].ok)
+        self.assertEqual(19, len(self._server.messages))
+
+    def test_single_connection__streamed(self):
+        _smtp = smtplib.SMTP(*self._server.address)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@plain.example.com", config_path=self._config_pth)
+        _taken = list()
+        _results = _m.send_many(self._messages(20, _taken), window=4)
+        self.assertEqual([], _taken)
+
+        _first = next(_results)
+        self.assertTrue(_first.ok)
+        self.assertLessEqual(len(_taken), 4)
+        self._check([_first] + list(_results))
+        self.assertEqual(1, self._server.connections)
+        _smtp.quit()
+
+    def test_parallel(self):
+        _pool = oc_mailer.MailerPool.SMTPPool(lambda: smtplib.SMTP(*self._server.address), size=3)
+        _m = oc_mailer.Mailer.Mailer(_pool, "from@plain.example.com", config_path=self._config_pth)
+        self._check(list(_m.send_many(self._messages(20, list()), render_workers=2, send_workers=3, window=8)))
+        self.assertLessEqual(self._server.connections, 3)
+        _pool.close()
+
+    def test_render_workers(self):
+        _smtp = smtplib.SMTP(*self._server.address)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@plain.example.com", config_path=self._config_pth)
+        # each rendering waits for another one, so they fail unless rendered in parallel
+        _barrier = threading.Barrier(2, timeout=5)
+        _substitute = oc_mailer.CompiledTemplate.CompiledTemplate.substitute
+
+        def _wait(*args, **kwargs):
+            _barrier.wait()
+            return _substitute(*args, **kwargs)
+
+        with unittest.mock.patch.object(oc_mailer.CompiledTemplate.CompiledTemplate, "substitute", autospec=True,
+                side_effect=_wait):
+            _results = list(_m.send_many(self._messages(4, list()), render_workers=2, window=4))
+
+        self.assertEqual([None] * 3, [_r.error for _r in _results[:3]])
+        self.assertIsInstance(_results[3].error, KeyError)
+        self.assertEqual(3, len(self._server.messages))
+        _smtp.quit()
+
+    def test_processes(self):
+        _smtp = smtplib.SMTP(*self._server.address)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@html.example.com", config_path=self._config_pth)
+        _taken = list()
+        _results = _m.send_many(self._messages(20, _taken), render_processes=2, batch_size=3, window=8)
+
+        _first = next(_results)
+        self.assertTrue(_first.ok)
+        self.assertLessEqual(len(_taken), 8 + 3)
+        self._check([_first] + list(_results))
+        # rendered the same way as in this process, with signature image of the profile
+        _message = email.message_from_bytes(self._server.messages[0][2])
+        self.assertEqual("to-0@example.com", _message["To"])
+        self.assertEqual(["image/png"], [_p.get_content_type() for _p in _message.walk()
+                if _p.get_content_maintype() == "image"])
+        self.assertIn("test 0", str(_message.get_payload()[0].get_payload(decode=True), "utf-8"))
+        _smtp.quit()
+
+    def test_all_refused(self):
+        _smtp = smtplib.SMTP(*self._server.address)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@plain.example.com", config_path=self._config_pth)
+        _result, = _m.send_many([("bad@example.com", "Test subject", {"text": "test"})])
+        self.assertIsInstance(_result.error, smtplib.SMTPRecipientsRefused)
+        self.assertEqual({"bad@example.com": (550, b"No such user")}, _result.refused)
+        _smtp.quit()
+
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            _m.send_many([], window=0)
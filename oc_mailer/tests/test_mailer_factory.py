@@ -0,0 +1,77 @@
+import unittest
+import unittest.mock
+
+import email
+import os
+
+import oc_mailer.Mailer
+import oc_mailer.MailerFactory
+
+
+class _SMTP(object):
+    def __init__(self):
+        self.messages = list()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.messages.append((from_addr, to_addrs, msg))
+        return dict()
+
+
+class TestMailerFactory(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_path = os.path.join(os.path.dirname(__file__), "resources", "config.json")
+        self._smtp = _SMTP()
+
+    def test_arguments(self):
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            oc_mailer.MailerFactory.MailerFactory(self._config_path, None)
+
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            oc_mailer.MailerFactory.MailerFactory(self._config_path, self._smtp, template="${text}")
+
+    def test_domains(self):
+        _factory = oc_mailer.MailerFactory.MailerFactory(self._config_path, self._smtp)
+        self.assertEqual(os.path.abspath(self._config_path), _factory.config_path)
+        self.assertEqual(sorted(["", "plain.example.com", "html.example.com"]), sorted(_factory.domains))
+
+    def test_same_as_mailer(self):
+        _factory = oc_mailer.MailerFactory.MailerFactory(self._config_path, self._smtp)
+
+        for _from in ["from@html.example.com", "from@plain.example.com", "from@other.example.com", "from"]:
+            _expected = oc_mailer.Mailer.Mailer(self._smtp, _from, config_path=self._config_path)
+            (_, _expected_email), = _expected.render_email("to@example.com", "Test subject", text="test")
+            (_, _email), = _factory.get_mailer(_from).render_email("to@example.com", "Test subject", text="test")
+            _expected_message = email.message_from_string(_expected_email)
+            _message = email.message_from_string(_email)
+
+            self.assertEqual(_from, _message["From"])
+            self.assertEqual([(_p.get_content_type(), _p.get_payload(decode=True)) for _p in _expected_message.walk()],
+                    [(_p.get_content_type(), _p.get_payload(decode=True)) for _p in _message.walk()])
+
+    def test_no_file_access(self):
+        _factory = oc_mailer.MailerFactory.MailerFactory(self._config_path, self._smtp)
+
+        with unittest.mock.patch("oc_mailer.Mailer.os.stat", side_effect=AssertionError("stat")), \
+                unittest.mock.patch("builtins.open", side_effect=AssertionError("open")):
+            for _from in ["from@html.example.com", "from@plain.example.com", "from@other.example.com"]:
+                _factory.send_email(_from, ["to@example.com"], "Test subject", text="test")
+
+        self.assertEqual(["from@html.example.com", "from@plain.example.com", "from@other.example.com"],
+                [_m[0] for _m in self._smtp.messages])
+
+    def test_shared_profiles(self):
+        _factory = oc_mailer.MailerFactory.MailerFactory(self._config_path, self._smtp, render_once=True)
+        _factory.send_email("a@html.example.com", ["to-1@example.com", "to-2@example.com"], "Test subject",
+                split=True, text="test")
+        _factory.send_email("b@html.example.com", ["to-3@example.com"], "Test subject", split=True, text="test")
+
+        # the signature image is encoded once for all senders of the domain
+        self.assertEqual(1, len(oc_mailer.Mailer.signature_images))
+        self.assertEqual(["to-1@example.com", "to-2@example.com", "to-3@example.com"],
+                [_m[1] for _m in self._smtp.messages])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+import unittest.mock
+
+import os
+import smtplib
+import threading
+import time
+
+import oc_mailer.Mailer
+import oc_mailer.MailerPool
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+
+class TestMailerPool(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._server = FakeSMTPServer().start()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+
+    def tearDown(self):
+        self._server.stop()
+
+    def _factory(self):
+        return smtplib.SMTP(*self._server.address)
+
+    def test_concurrent_send(self):
+        with oc_mailer.MailerPool.MailerPool(self._factory, "from@plain.example.com", pool_size=2,
+                config_path=self._config_pth) as _mailer:
+            _threads = [threading.Thread(target=_mailer.send_email,
+                args=(["to-%d@example.com" % _i], "Test subject"), kwargs={"text": "test %d" % _i})
+                for _i in range(16)]
+
+            for _thread in _threads:
+                _thread.start()
+
+            for _thread in _threads:
+                _thread.join()
+
+            self.assertLessEqual(_mailer.pool.idle, 2)
+
+        self.assertEqual(16, len(self._server.messages))
+        self.assertLessEqual(self._server.connections, 2)
+        self.assertEqual(sorted("to-%d@example.com" % _i for _i in range(16)),
+                sorted(_m[1][0] for _m in self._server.messages))
+        self.assertTrue(all(b"\r\nSubject: =?utf-8?q?Test_subject?=\r\n" in _m[2] for _m in self._server.messages))
+
+    def test_reconnect(self):
+        with oc_mailer.MailerPool.MailerPool(self._factory, "from@example.com", pool_size=1) as _mailer:
+            _mailer.send_email("to@example.com", "Test subject", text="first")
+            self._server.disconnect_all()
+            time.sleep(0.1)
+            _mailer.send_email("to@example.com", "Test subject", text="second")
+
+        self.assertEqual(2, len(self._server.messages))
+        self.assertEqual(2, self._server.connections)
+
+    def test_keepalive(self):
+        # connections idle longer than keepalive interval are checked on checkout
+        _pool = oc_mailer.MailerPool.SMTPPool(self._factory, size=2, keepalive_interval=0, idle_timeout=None)
+        _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+        self.assertEqual(1, _pool.idle)
+        _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+        self.assertIn("noop", self._server.commands)
+        self.assertEqual(1, self._server.connections)
+
+        # dead connection is replaced on checkout
+        self._server.disconnect_all()
+        time.sleep(0.1)
+        _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+        self.assertEqual(2, self._server.connections)
+        self.assertEqual(3, len(self._server.messages))
+        _pool.close()
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+
+    def test_maintain__size_kept(self):
+        _checking = threading.Event()
+        _checked = threading.Event()
+        _pool = oc_mailer.MailerPool.SMTPPool(self._factory, size=1, keepalive_interval=60, idle_timeout=None)
+        _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+        _smtp, _last_used = _pool._SMTPPool__idle[0]
+        _pool._SMTPPool__idle[0] = (_smtp, _last_used - 60)
+        _noop = _smtp.noop
+
+        def _slow_noop():
+            _checking.set()
+            _checked.wait(1)
+            return _noop()
+
+        _smtp.noop = _slow_noop
+        _maintainer = threading.Thread(target=_pool.maintain)
+        _maintainer.start()
+        _checking.wait(1)
+        # waits for the connection being checked instead of opening another one
+        _sender = threading.Thread(target=_pool.sendmail,
+                args=("from@example.com", ["to@example.com"], "Subject: test\n\ntest"))
+        _sender.start()
+        time.sleep(0.1)
+        _checked.set()
+        _maintainer.join()
+        _sender.join()
+
+        self.assertEqual(1, _pool.idle)
+        self.assertEqual(1, self._server.connections)
+        self.assertEqual(2, len(self._server.messages))
+        _pool.close()
+
+    def test_idle_closed(self):
+        _pool = oc_mailer.MailerPool.SMTPPool(self._factory, size=2, keepalive_interval=None, idle_timeout=0)
+        _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+        self.assertEqual(1, _pool.idle)
+        _pool.maintain()
+        self.assertEqual(0, _pool.idle)
+        self.assertEqual("quit", self._server.commands[-1])
+        _pool.close()
+
+    def test_reconnect_failed(self):
+        _connections = list()
+
+        def _factory():
+            if _connections:
+                raise smtplib.SMTPConnectError(421, b"Service not available")
+
+            _connections.append(self._factory())
+            return _connections[-1]
+
+        with oc_mailer.MailerPool.SMTPPool(_factory, size=1, checkout_timeout=1) as _pool:
+            _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+            self._server.disconnect_all()
+            time.sleep(0.1)
+
+            with self.assertRaises(smtplib.SMTPConnectError):
+                _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+
+            # neither the lost connection nor None is kept, the slot is free
+            self.assertEqual(0, _pool.idle)
+            _connections.clear()
+            _pool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+
+        self.assertEqual(2, len(self._server.messages))
+
+    def test_refused__connection_reused(self):
+        self._server.refused["bad@example.com"] = (550, "No such user")
+
+        with oc_mailer.MailerPool.SMTPPool(self._factory, size=1) as _pool:
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                _pool.sendmail("from@example.com", ["bad@example.com"], "Subject: test\n\ntest")
+
+            self.assertEqual(1, _pool.idle)
+            self.assertEqual({"bad@example.com": (550, b"No such user")},
+                    _pool.sendmail("from@example.com", ["bad@example.com", "to@example.com"],
+                        "Subject: test\n\ntest"))
+
+        self.assertEqual(1, self._server.connections)
+
+    def test_checkout_timeout(self):
+        _pool = oc_mailer.MailerPool.SMTPPool(self._factory, size=1, checkout_timeout=0.01)
+        _smtp = _pool.checkout()
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _pool.checkout()
+
+        _pool.checkin(_smtp)
+        _pool.close()
@@ -0,0 +1,133 @@
+import unittest
+
+import smtplib
+
+import oc_mailer.Mailer
+import oc_mailer.Metrics
+
+
+class _SMTP(object):
+    def __init__(self, refused=None, error=None):
+        self.refused = dict(refused or {})
+        self.error = error
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.error:
+            raise self.error
+
+        return {_a: self.refused[_a] for _a in (to_addrs if isinstance(to_addrs, list) else [to_addrs])
+                if _a in self.refused}
+
+
+class TestMetricsCollector(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
+    def test_histogram(self):
+        _histogram = oc_mailer.Metrics.Histogram([1, 5, 10])
+
+        for _value in [0.5, 1, 3, 7, 100]:
+            _histogram.observe(_value)
+
+        self.assertEqual([(1, 2), (5, 3), (10, 4), (float("inf"), 5)], _histogram.cumulative())
+        self.assertEqual(111.5, _histogram.sum)
+        self.assertEqual(5, _histogram.count)
+
+    def test_mailer(self):
+        _collector = oc_mailer.Metrics.MetricsCollector()
+        _smtp = _SMTP(refused={"bad@example.com": (550, b"No such user")})
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", observer=_collector)
+        _m.send_email(["to-1@example.com", "bad@example.com", "to-2@example.com"], "Test subject", split=True,
+                text="test")
+        _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", text="test")
+        _snapshot = _collector.snapshot()
+
+        self.assertEqual(4, _snapshot["messages"])
+        self.assertEqual(5, _snapshot["recipients"])
+        self.assertEqual(4, _snapshot["sent"])
+        self.assertEqual(4, _snapshot["accepted"])
+        self.assertEqual(1, _snapshot["refused"])
+        self.assertEqual({}, _snapshot["errors"])
+        self.assertEqual({"substitute": 2, "serialize": 4, "send": 4},
+                {_p: _v["count"] for _p, _v in _snapshot["phases"].items()})
+        self.assertGreater(_snapshot["bytes"], 0)
+
+    def test_errors(self):
+        _collector = oc_mailer.Metrics.MetricsCollector()
+        _m = oc_mailer.Mailer.Mailer(_SMTP(error=smtplib.SMTPServerDisconnected()), "from@example.com",
+                template="${text} ${missing}", observer=_collector)
+
+        with self.assertRaises(KeyError):
+            _m.send_email("to@example.com", "Test subject", text="test")
+
+        _m = oc_mailer.Mailer.Mailer(_SMTP(error=smtplib.SMTPServerDisconnected()), "from@example.com",
+                observer=_collector)
+
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            _m.send_email("to@example.com", "Test subject", text="test")
+
+        _snapshot = _collector.snapshot()
+        self.assertEqual({"KeyError": 1, "SMTPServerDisconnected": 1}, _snapshot["errors"])
+        self.assertEqual(0, _snapshot["sent"])
+        self.assertEqual({"substitute": 2, "serialize": 1, "send": 1},
+                {_p: _v["count"] for _p, _v in _snapshot["phases"].items()})
+
+    def test_send_many(self):
+        _collector = oc_mailer.Metrics.MetricsCollector()
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", observer=_collector)
+        _results = list(_m.send_many([("to-%d@example.com" % _i, "Test subject", {"text": "test"})
+                for _i in range(5)] + [("to@example.com", "Test subject", {})]))
+
+        self.assertEqual(5, len([_r for _r in _results if _r.ok]))
+        _snapshot = _collector.snapshot()
+        self.assertEqual(5, _snapshot["messages"])
+        self.assertEqual(5, _snapshot["sent"])
+        self.assertEqual({"KeyError": 1}, _snapshot["errors"])
+
+    def test_send_many__processes(self):
+        _collector = oc_mailer.Metrics.MetricsCollector()
+        _m = oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", observer=_collector)
+        _results = list(_m.send_many([("to-%d@example.com" % _i, "Test subject", {"text": "test"})
+                for _i in range(5)] + [("to@example.com", "Test subject", {})], render_processes=2, batch_size=2))
+
+        self.assertEqual(5, len([_r for _r in _results if _r.ok]))
+        # phases and errors of rendering processes are reported in this one
+        _snapshot = _collector.snapshot()
+        self.assertEqual(5, _snapshot["messages"])
+        self.assertEqual({"KeyError": 1}, _snapshot["errors"])
+        self.assertEqual({"substitute": 6, "serialize": 5, "send": 5},
+                {_p: _v["count"] for _p, _v in _snapshot["phases"].items()})
+
+    def test_prometheus(self):
+        _collector = oc_mailer.Metrics.MetricsCollector(seconds_buckets=[0.1, 1], size_buckets=[1000])
+        _collector.on_phase("send", 0.05)
+        _collector.on_phase("send", 0.5)
+        _collector.on_message(3, 2000)
+        _collector.on_error(smtplib.SMTPServerDisconnected(), "to@example.com")
+        _lines = _collector.to_prometheus().splitlines()
+
+        for _line in [
+                "# TYPE oc_mailer_phase_seconds histogram",
+                'oc_mailer_phase_seconds_bucket{phase="send",le="0.1"} 1',
+                'oc_mailer_phase_seconds_bucket{phase="send",le="1.0"} 2',
+                'oc_mailer_phase_seconds_bucket{phase="send",le="+Inf"} 2',
+                'oc_mailer_phase_seconds_sum{phase="send"} 0.55',
+                'oc_mailer_phase_seconds_count{phase="send"} 2',
+                'oc_mailer_message_bytes_bucket{le="1000.0"} 0',
+                'oc_mailer_message_bytes_bucket{le="+Inf"} 1',
+                "oc_mailer_message_bytes_sum 2000.0",
+                "oc_mailer_message_bytes_count 1",
+                "# TYPE oc_mailer_messages_total counter",
+                "oc_mailer_messages_total 1",
+                "oc_mailer_recipients_total 3",
+                "oc_mailer_sent_total 0",
+                'oc_mailer_errors_total{type="SMTPServerDisconnected"} 1']:
+            self.assertIn(_line, _lines)
+
+        _collector.reset()
+        self.assertIn("oc_mailer_messages_total 0", _collector.to_prometheus().splitlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
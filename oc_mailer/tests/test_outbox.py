@@ -0,0 +1,110 @@
+import unittest
+import unittest.mock
+
+import os
+import smtplib
+import threading
+
+import oc_mailer.Mailer
+import oc_mailer.MailerPool
+import oc_mailer.Outbox
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+
+class BlockedSMTP(object):
+    def __init__(self):
+        self.release = threading.Event()
+        self.sent = list()
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self.release.wait()
+
+        if to_addrs == ["bad@example.com"]:
+            raise smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"No such user")})
+
+        self.sent.append((from_addr, to_addrs, msg))
+        return dict()
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+
+    def test_send_email__returns_at_once(self):
+        _smtp = BlockedSMTP()
+        _errors = list()
+        _outbox = oc_mailer.Outbox.Outbox(_smtp, maxsize=10, on_error=lambda _e, _m: _errors.append((_e, _m)))
+        _m = oc_mailer.Mailer.Mailer(_outbox, "from@plain.example.com", config_path=self._config_pth)
+        _m.send_email(["to-first@example.com", "to-second@example.com"], "Test subject", split=True, text="test")
+        _m.send_email("bad@example.com", "Test subject", text="test")
+
+        # nothing is sent while SMTP is blocked
+        self.assertFalse(_outbox.flush(timeout=0.05))
+        self.assertEqual([], _smtp.sent)
+        self.assertEqual(3, _outbox.stats()["unfinished"])
+
+        _smtp.release.set()
+        self.assertTrue(_outbox.flush(timeout=5))
+        self.assertEqual(["to-first@example.com", "to-second@example.com"], [_s[1] for _s in _smtp.sent])
+        self.assertEqual(1, len(_errors))
+        self.assertIsInstance(_errors[0][0], smtplib.SMTPRecipientsRefused)
+        self.assertEqual(("from@plain.example.com", ["bad@example.com"]), _errors[0][1][:2])
+
+        _stats = _outbox.stats()
+        self.assertEqual(0, _stats["depth"])
+        self.assertEqual(2, _stats["sent"])
+        self.assertEqual(1, _stats["failed"])
+        self.assertGreater(_stats["drain_rate"], 0)
+        self.assertTrue(_outbox.close())
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _m.send_email("to@example.com", "Test subject", text="test")
+
+    def test_full__drop(self):
+        _smtp = BlockedSMTP()
+        _errors = list()
+        _outbox = oc_mailer.Outbox.Outbox(_smtp, maxsize=2, on_full='drop',
+                on_error=lambda _e, _m: _errors.append(_e))
+
+        for _i in range(5):
+            _outbox.sendmail("from@example.com", ["to-%d@example.com" % _i], "Subject: test\n\ntest")
+
+        # one is taken by the worker, two are queued
+        self.assertGreaterEqual(_outbox.stats()["dropped"], 2)
+        self.assertEqual(_outbox.stats()["dropped"], len(_errors))
+        _smtp.release.set()
+        self.assertTrue(_outbox.close(timeout=5))
+        self.assertEqual(5, len(_smtp.sent) + _outbox.stats()["dropped"])
+
+    def test_full__block(self):
+        _smtp = BlockedSMTP()
+        _outbox = oc_mailer.Outbox.Outbox(_smtp, maxsize=1, put_timeout=0.05)
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            for _i in range(3):
+                _outbox.sendmail("from@example.com", ["to-%d@example.com" % _i], "Subject: test\n\ntest")
+
+        _smtp.release.set()
+        self.assertTrue(_outbox.close(timeout=5))
+        self.assertEqual(2, len(_smtp.sent))
+
+    def test_workers_with_pool(self):
+        with FakeSMTPServer() as _server:
+            _pool = oc_mailer.MailerPool.SMTPPool(lambda: smtplib.SMTP(*_server.address), size=3)
+
+            with oc_mailer.Outbox.Outbox(_pool, workers=3, maxsize=5) as _outbox:
+                _m = oc_mailer.Mailer.Mailer(_outbox, "from@example.com", render_once=True)
+                _m.send_email(["to-%d@example.com" % _i for _i in range(30)], "Test subject", split=True,
+                        text="test")
+
+            _pool.close()
+
+        self.assertEqual(30, len(_server.messages))
+        self.assertLessEqual(_server.connections, 3)
+
+    def test_arguments(self):
+        for _kwargs in [{"workers": 0}, {"maxsize": 0}, {"on_full": "wait"}]:
+            with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+                oc_mailer.Outbox.Outbox(BlockedSMTP(), **_kwargs)
@@ -0,0 +1,124 @@
+import unittest
+import unittest.mock
+
+import email
+import smtplib
+
+import oc_mailer.Mailer
+import oc_mailer.MailerPool
+import oc_mailer.Pipelining
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._server = FakeSMTPServer(refused={"bad@example.com": (550, "No such user")}).start()
+        self._smtp = smtplib.SMTP(*self._server.address)
+
+    def tearDown(self):
+        self._smtp.quit()
+        self._server.stop()
+
+    def test_max_recipients_invalid(self):
+        with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+            oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=0)
+
+    def test_chunks(self):
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(7)]
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=3)
+
+        with unittest.mock.patch.object(self._smtp, "send", wraps=self._smtp.send) as _send:
+            _results = _m.send_email(_to_addresses, "Test subject", text="test")
+
+        self.assertEqual([_to_addresses[0:3], _to_addresses[3:6], _to_addresses[6:]],
+                [_r.to_addresses for _r in _results])
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual(1, self._server.connections)
+        self.assertEqual([_r.to_addresses for _r in _results], [_m[1] for _m in self._server.messages])
+
+        # each chunk sees its own recipients only, the rest of messages is the same
+        _messages = [email.message_from_bytes(_m[2]) for _m in self._server.messages]
+        self.assertEqual([','.join(_r.to_addresses) for _r in _results], [_m["To"] for _m in _messages])
+        self.assertEqual(1, len(set(_m.get_payload()[0].get_payload() for _m in _messages)))
+
+        # MAIL and all RCPT of a chunk are sent at once
+        _pipelined = [_c.args[0] for _c in _send.call_args_list if "rcpt TO" in str(_c.args[0])]
+        self.assertEqual(3, len(_pipelined))
+        self.assertTrue(all(_p.startswith("mail FROM") for _p in _pipelined))
+        self.assertEqual(4, _pipelined[0].count("\r\n"))
+
+    def test_single_chunk(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=3)
+        _result, = _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", text="test")
+
+        self.assertEqual(["to-1@example.com", "to-2@example.com"], _result.to_addresses)
+        self.assertEqual(["to-1@example.com", "to-2@example.com"], self._server.messages[0][1])
+
+    def test_send_many(self):
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(5)]
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=2)
+
+        for _kwargs in [dict(), dict(render_processes=1)]:
+            self._server.messages.clear()
+            _results = list(_m.send_many([(_to_addresses, "Test subject", {"text": "test"}),
+                    ("to@example.com", "Test subject", {"text": "test"})], **_kwargs))
+
+            # the same transactions as of 'send_email'
+            self.assertEqual([_to_addresses[0:2], _to_addresses[2:4], _to_addresses[4:], ["to@example.com"]],
+                    [_r.to_addresses for _r in _results])
+            self.assertTrue(all(_r.ok for _r in _results))
+            self.assertEqual([_r.to_addresses for _r in _results], [_m[1] for _m in self._server.messages])
+
+    def test_group_by_domain(self):
+        _to_addresses = ["a1@a.example.com", "b1@b.example.com", "a2@A.example.com", "a3@a.example.com"]
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=2, group_by_domain=True)
+        _results = _m.send_email(_to_addresses, "Test subject", text="test")
+
+        self.assertEqual([["a1@a.example.com", "a2@A.example.com"], ["a3@a.example.com"], ["b1@b.example.com"]],
+                [_r.to_addresses for _r in _results])
+
+    def test_refused(self):
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=2)
+        _results = _m.send_email(["to-1@example.com", "bad@example.com", "to-2@example.com"],
+                "Test subject", text="test")
+
+        self.assertEqual({"bad@example.com": (550, b"No such user")}, _results[0].refused)
+        self.assertEqual(["to-1@example.com"], _results[0].accepted)
+        self.assertTrue(_results[1].ok)
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            _m.send_email(["bad@example.com", "bad@example.com", "to-3@example.com"], "Test subject", text="test")
+
+        # session is still usable
+        _m.send_email(["to-4@example.com"], "Test subject", text="test")
+        self.assertEqual(["to-4@example.com"], self._server.messages[-1][1])
+
+    def test_no_pipelining(self):
+        self._server.extensions.remove("PIPELINING")
+        self._smtp.ehlo()
+        _m = oc_mailer.Mailer.Mailer(self._smtp, "from@example.com", max_recipients=1)
+
+        with unittest.mock.patch.object(self._smtp, "sendmail", wraps=self._smtp.sendmail) as _sendmail:
+            _results = _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", text="test")
+
+        self.assertEqual(2, _sendmail.call_count)
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual(2, len(self._server.messages))
+
+    def test_pool(self):
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(8)]
+
+        with oc_mailer.MailerPool.SMTPPool(lambda: smtplib.SMTP(*self._server.address), size=4,
+                keepalive_interval=None) as _pool:
+            _m = oc_mailer.Mailer.Mailer(_pool, "from@example.com", max_recipients=2)
+            _results = _m.send_email(_to_addresses, "Test subject", text="test")
+
+        self.assertEqual([_to_addresses[_i:_i + 2] for _i in range(0, 8, 2)], [_r.to_addresses for _r in _results])
+        self.assertEqual(sorted(_to_addresses), sorted(_a for _m in self._server.messages for _a in _m[1]))
+        self.assertLessEqual(self._server.connections, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
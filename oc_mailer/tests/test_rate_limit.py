@@ -0,0 +1,214 @@
+import unittest
+
+import asyncio
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+
+import oc_mailer.AsyncMailer
+import oc_mailer.Mailer
+import oc_mailer.Retry
+from oc_mailer.RateLimit import RateLimiter, RateLimitedSMTP, TokenBucket
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+
+class _SMTP(object):
+    def __init__(self, refused=None, errors=()):
+        self.sent = list()
+        self.refused = refused or dict()
+        self.errors = list(errors)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.sent.append((time.monotonic(), to_addrs))
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return {_a: _r for _a, _r in self.refused.items() if _a in to_addrs}
+
+
+class _AsyncSMTP(_SMTP):
+    async def sendmail(self, from_addr, to_addrs, msg):
+        return _SMTP.sendmail(self, from_addr, to_addrs, msg)
+
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
+    def test_token_bucket(self):
+        _bucket = TokenBucket(rate=10, burst=2)
+
+        self.assertEqual([0.0, 0.0], [_bucket.reserve(), _bucket.reserve()])
+        # reservations go into debt, so waiting callers are served one after another
+        self.assertAlmostEqual(0.1, _bucket.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, _bucket.reserve(), delta=0.01)
+
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_adaptive(self):
+        _bucket = TokenBucket(rate=10, backoff=0.5, recovery=0.25, min_factor=0.2)
+        _bucket.throttled()
+        # replies of messages in flight do not cut the rate again
+        _bucket.throttled()
+        self.assertEqual(5.0, _bucket.rate)
+        self.assertGreater(_bucket.reserve(), 0)
+
+        _bucket.succeeded()
+        self.assertEqual(7.5, _bucket.rate)
+        _bucket.succeeded()
+        _bucket.succeeded()
+        self.assertEqual(10.0, _bucket.rate)
+
+        for _i in range(5):
+            _bucket.throttled()
+            # as if a second passed since the previous cut
+            _bucket._TokenBucket__backed_off -= TokenBucket.BACKOFF_INTERVAL
+
+        self.assertAlmostEqual(2.0, _bucket.rate)
+
+    def test_domains(self):
+        _limiter = RateLimiter(rate=100, domains={"Slow.Example.com": {"rate": 10, "burst": 1}})
+
+        self.assertEqual(0.0, _limiter.reserve(["to-1@slow.example.com", "to-2@slow.example.com"]))
+        self.assertAlmostEqual(0.1, _limiter.reserve("to@SLOW.example.com"), delta=0.01)
+        self.assertEqual(0.0, _limiter.reserve("to@example.com"))
+        self.assertIsNone(RateLimiter(domains={"example.com": {"rate": 1}}).rate())
+
+        # temporary failures of recipients cut the rate of their domain only
+        _limiter.report(["to@slow.example.com", "to@example.com"],
+                refused={"to@slow.example.com": (451, b"Too many messages")})
+        self.assertEqual(5.0, _limiter.rate("slow.example.com"))
+        self.assertEqual(100.0, _limiter.rate())
+
+        # temporary failures of the whole message cut the global rate
+        _limiter.report("to@example.com", error=smtplib.SMTPSenderRefused(421, b"Try later", "from@example.com"))
+        self.assertEqual(50.0, _limiter.rate())
+        _limiter.report("to@slow.example.com")
+        self.assertAlmostEqual(55.0, _limiter.rate())
+        self.assertAlmostEqual(5.5, _limiter.rate("slow.example.com"))
+
+        # permanent failures do not
+        _limiter = RateLimiter(rate=100)
+        _limiter.report("to@example.com", error=smtplib.SMTPRecipientsRefused({"to@example.com": (550, b"No")}))
+        _limiter.report("to@example.com", error=smtplib.SMTPDataError(554, b"Rejected"))
+        self.assertEqual(100.0, _limiter.rate())
+
+    @unittest.skipIf(aiosmtplib is None, "aiosmtplib is not installed")
+    def test_aiosmtplib_errors(self):
+        _limiter = RateLimiter(rate=100, domains={"slow.example.com": {"rate": 10}})
+        _limiter.report("to@slow.example.com", error=aiosmtplib.SMTPRecipientsRefused([
+                aiosmtplib.SMTPRecipientRefused(451, "Too many messages", "to@slow.example.com")]))
+        self.assertEqual(5.0, _limiter.rate("slow.example.com"))
+        self.assertEqual(100.0, _limiter.rate())
+
+        _limiter.report("to@example.com", error=aiosmtplib.SMTPSenderRefused(421, "Try later", "from@example.com"))
+        self.assertEqual(50.0, _limiter.rate())
+
+        for _error in [aiosmtplib.SMTPServerDisconnected("Connection lost"),
+                aiosmtplib.SMTPDataError(554, "Rejected")]:
+            _limiter = RateLimiter(rate=100)
+            _limiter.report("to@example.com", error=_error)
+            self.assertEqual(50.0 if isinstance(_error, ConnectionError) else 100.0, _limiter.rate())
+
+    def test_mailer(self):
+        _smtp = _SMTP(refused={"to-0@example.com": (450, b"Slow down")})
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", rate_limiter=RateLimiter(rate=20, burst=1))
+        _started = time.monotonic()
+        _results = _m.send_email(["to-%d@example.com" % _i for _i in range(4)], "Test subject", split=True,
+                text="test")
+
+        self.assertEqual(4, len(_results))
+        # the first message goes at once and cuts the rate to 10 messages per second
+        self.assertGreaterEqual(time.monotonic() - _started, 0.25)
+        self.assertAlmostEqual(10.0 + 3 * 20 * 0.05, _m.rate_limiter.rate(), delta=0.01)
+
+    def test_retry(self):
+        _smtp = _SMTP(errors=[smtplib.SMTPServerDisconnected()])
+        _limiter = RateLimiter(rate=10, burst=1)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", rate_limiter=_limiter,
+                retry=oc_mailer.Retry.RetryPolicy(attempts=2, base_delay=0, jitter=0))
+        _result, = _m.send_email("to@example.com", "Test subject", text="test")
+
+        self.assertTrue(_result.ok)
+        # the attempt after lost connection waits for the limiter with the rate cut
+        self.assertGreaterEqual(_smtp.sent[1][0] - _smtp.sent[0][0], 0.15)
+
+    def test_config(self):
+        _directory = tempfile.mkdtemp()
+
+        try:
+            _config_path = os.path.join(_directory, "config.json")
+
+            with open(_config_path, mode="wt") as _f:
+                json.dump({
+                        "example.com": {"rate_limit": {"rate": 5, "domains": {"example.org": {"rate": 1}}}},
+                        "": {}}, _f)
+
+            _first = oc_mailer.Mailer.Mailer(_SMTP(), "first@example.com", config_path=_config_path)
+            _second = oc_mailer.Mailer.Mailer(_SMTP(), "second@example.com", config_path=_config_path)
+            _other = oc_mailer.Mailer.Mailer(_SMTP(), "from@other.example.com", config_path=_config_path)
+            _own = RateLimiter(rate=1)
+
+            # Mailers of the profile share the limiter
+            self.assertIs(_first.rate_limiter, _second.rate_limiter)
+            self.assertEqual(5.0, _first.rate_limiter.rate())
+            self.assertEqual(1.0, _first.rate_limiter.rate("example.org"))
+            self.assertIsNone(_other.rate_limiter)
+            self.assertIs(_own, oc_mailer.Mailer.Mailer(_SMTP(), "from@example.com", config_path=_config_path,
+                    rate_limiter=_own).rate_limiter)
+        finally:
+            shutil.rmtree(_directory)
+
+    def test_async(self):
+        _smtp = _AsyncSMTP(refused={"to-0@example.com": (421, b"Slow down")})
+        _m = oc_mailer.AsyncMailer.AsyncMailer(_smtp, "from@example.com", rate_limiter=RateLimiter(rate=20, burst=1))
+        _loop = asyncio.new_event_loop()
+        _ticks = list()
+
+        async def _tick():
+            for _i in range(10):
+                _ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def _send():
+            return (await asyncio.gather(_m.send_email(["to-%d@example.com" % _i for _i in range(3)],
+                    "Test subject", split=True, text="test"), _tick()))[0]
+
+        try:
+            _started = time.monotonic()
+            _results = _loop.run_until_complete(_send())
+        finally:
+            _loop.close()
+
+        self.assertEqual(3, len(_results))
+        # messages are sent concurrently one after another at 20 messages per second
+        self.assertGreaterEqual(_smtp.sent[-1][0] - _started, 0.09)
+        self.assertAlmostEqual(10.0 + 2 * 20 * 0.05, _m.mailer.rate_limiter.rate())
+        # the event loop is not blocked while waiting
+        self.assertEqual(10, len(_ticks))
+        self.assertLess(_ticks[2] - _started, 0.09)
+
+    def test_adapter(self):
+        _smtp = _SMTP(errors=[smtplib.SMTPServerDisconnected()])
+        _limiter = RateLimiter(rate=100)
+
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            RateLimitedSMTP(_smtp, _limiter).sendmail("from@example.com", ["to@example.com"], "message")
+
+        self.assertEqual(50.0, _limiter.rate())
+        self.assertEqual({}, RateLimitedSMTP(_smtp, _limiter).sendmail("from@example.com", ["to@example.com"],
+                "message"))
+
+
+if __name__ == "__main__":
+    unittest.main()
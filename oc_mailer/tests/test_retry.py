@@ -0,0 +1,128 @@
+import unittest
+import unittest.mock
+
+import smtplib
+
+import oc_mailer.Mailer
+import oc_mailer.Retry
+
+
+class ScriptedSMTP(object):
+    """
+    Replies to each recipient by the next code of its script, 250 if the script is over
+    """
+
+    def __init__(self, scripts, errors=None):
+        self.scripts = {_a: list(_s) for _a, _s in scripts.items()}
+        self.errors = list(errors or [])
+        self.calls = list()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.calls.append((from_addr, to_addrs, msg))
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        _refused = dict()
+
+        for _address in (to_addrs if isinstance(to_addrs, list) else [to_addrs]):
+            _script = self.scripts.get(_address)
+
+            if _script:
+                _code = _script.pop(0)
+
+                if _code != 250:
+                    _refused[_address] = (_code, b"reply %d" % _code)
+
+        if len(_refused) == len(to_addrs if isinstance(to_addrs, list) else [to_addrs]):
+            raise smtplib.SMTPRecipientsRefused(_refused)
+
+        return _refused
+
+
+@unittest.mock.patch("oc_mailer.Retry.time.sleep")
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
+    def test_only_refused_retried(self, msleep):
+        _to_addresses = ["to-%d@example.com" % _i for _i in range(5)]
+        _smtp = ScriptedSMTP({
+            "to-1@example.com": [451, 451],
+            "to-2@example.com": [550],
+            "to-3@example.com": [452, 452, 452]})
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com",
+                retry=oc_mailer.Retry.RetryPolicy(attempts=3, base_delay=1, jitter=0))
+        _result, = _m.send_email(_to_addresses, "Test subject", text="test")
+
+        self.assertEqual([_to_addresses, ["to-1@example.com", "to-3@example.com"],
+            ["to-1@example.com", "to-3@example.com"]], [_c[1] for _c in _smtp.calls])
+        # the same rendered message is sent
+        self.assertEqual(1, len(set(_c[2] for _c in _smtp.calls)))
+        self.assertEqual([unittest.mock.call(1), unittest.mock.call(2)], msleep.call_args_list)
+
+        self.assertEqual(3, _result.attempts)
+        self.assertEqual(["to-0@example.com", "to-1@example.com", "to-4@example.com"], _result.accepted)
+        self.assertEqual({"to-2@example.com": (550, b"reply 550"), "to-3@example.com": (452, b"reply 452")},
+                _result.refused)
+        self.assertFalse(_result.ok)
+
+    def test_split(self, msleep):
+        _smtp = ScriptedSMTP({"to-1@example.com": [421]})
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", retry=oc_mailer.Retry.RetryPolicy())
+        _results = _m.send_email(["to-0@example.com", "to-1@example.com"], "Test subject", split=True, text="test")
+
+        self.assertEqual(["to-0@example.com", "to-1@example.com", ["to-1@example.com"]],
+                [_c[1] for _c in _smtp.calls])
+        self.assertTrue(all(_r.ok for _r in _results))
+        self.assertEqual([1, 2], [_r.attempts for _r in _results])
+
+    def test_message_errors(self, msleep):
+        # temporary errors of the whole message are retried
+        _smtp = ScriptedSMTP({}, errors=[smtplib.SMTPServerDisconnected("lost"),
+            smtplib.SMTPDataError(451, b"Try later")])
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", retry=oc_mailer.Retry.RetryPolicy(attempts=3))
+        _result, = _m.send_email("to@example.com", "Test subject", text="test")
+        self.assertTrue(_result.ok)
+        self.assertEqual(3, _result.attempts)
+
+        # permanent ones are not
+        _smtp = ScriptedSMTP({}, errors=[smtplib.SMTPSenderRefused(553, b"Bad sender", "from@example.com")])
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", retry=oc_mailer.Retry.RetryPolicy(attempts=3))
+
+        with self.assertRaises(smtplib.SMTPSenderRefused):
+            _m.send_email("to@example.com", "Test subject", text="test")
+
+        self.assertEqual(1, len(_smtp.calls))
+
+        # temporary ones are raised when attempts are exhausted
+        _smtp = ScriptedSMTP({}, errors=[smtplib.SMTPDataError(451, b"Try later")] * 2)
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com", retry=oc_mailer.Retry.RetryPolicy(attempts=2))
+
+        with self.assertRaises(smtplib.SMTPDataError):
+            _m.send_email("to@example.com", "Test subject", text="test")
+
+    def test_without_retry(self, msleep):
+        _smtp = ScriptedSMTP({"to-1@example.com": [451, 451]})
+        _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com")
+        _result, = _m.send_email(["to-0@example.com", "to-1@example.com"], "Test subject", text="test")
+        self.assertEqual(["to-0@example.com"], _result.accepted)
+        self.assertEqual({"to-1@example.com": (451, b"reply 451")}, _result.refused)
+
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            _m.send_email("to-1@example.com", "Test subject", text="test")
+
+        msleep.assert_not_called()
+
+    def test_delay(self, msleep):
+        _policy = oc_mailer.Retry.RetryPolicy(base_delay=1, max_delay=5, jitter=0.5)
+
+        for _retry, _max in enumerate([1, 2, 4, 5, 5]):
+            _delay = _policy.delay(_retry)
+            self.assertLessEqual(_delay, _max)
+            self.assertGreaterEqual(_delay, _max / 2)
+
+        for _kwargs in [{"attempts": 0}, {"jitter": 2}]:
+            with self.assertRaises(oc_mailer.Mailer.MailerArgumentError):
+                oc_mailer.Retry.RetryPolicy(**_kwargs)
@@ -0,0 +1,188 @@
+import unittest
+import unittest.mock
+
+import os
+import shutil
+import smtplib
+import subprocess
+import sys
+import tempfile
+import time
+
+import oc_mailer.Mailer
+import oc_mailer.Spool
+from oc_mailer.tests.smtp_server import FakeSMTPServer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RecordingSMTP(object):
+    def __init__(self, fail=None):
+        self.sent = list()
+        self.fail = dict(fail or {})
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        _error = self.fail.get(to_addrs[0] if isinstance(to_addrs, list) else to_addrs)
+
+        if _error:
+            raise _error
+
+        self.sent.append((from_addr, to_addrs, msg))
+        return dict()
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._config_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+        self._tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmp)
+
+    def _segments(self):
+        return sorted(_fn for _fn in os.listdir(self._tmp) if _fn.endswith(".seg"))
+
+    def test_send_email__delivered_on_drain(self):
+        with FakeSMTPServer() as _server:
+            _smtp = smtplib.SMTP(*_server.address)
+            _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, batch_size=2)
+            _m = oc_mailer.Mailer.Mailer(_spool, "from@html.example.com", config_path=self._config_pth)
+            _m.send_email(["to-%d@example.com" % _i for _i in range(5)], "Test subject", split=True, text="test")
+            self.assertEqual([], _server.messages)
+            self.assertEqual(5, _spool.pending())
+
+            self.assertEqual(5, _spool.drain())
+            self.assertEqual(0, _spool.pending())
+            self.assertEqual(0, _spool.drain())
+            _spool.close()
+            _smtp.quit()
+
+        self.assertEqual(["to-%d@example.com" % _i for _i in range(5)], [_m[1][0] for _m in _server.messages])
+        self.assertTrue(all(b"Content-ID: <signature_image>" in _m[2] for _m in _server.messages))
+
+    def test_replay_after_crash(self):
+        # the process dies right after sending with default settings, before any fsync or close
+        _process = subprocess.run([sys.executable, "-c", "\n".join([
+                "import os, sys, oc_mailer.Mailer, oc_mailer.Spool",
+                "_spool = oc_mailer.Spool.Spool(sys.argv[1], object())",
+                "_m = oc_mailer.Mailer.Mailer(_spool, 'from@plain.example.com', config_path=sys.argv[2])",
+                "_m.send_email(['to-%d@example.com' % _i for _i in range(5)], 'Test subject', split=True,"
+                " text='test')",
+                "_spool.sendmail('from@example.com', ['to-bytes@example.com'],"
+                " b'Subject: bytes\\r\\n\\r\\n\\xd1\\x82\\r\\n')",
+                "os._exit(1)"]), self._tmp, self._config_pth], cwd=_ROOT)
+        self.assertEqual(1, _process.returncode)
+
+        # incomplete record written partially
+        with open(os.path.join(self._tmp, self._segments()[-1]), mode='ab') as _f:
+            _f.write(b"\x00\x00\x00\x10\x00\x00")
+
+        _recovered = RecordingSMTP()
+        _spool = oc_mailer.Spool.Spool(self._tmp, _recovered)
+        self.assertEqual(2, len(self._segments()))
+        self.assertEqual(6, _spool.pending())
+        self.assertEqual(6, _spool.drain())
+        _spool.close()
+
+        self.assertEqual(["to-%d@example.com" % _i for _i in range(5)] + [["to-bytes@example.com"]],
+                [_s[1] for _s in _recovered.sent])
+        self.assertIsInstance(_recovered.sent[0][2], str)
+        self.assertIn("To: to-0@example.com\n", _recovered.sent[0][2])
+        self.assertEqual(b"Subject: bytes\r\n\r\n\xd1\x82\r\n", _recovered.sent[5][2])
+        # delivered segments are removed
+        self.assertEqual(1, len(self._segments()))
+
+    def test_fsync_interval(self):
+        _spool = oc_mailer.Spool.Spool(self._tmp, RecordingSMTP(), fsync_interval=0.05)
+
+        with unittest.mock.patch("oc_mailer.Spool.os.fsync") as _fsync:
+            _spool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+            _fsync.assert_not_called()
+
+            # synced by the timer without waiting for the next message
+            for _i in range(100):
+                if _fsync.called:
+                    break
+
+                time.sleep(0.01)
+
+            self.assertEqual(1, _fsync.call_count)
+
+        _spool.close()
+
+    def test_temporary_error__retried(self):
+        _smtp = RecordingSMTP(fail={
+            "to-2@example.com": smtplib.SMTPResponseException(451, b"Try again later"),
+            "to-4@example.com": smtplib.SMTPResponseException(554, b"Rejected")})
+        _errors = list()
+        _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, batch_size=1, on_error=lambda _e, _m: _errors.append(_m))
+
+        for _i in range(6):
+            _spool.sendmail("from@example.com", "to-%d@example.com" % _i, "Subject: test\n\ntest %d" % _i)
+
+        self.assertEqual(2, _spool.drain())
+        self.assertEqual(4, _spool.pending())
+
+        # the position survives restart
+        _spool.close(drain=False)
+        del(_smtp.fail["to-2@example.com"])
+        _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, on_error=lambda _e, _m: _errors.append(_m))
+        self.assertEqual(4, _spool.drain())
+        _spool.close()
+
+        self.assertEqual(["to-%d@example.com" % _i for _i in (0, 1, 2, 3, 5)], [_s[1] for _s in _smtp.sent])
+        self.assertEqual([("from@example.com", "to-4@example.com", "Subject: test\n\ntest 4")], _errors)
+
+    def test_segments_rotated_and_compacted(self):
+        _smtp = RecordingSMTP()
+        _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, segment_size=100)
+
+        for _i in range(5):
+            _spool.sendmail("from@example.com", ["to-%d@example.com" % _i], "Subject: test\n\n" + "x" * 100)
+
+        self.assertEqual(6, len(self._segments()))
+        self.assertEqual(5, _spool.drain())
+        self.assertEqual(1, len(self._segments()))
+        _spool.close()
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _spool.sendmail("from@example.com", ["to@example.com"], "Subject: test\n\ntest")
+
+    def test_appended_while_draining(self):
+        _smtp = RecordingSMTP()
+        _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, segment_size=1000)
+        _spool.sendmail("from@example.com", ["to-0@example.com"], "Subject: test\n\ntest")
+        _read_records = _spool._Spool__read_records
+
+        def _appending(*args):
+            for _record in _read_records(*args):
+                yield _record
+                # appended and rotated after the segment was read as active
+                _spool.sendmail("from@example.com", ["to-1@example.com"], "Subject: test\n\n" + "x" * 1000)
+
+        with unittest.mock.patch.object(_spool, "_Spool__read_records", _appending):
+            self.assertEqual(1, _spool.drain())
+
+        self.assertEqual(1, _spool.pending())
+        self.assertEqual(1, _spool.drain())
+        _spool.close()
+
+        self.assertEqual([["to-0@example.com"], ["to-1@example.com"]], [_s[1] for _s in _smtp.sent])
+
+    def test_background_drain(self):
+        _smtp = RecordingSMTP()
+        _spool = oc_mailer.Spool.Spool(self._tmp, _smtp, fsync_every=2, drain_interval=10)
+
+        for _i in range(4):
+            _spool.sendmail("from@example.com", ["to-%d@example.com" % _i], "Subject: test\n\ntest")
+
+        for _i in range(100):
+            if len(_smtp.sent) == 4:
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual(4, len(_smtp.sent))
+        _spool.close()
@@ -0,0 +1,88 @@
+import unittest
+import unittest.mock
+
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+
+import oc_mailer.Mailer
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _imported_modules(code):
+    """
+    Run code in a fresh interpreter
+
+    :param str code: code to run after importing oc_mailer.Mailer
+    :return set: names of modules imported
+    """
+    _output = subprocess.run([sys.executable, "-c", "import sys, oc_mailer.Mailer\n%s\nprint(' '.join(sys.modules))"
+            % code], cwd=_ROOT, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    return set(_output.split())
+
+
+class _SMTP(object):
+    def __init__(self):
+        self.messages = list()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.messages.append(msg)
+        return dict()
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+
+    def test_lazy_imports(self):
+        _slow = {"pkg_resources", "asyncio", "multiprocessing", "email.mime.text", "email.mime.multipart",
+                "email.mime.image", "email.mime.base", "mailbox", "oc_mailer.Transports"}
+        self.assertEqual(set(), _slow & _imported_modules(""))
+        self.assertEqual(set(), _slow & _imported_modules("oc_mailer.Mailer.Mailer(object(), 'from@example.com')"))
+
+        # email.mime is imported on first rendering or attribute access
+        _modules = _imported_modules("print(list(oc_mailer.Mailer.Mailer(object(), 'from@example.com').render_email("
+                "'to@example.com', 'Test subject', text='test')))")
+        self.assertIn("email.mime.text", _modules)
+        self.assertIn("email.mime.multipart", _modules)
+        self.assertIn("email.mime.text", _imported_modules("oc_mailer.Mailer.MIMEText"))
+
+    def test_import_time(self):
+        _spec = importlib.util.spec_from_file_location("check_import_time",
+                os.path.join(_ROOT, "benchmarks", "check_import_time.py"))
+        _check = importlib.util.module_from_spec(_spec)
+        _spec.loader.exec_module(_check)
+        _output = io.StringIO()
+
+        with contextlib.redirect_stdout(_output):
+            _status = _check.main([])
+
+        self.assertEqual(0, _status, _output.getvalue())
+
+    def test_default_config(self):
+        _smtp = _SMTP()
+
+        with unittest.mock.patch("builtins.open") as _open, unittest.mock.patch("oc_mailer.Mailer.os.stat") as _stat:
+            _m = oc_mailer.Mailer.Mailer(_smtp, "from@example.com")
+
+        _open.assert_not_called()
+        _stat.assert_not_called()
+        _m.send_email("to@example.com", "Test subject", text="test text")
+        self.assertIn("Content-Type: text/plain", _smtp.messages[0])
+
+        # the embedded configuration is the packaged one
+        with open(oc_mailer.Mailer.default_config_path(), mode="rt") as _f:
+            self.assertEqual(json.load(_f), oc_mailer.Mailer.DEFAULT_CONFIG)
+
+        self.assertEqual(os.path.join(_ROOT, "oc_mailer", "resources", "config.json"),
+                oc_mailer.Mailer.default_config_path())
+
+
+if __name__ == "__main__":
+    unittest.main()
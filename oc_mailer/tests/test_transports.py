@@ -0,0 +1,177 @@
+import unittest
+
+import email
+import mailbox
+import os
+import re
+import shutil
+import tempfile
+
+import oc_mailer.Mailer
+import oc_mailer.Transports
+from oc_mailer.Transports import MaildirTransport, MboxTransport, MemoryTransport, PickupDirectoryTransport
+
+_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "config.json")
+_TEXT = "Релиз опубликован"
+
+
+def _text(message):
+    _part = [_p for _p in message.walk() if _p.get_content_maintype() == "text"][0]
+    return _part.get_payload(decode=True).decode("utf-8")
+
+
+def _boundless(msg):
+    return re.sub(r"=+\d+==", "", msg)
+
+
+class TestTransports(unittest.TestCase):
+    def setUp(self):
+        oc_mailer.Mailer.profile_cache.invalidate()
+        oc_mailer.Mailer.signature_images.clear()
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _files(self, directory):
+        return sorted(_n for _n in os.listdir(directory) if not _n.startswith("."))
+
+    def test_memory(self):
+        _transport = MemoryTransport()
+        _m = oc_mailer.Mailer.Mailer(_transport, "from@html.example.com", config_path=_CONFIG_PATH)
+        _results = _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", split=True, text=_TEXT)
+
+        self.assertTrue(all(_r.ok for _r in _results))
+        _rendered = list(_m.render_email(["to-1@example.com", "to-2@example.com"], "Test subject", split=True,
+                text=_TEXT))
+        # the same rendering path as for SMTP, up to MIME boundaries
+        self.assertEqual([("from@html.example.com", _to, _boundless(_msg)) for _to, _msg in _rendered],
+                [(_from, _to, _boundless(_msg)) for _from, _to, _msg in _transport.messages])
+        self.assertEqual(2, _transport.stats()["messages"])
+
+        # messages are kept as they are passed
+        _message = b"Subject: test\r\n\r\ntest"
+        _transport.sendmail("from@example.com", "to@example.com", _message)
+        self.assertIs(_message, _transport.messages[-1][2])
+        _counter = MemoryTransport(keep=False)
+        _counter.sendmail("from@example.com", "to@example.com", _message)
+        self.assertEqual({"messages": 1, "bytes": len(_message)}, _counter.stats())
+        self.assertEqual([], _counter.messages)
+        _transport.clear()
+        self.assertEqual({"messages": 0, "bytes": 0}, _transport.stats())
+
+    def test_pickup_directory(self):
+        _pickup = os.path.join(self._directory, "pickup")
+
+        with PickupDirectoryTransport(_pickup, batch_size=2, fsync=True) as _transport:
+            _m = oc_mailer.Mailer.Mailer(_transport, "from@example.com", eight_bit=True)
+            _m.send_email(["to-1@example.com", "to-2@example.com"], "Test subject", text=_TEXT)
+            # buffered until the batch is full
+            self.assertEqual([], self._files(_pickup))
+            _m.send_email("to-3@example.com", "Test subject", text=_TEXT)
+            self.assertEqual(2, len(self._files(_pickup)))
+            _m.send_email("to-4@example.com", "Test subject", text=_TEXT)
+
+        _names = self._files(_pickup)
+        self.assertEqual(3, len(_names))
+        self.assertTrue(all(_n.endswith(".eml") for _n in _names))
+        self.assertEqual([], os.listdir(os.path.join(_pickup, ".oc-mailer-tmp")))
+        _envelopes = list()
+
+        for _name in _names:
+            with open(os.path.join(_pickup, _name), mode="rb") as _f:
+                _data = _f.read()
+
+            self.assertNotIn(b"\n", _data.replace(b"\r\n", b""))
+            _message = email.message_from_bytes(_data)
+            _envelopes.append((_message["X-Sender"], _message.get_all("X-Receiver")))
+            # 8bit bodies are written as they are
+            self.assertIn(_TEXT.encode("utf-8"), _data)
+            self.assertEqual(_TEXT, _text(_message))
+
+        self.assertEqual(sorted([("<from@example.com>", ["<to-1@example.com>", "<to-2@example.com>"]),
+                ("<from@example.com>", ["<to-3@example.com>"]), ("<from@example.com>", ["<to-4@example.com>"])]),
+                sorted(_envelopes))
+
+        with self.assertRaises(oc_mailer.Mailer.MailerError):
+            _m.send_email("to@example.com", "Test subject", text=_TEXT)
+
+    def test_maildir(self):
+        _path = os.path.join(self._directory, "Maildir")
+        _attachment = os.path.join(self._directory, "report.txt")
+
+        with open(_attachment, mode="wb") as _f:
+            _f.write(b"report\n" * 1000)
+
+        with MaildirTransport(_path, batch_size=10) as _transport:
+            _m = oc_mailer.Mailer.Mailer(_transport, "from@html.example.com", config_path=_CONFIG_PATH)
+            _m.send_email("to@example.com", "Test subject", attachments=[_attachment], text=_TEXT)
+            _m.send_email("to@example.com", "Test subject", text="second")
+
+        _messages = sorted(mailbox.Maildir(_path, create=False), key=lambda _m: len(_m.as_bytes()))
+        self.assertEqual(2, len(_messages))
+        self.assertEqual("<from@html.example.com>", _messages[0]["Return-Path"])
+        self.assertIn("second", _text(_messages[0]))
+        # attachments are streamed into the file
+        self.assertEqual(b"report\n" * 1000, _messages[1].get_payload()[1].get_payload(decode=True))
+        self.assertEqual([], os.listdir(os.path.join(_path, "tmp")))
+
+    def test_mbox(self):
+        _path = os.path.join(self._directory, "mbox")
+
+        with MboxTransport(_path, batch_size=1) as _transport:
+            _m = oc_mailer.Mailer.Mailer(_transport, "from@example.com", template="${text}")
+            _m.send_email("to-1@example.com", "Test subject", text="From the start")
+            _m.send_email("to-2@example.com", "Test subject", text=_TEXT)
+
+        _mbox = mailbox.mbox(_path, create=False)
+        _messages = list(_mbox)
+        _mbox.close()
+
+        self.assertEqual(["to-1@example.com", "to-2@example.com"], [_m["To"] for _m in _messages])
+        self.assertTrue(all(_m.get_from().startswith("from@example.com ") for _m in _messages))
+        self.assertEqual(["From the start", _TEXT], [_text(_m) for _m in _messages])
+
+    def test_attachment_written_at_once(self):
+        _pickup = os.path.join(self._directory, "pickup")
+
+        with PickupDirectoryTransport(_pickup, batch_size=10, envelope=False) as _transport:
+            _m = oc_mailer.Mailer.Mailer(_transport, "from@example.com")
+            _m.send_email("to-1@example.com", "Test subject", text="first")
+
+            with tempfile.NamedTemporaryFile(dir=self._directory) as _f:
+                _f.write(b"report\n" * 1000)
+                _f.flush()
+                _m.send_email("to-2@example.com", "Test subject", attachments=[_f.name], text="second")
+
+            # the file is gone, the message is written before the call returns after the buffered one
+            self.assertEqual(2, len(self._files(_pickup)))
+
+        _recipients = list()
+
+        for _name in self._files(_pickup):
+            with open(os.path.join(_pickup, _name), mode="rb") as _f:
+                _recipients.append(email.message_from_bytes(_f.read())["To"])
+
+        self.assertEqual(["to-1@example.com", "to-2@example.com"], sorted(_recipients))
+
+    def test_failed_message__batch_written(self):
+        _errors = list()
+
+        with MaildirTransport(os.path.join(self._directory, "Maildir"), batch_size=3,
+                on_error=lambda _e, _m: _errors.append((type(_e), _m[1]))) as _transport:
+            _transport.sendmail("from@example.com", "to-1@example.com", "Subject: first\n\nfirst")
+            _transport.sendmail("from@example.com", "to-2@example.com", None)
+            _transport.sendmail("from@example.com", "to-3@example.com", "Subject: third\n\nthird")
+
+        _mailbox = mailbox.Maildir(os.path.join(self._directory, "Maildir"), create=False)
+        self.assertEqual(["first", "third"], sorted(_m["Subject"] for _m in _mailbox))
+        self.assertEqual([(TypeError, ["to-2@example.com"])], _errors)
+
+    def test_message_chunks(self):
+        self.assertEqual([b"a\r\nb\r\nc\r\n"], oc_mailer.Transports.message_chunks("a\nb\r\nc\r"))
+        self.assertEqual([b"a\r\nb"], oc_mailer.Transports.message_chunks(b"a\nb"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,8 +23,10 @@ spec = {
     "long_description_content_type": "text/plain",
     "packages": ["oc_mailer"],
     "install_requires": [],
+    # asynchronous SMTP client for AsyncMailer, its tests are skipped without it
+    "extras_require": {"async": ["aiosmtplib"]},
     "package_data": {"oc_mailer": list_recursive("oc_mailer", "resources")},
-    "python_requires": ">=3.6",
+    "python_requires": ">=3.7",
 }
 
 setup(**spec)